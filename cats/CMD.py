@@ -7,20 +7,25 @@ Created on Wed Nov  2 11:22:24 2022
 """
 
 import sys
+import warnings
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy
 from astropy.coordinates import SkyCoord
-from isochrones.mist import MIST_Isochrone
 from matplotlib.patches import PathPatch
-from scipy.interpolate import InterpolatedUnivariateSpline, interp1d
+from scipy.fft import irfft, irfft2, next_fast_len, rfft, rfft2
+from scipy.interpolate import interp1d
+from scipy.ndimage import maximum_filter
 from scipy.signal import correlate2d
-from ugali.analysis.isochrone import factory as isochrone_factory
 
 sys.path.append("../")
+from cats.distance import get_distance_track
+from cats.error_model import BinnedErrorModel
+from cats.healpix import get_healpix_index
 from cats.inputs import stream_inputs as inputs
+from cats.isochrone_cache import sample_isochrone
 from cats.pawprint.pawprint import Footprint2D, Pawprint
 
 plt.rc(
@@ -41,6 +46,61 @@ plt.rc(
 )
 
 
+# padded FFT shapes, by the shape of the full correlation
+_fft_shapes = {}
+
+
+def _fft_correlate2d(in1, in2):
+    """
+    Full 2D cross-correlation of real arrays, the same as
+    `scipy.signal.correlate2d(in1, in2)` but computed with real FFTs that are
+    zero-padded to fast sizes.
+    """
+    shape = tuple(n1 + n2 - 1 for n1, n2 in zip(in1.shape, in2.shape))
+    if shape not in _fft_shapes:
+        _fft_shapes[shape] = tuple(next_fast_len(n, real=True) for n in shape)
+    fshape = _fft_shapes[shape]
+
+    ccor = irfft2(rfft2(in1, fshape) * rfft2(in2[::-1, ::-1], fshape), fshape)
+    return ccor[: shape[0], : shape[1]]
+
+
+def _subpixel_peak(a, peak=None):
+    """
+    Position of the maximum of a 2D array (or of the local maximum at ``peak``),
+    refined along each axis by the vertex of the parabola through the maximum and
+    its two neighbours.
+    """
+    if peak is None:
+        peak = np.unravel_index(np.argmax(a), a.shape)
+    peak = tuple(int(i) for i in peak)
+    refined = []
+    for axis, i in enumerate(peak):
+        offset = 0.0
+        if 0 < i < a.shape[axis] - 1:
+            lo, hi = list(peak), list(peak)
+            lo[axis] -= 1
+            hi[axis] += 1
+            a_lo, a_0, a_hi = a[tuple(lo)], a[peak], a[tuple(hi)]
+            curvature = a_lo - 2 * a_0 + a_hi
+            if curvature < 0:
+                offset = 0.5 * (a_lo - a_hi) / curvature
+        refined.append(i + offset)
+    return tuple(refined)
+
+
+def _peak_confidence(values, peak_value):
+    """
+    Height of a correlation peak above the mean of the correlation, in units of
+    its standard deviation. A shift that matches the background instead of the
+    stream gives a low value.
+    """
+    std = np.std(values)
+    if std == 0:
+        return 0.0
+    return (peak_value - np.mean(values)) / std
+
+
 class Isochrone:
     def __init__(self, stream, cat, pawprint):
         """
@@ -67,18 +127,9 @@ class Isochrone:
         self.dist_mod = 5 * np.log10(1000 * self.distance) - 5
 
         self.pawprint = pawprint
-        track = self.pawprint.track.track.transform_to(self.pawprint.track.stream_frame)
-
-        if self.stream == "GD-1":
-            distmod_spl = np.poly1d([2.41e-4, 2.421e-2, 15.001])
-            self.dist_mod_correct = distmod_spl(self.cat["phi1"]) - self.dist_mod
-        else:
-            spline_dist = InterpolatedUnivariateSpline(
-                track.phi1.value, track.distance.value
-            )
-            self.dist_mod_correct = (
-                5 * np.log10(spline_dist(self.cat["phi1"]) * 1000) - 5
-            ) - self.dist_mod
+        # shared with the other stages through the pawprint and the catalogue
+        distance_track = get_distance_track(self.stream, self.pawprint)
+        self.dist_mod_correct = distance_track.dist_mod_correct(self.cat, self.dist_mod)
 
         self.x_shift = 0
         self.y_shift = 0
@@ -106,18 +157,23 @@ class Isochrone:
         """
         Initialising the on-sky polygon mask to return only contained sources.
         """
+        on_mask = self.pawprint.selection("sky_stream", self.cat)
+        if on_mask is not None:
+            # already evaluated with Pawprint.evaluate
+            self.on_skymask = on_mask
+            return
+
+        hpx, nside = get_healpix_index(self.cat)
+        if hpx is not None:
+            # only stars in pixels on the footprint boundary are tested
+            skyprint = self.pawprint.skyprint["stream"]
+            self.on_skymask = skyprint.inside_footprint_healpix(
+                self.cat["phi1"], self.cat["phi2"], hpx, nside
+            )
+            return
 
-        on_poly_patch = mpl.patches.Polygon(
-            self.pawprint.skyprint["stream"].vertices[::50],
-            facecolor="none",
-            edgecolor="k",
-            linewidth=2,
-        )
         on_points = np.vstack((self.cat["phi1"], self.cat["phi2"])).T
-        on_mask = on_poly_patch.get_path().contains_points(on_points)
-
-        #         on_points = np.vstack((self.cat["phi1"], self.cat["phi2"])).T
-        #         on_mask = self.pawprint.skyprint['stream'].inside_footprint(on_points) #very slow because skyprint is very large
+        on_mask = self.pawprint.skyprint["stream"].inside_footprint(on_points)
 
         self.on_skymask = on_mask
 
@@ -125,6 +181,10 @@ class Isochrone:
         """
         Initialising the proper motions polygon mask to return only contained sources.
         """
+        on_mask = self.pawprint.selection("pm", self.cat)
+        if on_mask is not None:
+            self.on_pmmask = on_mask
+            return
 
         on_points = np.vstack(
             (self.cat["pm_phi1_cosphi2_unrefl"], self.cat["pm_phi2_unrefl"])
@@ -138,6 +198,13 @@ class Isochrone:
         """
         Initialising the proper motions polygon mask to return only contained sources.
         """
+        on_pm1_mask = self.pawprint.selection("pm1", self.cat)
+        on_pm2_mask = self.pawprint.selection("pm2", self.cat)
+        if on_pm1_mask is not None and on_pm2_mask is not None:
+            self.on_pm1mask = on_pm1_mask
+            self.on_pm2mask = on_pm2_mask
+            self.on_pm12mask = on_pm1_mask & on_pm2_mask
+            return
 
         on_pm1_points = np.vstack(
             (self.cat["phi1"], self.cat["pm_phi1_cosphi2_unrefl"])
@@ -156,28 +223,24 @@ class Isochrone:
         load an isochrone, LF model for a given metallicity, age, distance
         """
 
-        # Convert feh to z
-        Y_p = 0.245  # Primordial He abundance (WMAP, 2003)
-        c = 1.54  # He enrichment ratio
-        ZX_solar = 0.0229
-        z = (1 - Y_p) / ((1 + c) + (1 / ZX_solar) * 10 ** (-self.feh))
+        iso = sample_isochrone(
+            self.phot_survey,
+            self.age,
+            self.feh,
+            self.distance,
+            self.band1,
+            self.band2,
+            alpha=self.alpha,
+        )
 
         if self.phot_survey == "Gaia":
-            mist = MIST_Isochrone()
-            iso = mist.isochrone(
-                age=np.log10(1e9 * self.age),  # has to be given in logAge
-                feh=self.feh,
-                eep_range=None,  # get the whole isochrone,
-                distance=1e3 * self.distance,  # given in parsecs
-            )
-
-            initial_mass, actual_mass = iso.initial_mass.values, iso.mass.values
-            mag = iso.G_mag.values
-            color_1 = iso.BP_mag.values
-            color_2 = iso.RP_mag.values
+            initial_mass, actual_mass = iso["initial_mass"], iso["actual_mass"]
+            mag = iso["mag"]
+            color_1 = iso["color_1"]
+            color_2 = iso["color_2"]
 
             # Excise the horizontal branch
-            turn_idx = scipy.signal.argrelextrema(iso.G_mag.values, np.less)[0][0]
+            turn_idx = scipy.signal.argrelextrema(mag, np.less)[0][0]
             initial_mass = initial_mass[0:turn_idx]
             actual_mass = actual_mass[0:turn_idx]
             self.masses = actual_mass
@@ -186,23 +249,11 @@ class Isochrone:
             self.color = color_1[0:turn_idx] - color_2[0:turn_idx]
 
         else:
-            iso = isochrone_factory(
-                "Dotter",
-                survey=self.phot_survey,
-                age=self.age,
-                distance_modulus=self.dist_mod,
-                z=z,
-                band_1=self.band1,
-                band_2=self.band2,
-            )
-
-            iso.afe = self.alpha
-
-            initial_mass, mass_pdf, actual_mass, mag_1, mag_2 = iso.sample(
-                mass_steps=4e2
-            )
-            mag_1 = mag_1 + iso.distance_modulus
-            mag_2 = mag_2 + iso.distance_modulus
+            initial_mass = iso["initial_mass"]
+            mass_pdf = iso["mass_pdf"]
+            actual_mass = iso["actual_mass"]
+            mag_1 = iso["mag_1"]
+            mag_2 = iso["mag_2"]
 
             # Excise the horizontal branch
             turn_idx = scipy.signal.argrelextrema(mag_1, np.less)[0][0]
@@ -219,7 +270,6 @@ class Isochrone:
             mmag_2 = interp1d(initial_mass, mag_2, fill_value="extrapolate")
             mmass_pdf = interp1d(initial_mass, mass_pdf, fill_value="extrapolate")
 
-            self.iso = iso
             self.masses = actual_mass
             self.mass_pdf = mass_pdf
 
@@ -230,6 +280,20 @@ class Isochrone:
         # return iso, initial_mass, mass_pdf, actual_mass, mag_1, mag_2, mmag_1, mmag_2, \
         #            mmass_pdf
 
+    def _data_cmd_points(self):
+        """
+        Colors and distance-corrected magnitudes of the stars in the empirical CMD.
+        """
+        tab = self.cat
+        # if this is the second runthrough and a proper motion mask already exists, use that instead of the rough one
+        if self.pawprint.pm1print is not None:
+            mask = self.on_pm12mask & self.on_skymask
+        else:
+            mask = self.on_pmmask & self.on_skymask
+        color = (tab[self.data_color1] - tab[self.data_color2])[mask]
+        mag = (tab[self.data_mag] - self.dist_mod_correct)[mask]
+        return np.asarray(color), np.asarray(mag)
+
     def data_cmd(self, xrange=[-0.5, 1.0], yrange=[15, 22]):
         """
         Empirical CMD generated from the input catalogue, with distance gradient accounted for.
@@ -240,7 +304,6 @@ class Isochrone:
         xrange: Set the range of color values. Default is [-0.5, 1.0].
         yrange: Set the range of magnitude values. Default is [15, 22].
         """
-        tab = self.cat
         x_bins = np.arange(
             xrange[0], xrange[1], inputs[self.stream]["bin_sizes"][0]
         )  # Used 0.03 for Jhelum
@@ -248,40 +311,28 @@ class Isochrone:
             yrange[0], yrange[1], inputs[self.stream]["bin_sizes"][1]
         )  # Used 0.2 for Jhelum
 
-        # if this is the second runthrough and a proper motion mask already exists, use that instead of the rough one
-        if self.pawprint.pm1print is not None:
-            data, xedges, yedges = np.histogram2d(
-                (tab[self.data_color1] - tab[self.data_color2])[
-                    self.on_pm12mask & self.on_skymask
-                ],
-                (tab[self.data_mag] - self.dist_mod_correct)[
-                    self.on_pm12mask & self.on_skymask
-                ],
-                bins=[x_bins, y_bins],
-                density=True,
-            )
-        else:
-            data, xedges, yedges = np.histogram2d(
-                (tab[self.data_color1] - tab[self.data_color2])[
-                    self.on_pmmask & self.on_skymask
-                ],
-                (tab[self.data_mag] - self.dist_mod_correct)[
-                    self.on_pmmask & self.on_skymask
-                ],
-                bins=[x_bins, y_bins],
-                density=True,
-            )
+        color, mag = self._data_cmd_points()
+        data, xedges, yedges = np.histogram2d(
+            color, mag, bins=[x_bins, y_bins], density=True
+        )
 
         self.x_edges = xedges
         self.y_edges = yedges
         self.CMD_data = data.T
 
-    def correct_isochrone(self):
+    def correct_isochrone(self, method="fft", **kwargs):
         """
         Correlate the 2D histograms from the data and the
         theoretical isochrone to find the shift in color
         and magnitude necessary for the best match
+
+        method: "fft" (default) correlates with FFTs and refines the peak to a
+                fraction of a bin; "direct" uses scipy.signal.correlate2d and
+                whole bins; "multires" uses search_isochrone_shift, with kwargs
+        Also sets shift_confidence, see search_isochrone_shift.
         """
+        if method == "multires":
+            return self.search_isochrone_shift(**kwargs)
 
         signal, xedges, yedges = np.histogram2d(
             self.color,
@@ -297,10 +348,111 @@ class Isochrone:
         signal[np.isnan(signal)] = 0.0
         signal = signal.T
 
-        ccor2d = correlate2d(self.CMD_data, signal)
-        y, x = np.unravel_index(np.argmax(ccor2d), ccor2d.shape)
-        self.x_shift = (x - len(ccor2d[0]) / 2.0) * (self.x_edges[1] - self.x_edges[0])
-        self.y_shift = (y - len(ccor2d) / 2.0) * (self.y_edges[1] - self.y_edges[0])
+        if method == "fft":
+            ccor2d = _fft_correlate2d(self.CMD_data, signal)
+            y, x = _subpixel_peak(ccor2d)
+        elif method == "direct":
+            ccor2d = correlate2d(self.CMD_data, signal)
+            y, x = np.unravel_index(np.argmax(ccor2d), ccor2d.shape)
+        else:
+            raise ValueError(f"Unknown correlation method {method!r}.")
+        # zero shift is at index n - 1 of the full correlation
+        ny, nx = self.CMD_data.shape
+        self.x_shift = (x - (nx - 1)) * (self.x_edges[1] - self.x_edges[0])
+        self.y_shift = (y - (ny - 1)) * (self.y_edges[1] - self.y_edges[0])
+        self.shift_confidence = _peak_confidence(ccor2d, ccor2d.max())
+
+    def search_isochrone_shift(
+        self, max_shift=(0.3, 1.5), n_levels=4, n_candidates=3, tol=None
+    ):
+        """
+        Coarse-to-fine search for the shift in color and magnitude of the
+        theoretical isochrone that best matches the empirical CMD.
+
+        The first level correlates histograms with bins 2**(n_levels - 1) times
+        the stream's bin_sizes, over shifts up to max_shift, and keeps the
+        n_candidates highest local maxima. Each following level halves the bins
+        and only searches within two bins (of the previous level) of each
+        candidate, down to bin_sizes at the last level. Peaks are refined to a
+        fraction of a bin at every level.
+
+        ------------------------------------------------------------------
+
+        Parameters:
+        max_shift: largest shift in (color, magnitude) that is searched.
+        n_levels: number of resolutions.
+        n_candidates: number of peaks from the first level that are refined.
+        tol: if given, stop once a level moves the best shift by less than tol
+             in both color and magnitude.
+
+        Sets x_shift, y_shift and shift_confidence: the height of the first-level
+        peak that the best shift was refined from, above the mean of the whole
+        first-level correlation, in units of its standard deviation. The stream
+        sequence gives a sharp peak, while the background CMD is smooth on these
+        scales, so a low value (e.g. below 3) means the shift may have locked onto
+        the background.
+        """
+        color, mag = self._data_cmd_points()
+        ranges = [
+            (self.x_edges[0], self.x_edges[-1]),
+            (self.y_edges[0], self.y_edges[-1]),
+        ]
+        bin_sizes = np.asarray(inputs[self.stream]["bin_sizes"], dtype=float)
+        max_shift = np.asarray(max_shift, dtype=float)
+
+        # (shift, confidence of the first-level peak it was refined from)
+        candidates = [(np.zeros(2), None)]
+        window = max_shift
+        for level in range(n_levels):
+            size = bin_sizes * 2.0 ** (n_levels - 1 - level)
+            edges = [np.arange(lo, hi + s, s) for (lo, hi), s in zip(ranges, size)]
+            data, *_ = np.histogram2d(color, mag, bins=edges)
+            # shift of the model (in bins) at each index of the full correlation
+            lags = [np.arange(2 - len(e), len(e) - 1) for e in edges]
+
+            results = []
+            for center, confidence in candidates:
+                model, *_ = np.histogram2d(
+                    self.color + center[0], self.mag + center[1], bins=edges
+                )
+                ccor = _fft_correlate2d(data, (model > 0).astype(float))
+
+                shift = [center[i] + lags[i] * size[i] for i in range(2)]
+                allowed = [
+                    (np.abs(shift[i]) <= max_shift[i])
+                    & (np.abs(lags[i] * size[i]) <= window[i])
+                    for i in range(2)
+                ]
+                allowed = np.outer(*allowed)
+                values = np.where(allowed, ccor, -np.inf)
+
+                if level == 0:
+                    local_max = values == maximum_filter(values, size=3)
+                    peaks = np.flatnonzero(local_max & allowed)
+                    peaks = peaks[np.argsort(values.flat[peaks])[::-1][:n_candidates]]
+                    peaks = [np.unravel_index(p, ccor.shape) for p in peaks]
+                else:
+                    peaks = [np.unravel_index(np.argmax(values), ccor.shape)]
+
+                for peak in peaks:
+                    if level == 0:
+                        # over the whole correlation, as in correct_isochrone: the
+                        # finer levels only see a few bins around each peak
+                        confidence = _peak_confidence(ccor, ccor[peak])
+                    refined = _subpixel_peak(ccor, peak)
+                    step = np.array(
+                        [(refined[i] + lags[i][0]) * size[i] for i in range(2)]
+                    )
+                    results.append((ccor[peak], center + step, step, confidence))
+
+            results.sort(key=lambda r: r[0], reverse=True)
+            candidates = [(r[1], r[3]) for r in results]
+            window = 2 * size
+            if tol is not None and level > 0 and np.all(np.abs(results[0][2]) < tol):
+                break
+
+        self.x_shift, self.y_shift = np.clip(candidates[0][0], -max_shift, max_shift)
+        self.shift_confidence = candidates[0][1]
 
     def make_poly(self, iso_low, iso_high, maxmag=26, minmag=14):
         """
@@ -332,21 +484,76 @@ class Isochrone:
         )
         cmd_footprint = Footprint2D(cmd_poly, footprint_type="cartesian")
 
-        cmd_points = np.vstack(
-            (
-                self.cat[self.data_color1] - self.cat[self.data_color2],
-                self.cat[self.data_mag] - self.dist_mod_correct,
-            )
-        ).T
-        cmd_mask = cmd_footprint.inside_footprint(cmd_points)
+        # the polygon only bounds the color at each magnitude, so the stars are
+        # selected by interpolating its edges instead of testing all its vertices
+        cmd_mask, self.cmd_offset = self.cmd_selection(
+            mag_vals, col_low_vals, col_high_vals
+        )
 
         return cmd_footprint, cmd_mask
 
+    def cmd_selection(self, mag_vals, col_low_vals, col_high_vals):
+        """
+        Per-star CMD selection between two color bounds.
+
+        ------------------------------------------------------------------
+
+        Parameters:
+        mag_vals: increasing magnitudes at which the bounds are given
+        col_low_vals: "left" bound on color at each magnitude
+        col_high_vals: "right" bound on color at each magnitude
+
+        Returns:
+        cmd_mask: Boolean mask of the stars between the bounds, the same as the
+                  polygon made from the bounds by make_poly.
+        cmd_offset: color offset of each star from the middle of the bounds (the
+                    shifted isochrone), in units of the photometric uncertainty
+                    at its magnitude (photometric_error, which get_tolerance
+                    also uses). NaN outside the magnitude range.
+        """
+        color, mag = self._cmd_points()
+
+        in_range = (mag >= mag_vals[0]) & (mag <= mag_vals[-1])
+        # one binary search per star, shared by both bounds
+        j = np.searchsorted(mag_vals, mag, side="right") - 1
+        j = np.clip(j, 0, len(mag_vals) - 2)
+        t = (mag - mag_vals[j]) / (mag_vals[j + 1] - mag_vals[j])
+        low = col_low_vals[j] + t * (col_low_vals[j + 1] - col_low_vals[j])
+        high = col_high_vals[j] + t * (col_high_vals[j + 1] - col_high_vals[j])
+
+        cmd_mask = in_range & (color > low) & (color < high)
+        cmd_offset = np.full(len(color), np.nan)
+        cmd_offset[in_range] = (color - (low + high) / 2)[in_range] / np.asarray(
+            self.photometric_error(mag[in_range])
+        )
+
+        return cmd_mask, cmd_offset
+
+    def _cmd_points(self):
+        """
+        Colors and distance-corrected magnitudes of all stars in the catalogue.
+        """
+        color = self.cat[self.data_color1] - self.cat[self.data_color2]
+        mag = self.cat[self.data_mag] - self.dist_mod_correct
+        return np.asarray(color, dtype=float), np.asarray(mag, dtype=float)
+
     def get_tolerance(self, scale_err=1, base_tol=0.075):
         """
         Convolving errors to create wider selections near mag limit
         Code written by Nora Shipp and adapted by Kiyan Tavangar
         """
+        return scale_err * self.photometric_error(self.mag) + base_tol
+
+    def photometric_error(self, mag, band=None):
+        """
+        Typical photometric uncertainty at a magnitude in a band (by default the
+        magnitude band, data_mag): the median from error_model if the catalogue
+        has uncertainties for the band, otherwise from fits for the survey.
+        """
+        model = self.error_model(self.data_mag if band is None else band)
+        if model is not None:
+            return model(mag)
+
         if self.phot_survey == "PS1":
             err = lambda x: 0.00363355415 + np.exp((x - 23.9127145) / 1.09685211)
         elif self.phot_survey == "DES_DR2":
@@ -359,7 +566,7 @@ class Isochrone:
             err = lambda x: 0.00363355415 + np.exp((x - 23.9127145) / 1.09685211)
             # err=lambda x: 0*x
 
-        return scale_err * err(self.mag) + base_tol
+        return err(mag)
 
     def simpleSln(self, maxmag=22, scale_err=2, mass_thresh=0.80):
         """
@@ -570,71 +777,192 @@ class Isochrone:
 
         return fig
 
-    def convolve_1d(self, probabilities, mag_err):
+    def isochrone_density(self):
         """
-        1D Gaussian convolution.
+        Luminosity-function-weighted density of the shifted isochrone on the CMD
+        grid of data_cmd, normalized to sum to 1.
+
+        The isochrone is resampled in initial mass (with mmag_1, mmag_2 and
+        mmass_pdf) finely enough that consecutive points are less than a quarter
+        of a bin apart, and each point is weighted by the IMF probability of its
+        mass interval.
+
+        Returns:
+        density: array of shape (len(y_edges) - 1, len(x_edges) - 1), like
+                 CMD_data.
+        """
+        if not hasattr(self, "mmass_pdf"):
+            raise ValueError("The isochrone has no mass function (mass_pdf).")
+
+        xbin = self.x_edges[1] - self.x_edges[0]
+        ybin = self.y_edges[1] - self.y_edges[0]
+
+        initial_mass = self.mmag_1.x
+        mag_1 = self.mmag_1(initial_mass)
+        color = mag_1 - self.mmag_2(initial_mass)
+        n_sub = np.ceil(
+            np.maximum(
+                np.abs(np.diff(mag_1)) / (0.25 * ybin),
+                np.abs(np.diff(color)) / (0.25 * xbin),
+            )
+        ).astype(int)
+        n_sub = np.maximum(n_sub, 1)
+        seg = np.repeat(np.arange(len(n_sub)), n_sub)
+        step = np.arange(n_sub.sum()) - np.repeat(np.cumsum(n_sub) - n_sub, n_sub)
+        t = step / np.repeat(n_sub, n_sub)
+        masses = initial_mass[seg] + t * np.diff(initial_mass)[seg]
+
+        # mass_pdf is the probability of each sampled mass step
+        pdf_per_mass = self.mmass_pdf(initial_mass) / np.gradient(initial_mass)
+        weights = np.interp(masses, initial_mass, pdf_per_mass) * np.gradient(masses)
+
+        mag = self.mmag_1(masses)
+        density, _, _ = np.histogram2d(
+            mag - self.mmag_2(masses) + self.x_shift,
+            mag + self.y_shift,
+            bins=[self.x_edges, self.y_edges],
+            weights=weights,
+        )
+        density = density.T
+        return density / density.sum()
+
+    def convolve_1d(self, probabilities, sigma, bin_size):
+        """
+        1D Gaussian convolution along the rows of an array, with a different width
+        for each row, done for all rows at once with FFTs.
 
         ------------------------------------------------------------------
 
         Parameters:
-        probabilities:
-        mag_err: Uncertainty in the magnitudes.
+        probabilities: array of shape (n_rows, n)
+        sigma: Gaussian width for each row (or one for all), in the units of
+               bin_size
+        bin_size: bin width along the rows
 
+        Returns:
+        convolved: array of shape (n_rows, n)
         """
-        self.probabilities = probabilities
-        self.mag_err = mag_err
+        probabilities = np.atleast_2d(probabilities)
+        sigma = np.broadcast_to(np.asarray(sigma, dtype=float), len(probabilities))
+        n = probabilities.shape[1]
 
-        sigma = mag_err / self.ybin  # error in pixel units
-        kernel = Gaussian1DKernel(sigma)
-        convolved = convolve(probabilities, kernel)
+        # zero-pad by 5 sigma so the convolution does not wrap around
+        pad = int(np.ceil(5 * sigma.max() / bin_size))
+        nfft = next_fast_len(n + pad, real=True)
+        freq = np.fft.rfftfreq(nfft, d=bin_size)
+        transfer = np.exp(-2 * (np.pi * freq[None] * sigma[:, None]) ** 2)
 
-        self.convolved = convolved
+        convolved = irfft(rfft(probabilities, nfft, axis=1) * transfer, nfft, axis=1)
+        return convolved[:, :n]
 
-    def convolve_errors(self, g_errors, r_errors, intr_err=0.1):
+    def convolve_errors(self, g_errors=None, r_errors=None, intr_err=0.1):
         """
+        Matched filter: the isochrone density (isochrone_density) convolved with
+        the photometric errors, as a probability lookup table on the CMD grid.
 
-        1D Gaussian convolution of the data with uncertainities.
+        Colors are smeared at each magnitude by a Gaussian of width
+        sqrt(g_errors(mag)**2 + r_errors(mag)**2 + intr_err**2) (one batched FFT
+        convolution over all magnitude rows), and magnitudes by a Gaussian of
+        width g_errors(mag) that varies with the magnitude of each bin (one
+        matrix product).
 
         ------------------------------------------------------------------
 
         Parameters:
-        g_errors: g magnitude uncertainties.
-        r_errors: r magnitude uncertainties.
+        g_errors: function giving the uncertainty in the magnitude band at a
+                  magnitude. Defaults to photometric_error.
+        r_errors: same for the other band of the color. Defaults to its
+                  error_model, or to g_errors.
         intr_err: Free to set. Default is 0.1.
 
+        Returns:
+        probabilities: array like CMD_data, normalized to sum to 1 (also stored
+                       as self.probabilities)
         """
+        if g_errors is None:
+            g_errors = self.photometric_error
+        if r_errors is None:
+            if self.error_model(self.data_color2) is not None:
+                r_errors = self.error_model(self.data_color2)
+            else:
+                r_errors = g_errors
+
+        xbin = self.x_edges[1] - self.x_edges[0]
+        ybin = self.y_edges[1] - self.y_edges[0]
+        y = 0.5 * (self.y_edges[1:] + self.y_edges[:-1])
+
+        density = self.isochrone_density()
+        color_sigma = np.sqrt(g_errors(y) ** 2 + r_errors(y) ** 2 + intr_err**2)
+        probabilities = self.convolve_1d(density, color_sigma, xbin)
+
+        # kernel[i, j]: fraction of the stars in magnitude bin j that scatter into
+        # bin i
+        mag_sigma = np.maximum(g_errors(y), 1e-3 * ybin)
+        kernel = np.exp(-0.5 * ((y[:, None] - y[None]) / mag_sigma[None]) ** 2)
+        kernel /= kernel.sum(axis=0)
+        probabilities = kernel @ probabilities
+
+        probabilities = np.clip(probabilities, 0, None)
+        self.probabilities = probabilities / probabilities.sum()
+        return self.probabilities
+
+    def matched_filter_probability(self, color=None, mag=None):
+        """
+        Look up the matched-filter probability (from convolve_errors) of stars.
 
-        for i in range(len(probabilities)):
-            probabilities[i] = convolve_1d(
-                probabilities[i],
-                np.sqrt(
-                    g_errors(self.x_bins[i]) ** 2
-                    + r_errors(self.y_bins[i]) ** 2
-                    + intr_err**2
-                ),
-                sel.fx_bins[1] - self.x_bins[0],
-            )
+        ------------------------------------------------------------------
 
-        self.probabilities = probabilities
+        Parameters:
+        color, mag: colors and distance-corrected magnitudes. Default to the
+                    catalogue.
 
-    def errFn(self):
-        """
-        Generate the errors for the magnitudes?
+        Returns:
+        probability: the probability of each star's CMD bin (0 outside the grid)
         """
+        if color is None or mag is None:
+            color, mag = self._cmd_points()
+        color = np.asarray(color, dtype=float)
+        mag = np.asarray(mag, dtype=float)
 
-        gerrs = np.zeros(len(self.y_bins))
-        rerrs = np.zeros(len(self.x_bins))
+        i = np.searchsorted(self.y_edges, mag, side="right") - 1
+        j = np.searchsorted(self.x_edges, color, side="right") - 1
+        ny, nx = self.probabilities.shape
+        inside = (i >= 0) & (i < ny) & (j >= 0) & (j < nx)
 
-        for i in range(len(self.y_bins)):
-            gerrs[i] = np.nanmedian(
-                self.cat["g0"][abs(self.cat["g0"] - self.y_bins[i]) < self.ybin / 2]
-            )
-            rerrs[i] = np.nanmedian(
-                self.cat["r0"][abs(self.cat["g0"] - self.x_bins[i]) < self.xbin / 2]
-            )
+        probability = np.zeros(len(color))
+        probability[inside] = self.probabilities[i[inside], j[inside]]
+        return probability
 
-        gerrs = interp1d(self.y_bins, gerrs, fill_value="extrapolate")
-        rerrs = interp1d(self.x_bins, rerrs, fill_value="extrapolate")
+    def error_model(self, band, bin_size=0.1):
+        """
+        Binned model of the photometric uncertainty in a band as a function of its
+        magnitude, from the "<band>_err" column of the catalogue, or None if there
+        is no such column or too few stars with uncertainties to bin. Built once per
+        band and bin size.
+        """
+        if not hasattr(self, "_error_models"):
+            self._error_models = {}
+        key = (band, bin_size)
+        if key not in self._error_models:
+            self._error_models[key] = None
+            err_name = f"{band}_err"
+            if err_name in self.cat.colnames:
+                try:
+                    self._error_models[key] = BinnedErrorModel(
+                        self.cat[band], self.cat[err_name], bin_size=bin_size
+                    )
+                except ValueError as e:
+                    warnings.warn(
+                        f"Not using the {err_name} column ({e}), falling back to "
+                        f"the {self.phot_survey} photometric error fits."
+                    )
+        return self._error_models[key]
 
-        self.gerrs = gerrs
-        self.rerrs = rerrs
+    def errFn(self):
+        """
+        Generate the errors for the magnitudes of the two bands of the color, as
+        functions of magnitude (see error_model).
+        """
+        self.gerrs = self.error_model(self.data_color1)
+        self.rerrs = self.error_model(self.data_color2)
+        return self.gerrs, self.rerrs
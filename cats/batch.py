@@ -0,0 +1,249 @@
+"""
+Run the CATS selection for many streams in parallel
+
+For each stream in `cats.inputs.stream_inputs` (or a subset), in a process pool:
+
+- ``read``: read the joined catalog (see `cats.columnar.read_joined`)
+- ``pawprint``: build the pawprint from galstreams, with a rough proper-motion cut
+- ``isochrone``: `cats.CMD.Isochrone` and its ``simpleSln`` CMD cut
+- ``proper_motions``: `cats.proper_motions.ProperMotionSelection`
+- ``write``: write the pawprint and the masks
+
+Each stream gets a directory ``<output-dir>/<stream>/`` with ``pawprint.asdf``,
+``masks.npz`` and the diagnostic plots. A failing stream is reported in the summary
+table (also written to ``<output-dir>/summary.ecsv``) without stopping the others.
+
+Usage::
+
+    python -m cats.batch --catalog "data/joined-{stream}.fits" --output-dir batch
+    python -m cats.batch --streams GD-1 Pal5 --workers 2
+"""
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import astropy.table as at
+import astropy.units as u
+import numpy as np
+
+from cats.columnar import read_joined
+from cats.inputs import stream_inputs as inputs
+
+__all__ = ["run_stream", "run_batch"]
+
+stages = ["read", "pawprint", "isochrone", "proper_motions", "write"]
+
+
+def _init_worker():
+    # the selections make plots, which must not need a display in the workers
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def _write_masks(fname, catalog, masks):
+    arrays = {name: np.asarray(mask, dtype=bool) for name, mask in masks.items()}
+    if "source_id" in catalog.colnames:
+        arrays["source_id"] = np.asarray(catalog["source_id"])
+    np.savez_compressed(fname, **arrays)
+
+
+def run_stream(stream, catalog_path, output_dir):
+    """
+    Run the selection of one stream and write its pawprint and masks to
+    ``<output_dir>/<stream>/``, which is also the working directory (where the
+    plots are saved) while it runs.
+
+    Parameters
+    ----------
+    stream : str
+        Key of `cats.inputs.stream_inputs`.
+    catalog_path : str
+        Joined catalog of the stream.
+    output_dir : str
+
+    Returns
+    -------
+    result : dict
+        ``stream``, ``status`` (``"ok"`` or ``"failed"``), ``error`` (the traceback
+        of a failure, or ``""``) and the time of each stage in ``times`` (seconds,
+        NaN for stages that did not run).
+    """
+    # imported here so that a broken optional dependency (e.g. the isochrone
+    # models) fails the streams, not the batch
+    import matplotlib.pyplot as plt
+
+    from cats.CMD import Isochrone
+    from cats.pawprint.pawprint import Pawprint
+    from cats.proper_motions import ProperMotionSelection, rough_pm_poly
+
+    pars = inputs[stream]
+    stream_dir = os.path.abspath(os.path.join(output_dir, stream))
+    os.makedirs(stream_dir, exist_ok=True)
+    times = dict.fromkeys(stages, np.nan)
+    result = dict(stream=stream, status="ok", error="", times=times)
+
+    cwd = os.getcwd()
+    t_start = time.perf_counter()
+    try:
+        t0 = time.perf_counter()
+        catalog = read_joined(os.path.abspath(catalog_path))
+        os.chdir(stream_dir)
+        times["read"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        pawprint = Pawprint.pawprint_from_galstreams(
+            pars["short_name"], pars["pawprint_id"], width=pars["width"] * u.deg
+        )
+        rough_pm_poly(pawprint, catalog)
+        times["pawprint"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        iso = Isochrone(stream, catalog, pawprint)
+        _, cmd_mask, _, hb_mask, pawprint = iso.simpleSln(
+            maxmag=pars["maxmag"], scale_err=pars["scale_err"]
+        )
+        times["isochrone"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        pms = ProperMotionSelection(stream, catalog, pawprint)
+        times["proper_motions"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        pawprint.save_pawprint(os.path.join(stream_dir, "pawprint.asdf"))
+        masks = dict(
+            sky_stream=pms.spatial_mask_on,
+            sky_background=pms.spatial_mask_off,
+            cmd=cmd_mask,
+            hb=hb_mask,
+            pm=pms.pm_mask,
+            pm1=pms.pm1_mask,
+            pm2=pms.pm2_mask,
+            selection=pms.mask,
+        )
+        _write_masks(os.path.join(stream_dir, "masks.npz"), catalog, masks)
+        times["write"] = time.perf_counter() - t0
+    except Exception:
+        result["status"] = "failed"
+        result["error"] = traceback.format_exc()
+    finally:
+        os.chdir(cwd)
+        plt.close("all")
+
+    result["total"] = time.perf_counter() - t_start
+    return result
+
+
+def _run_isolated(stream, catalog_path, output_dir):
+    # a process of its own for each stream: when a worker dies (e.g. killed for
+    # lack of memory), its pool is broken, which then only fails this stream
+    with ProcessPoolExecutor(max_workers=1, initializer=_init_worker) as executor:
+        return executor.submit(run_stream, stream, catalog_path, output_dir).result()
+
+
+def run_batch(streams, catalog, output_dir, max_workers=None):
+    """
+    Run `run_stream` for several streams in parallel, each in a new process.
+
+    Parameters
+    ----------
+    streams : list of str
+    catalog : str
+        Path of the joined catalogs, formatted with ``stream`` (e.g.
+        ``"data/joined-{stream}.fits"``).
+    output_dir : str
+    max_workers : int (optional)
+        Number of streams run at the same time. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    results : list of dict
+        The results of `run_stream`, in the order of ``streams``. A stream whose
+        worker died (e.g. killed for lack of memory) is reported as failed, and
+        the other streams still run.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_run_isolated, s, catalog.format(stream=s), output_dir)
+            for s in streams
+        ]
+
+        results = []
+        for stream, future in zip(streams, futures):
+            try:
+                results.append(future.result())
+            except Exception:
+                times = dict.fromkeys(stages, np.nan)
+                results.append(
+                    dict(
+                        stream=stream,
+                        status="failed",
+                        error=traceback.format_exc(),
+                        times=times,
+                        total=np.nan,
+                    )
+                )
+    return results
+
+
+def summarize(results):
+    """
+    Timing summary of a batch: one row per stream, with the time of each stage and
+    the last line of the error of failed streams.
+
+    Returns
+    -------
+    summary : `astropy.table.Table`
+    """
+    rows = []
+    for res in results:
+        error = res["error"].strip().splitlines()[-1] if res["error"] else ""
+        times = [res["times"][name] for name in stages]
+        rows.append((res["stream"], res["status"], *times, res["total"], error))
+
+    summary = at.Table(
+        rows=rows,
+        names=["stream", "status", *[f"{n} [s]" for n in stages], "total [s]", "error"],
+    )
+    for name in summary.colnames[2:-1]:
+        summary[name].format = ".2f"
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--streams", nargs="+", choices=list(inputs), default=list(inputs)
+    )
+    parser.add_argument(
+        "--catalog",
+        default=os.path.join("data", "joined-{stream}.fits"),
+        help="path of the joined catalogs, with {stream} for the stream name",
+    )
+    parser.add_argument("--output-dir", default="batch")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    results = run_batch(
+        args.streams, args.catalog, args.output_dir, max_workers=args.workers
+    )
+    for res in results:
+        if res["status"] != "ok":
+            print(f"{res['stream']}: failed\n{res['error']}", file=sys.stderr)
+
+    summary = summarize(results)
+    fname = os.path.join(args.output_dir, "summary.ecsv")
+    summary.write(fname, format="ascii.ecsv", overwrite=True)
+    summary.pprint(max_lines=-1, max_width=-1)
+
+    return int(any(res["status"] != "ok" for res in results))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,110 @@
+"""
+Benchmark the source_id join used at the end of `make_astro_photo_joined_data`.
+
+Compares the generic ``astropy.table.join`` + ``astropy.table.unique`` path against
+`cats.data.join_on_source_id` on random Gaia-like and photometry-like tables.
+
+Usage::
+
+    python -m cats.benchmarks.join --sizes 1e5 1e6 1e7
+"""
+import argparse
+import time
+
+import astropy.table as at
+import numpy as np
+
+from cats.data import join_on_source_id
+
+gaia_columns = ["ra", "dec", "parallax", "pmra", "pmdec", "pmra_error", "pmdec_error"]
+phot_columns = ["g0", "r0", "i0", "z0", "y0"]
+
+
+def make_tables(n, duplicate_frac=0.01, overlap_frac=0.9, seed=42):
+    """
+    Make a pair of tables to join, with some duplicated rows in the photometry table
+    (as from overlapping tiles) and only partial overlap in ``source_id``.
+    """
+    rng = np.random.default_rng(seed)
+
+    gaia_ids = rng.choice(np.iinfo(np.int64).max, size=n, replace=False)
+    gaia = at.Table({"source_id": gaia_ids})
+    for name in gaia_columns:
+        gaia[name] = rng.normal(size=n)
+
+    n_overlap = int(overlap_frac * n)
+    phot_ids = np.concatenate(
+        (
+            rng.choice(gaia_ids, size=n_overlap, replace=False),
+            rng.choice(np.iinfo(np.int64).max, size=n - n_overlap, replace=False),
+        )
+    )
+    phot = at.Table({"source_id": phot_ids})
+    phot["star_mask"] = rng.uniform(size=n) > 0.1
+    for name in phot_columns:
+        phot[name] = rng.uniform(15, 24, size=n)
+
+    n_dup = int(duplicate_frac * n)
+    phot = phot[rng.permutation(np.concatenate((np.arange(n), rng.choice(n, n_dup))))]
+
+    return gaia, phot
+
+
+def astropy_join(gaia, phot):
+    joined = at.join(gaia, phot, keys="source_id")
+    return at.unique(joined, keys="source_id")
+
+
+def time_call(func, *args, repeat=1):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--sizes", nargs="+", type=float, default=[1e5, 1e6, 1e7], help="table sizes"
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--skip-astropy",
+        action="store_true",
+        help="only time join_on_source_id (the astropy path is slow at 1e7 rows)",
+    )
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        n = int(size)
+        gaia, phot = make_tables(n)
+
+        t_cats, joined = time_call(join_on_source_id, gaia, phot, repeat=args.repeat)
+        if args.skip_astropy:
+            t_astropy = np.nan
+        else:
+            t_astropy, expected = time_call(
+                astropy_join, gaia, phot, repeat=args.repeat
+            )
+            assert np.all(joined["source_id"] == expected["source_id"])
+            for name in expected.colnames:
+                assert np.all(joined[name] == expected[name]), name
+
+        rows.append((n, len(joined), t_astropy, t_cats, t_astropy / t_cats))
+
+    summary = at.Table(
+        rows=rows,
+        names=["n_rows", "n_joined", "t_astropy [s]", "t_cats [s]", "speedup"],
+    )
+    for name in summary.colnames[2:]:
+        summary[name].format = ".3f"
+    summary.pprint(max_lines=-1, max_width=-1)
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
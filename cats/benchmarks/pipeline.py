@@ -0,0 +1,380 @@
+"""
+Time each stage of the CATS pipeline on synthetic catalogs, with peak memory, and
+compare against stored baselines.
+
+The stages are run with the same methods the pipeline uses (`cats.data`,
+`cats.CMD.Isochrone` and `cats.proper_motions.ProperMotionSelection`) on a synthetic
+stream from `cats.benchmarks.synthetic`, with its closed-form isochrone, so they run
+offline and without isochrone grids:
+
+- ``join``: coordinate transform, reflex correction and join of Gaia and photometry
+- ``sky_mask``: on- and off-stream sky footprint masks
+- ``cmd_hist``: the empirical CMD of the on-stream stars
+- ``iso_shift``: the correlation of the isochrone with the empirical CMD
+- ``masks``: the CMD and proper-motion polygon masks
+- ``pm_peak``: the proper-motion peak fit
+
+The baseline file records the machine (see `machine_info`) and the git commit it
+was measured on. Timings are only compared with a baseline from the same machine;
+on any other machine only the peak memory is checked, and the baseline should be
+regenerated there.
+
+Usage::
+
+    python -m cats.benchmarks.pipeline --sizes 1e5 1e6 --save-baseline
+    python -m cats.benchmarks.pipeline --sizes 1e5 1e6  # compare to the baseline
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import astropy.table as at
+import matplotlib.pyplot as plt
+import numpy as np
+from pyia import GaiaData
+
+from cats.benchmarks.synthetic import (
+    isochrone_model,
+    make_joined_catalog,
+    make_pawprint,
+    make_track,
+    split_astro_photo,
+)
+from cats.CMD import Isochrone
+from cats.columnar import read_joined
+from cats.data import _get_distance_interpolator, _join_astro_photo
+from cats.distance import DistanceTrack
+from cats.inputs import stream_inputs as inputs
+from cats.proper_motions import ProperMotionSelection, rough_pm_poly
+
+default_baseline = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# the synthetic stream is GD-1-like, so it uses the GD-1 inputs (bins, bands, ...)
+stream = "GD-1"
+
+
+class SyntheticIsochrone(Isochrone):
+    """
+    `cats.CMD.Isochrone` with the closed-form isochrone of the synthetic stream
+    (see `cats.benchmarks.synthetic.isochrone_model`) instead of one sampled from
+    the isochrone grids.
+    """
+
+    def generate_isochrone(self):
+        self.color, self.mag, self.masses = isochrone_model(self.dist_mod)
+
+
+def setup(catalog, track):
+    """
+    Build the inputs of every stage by running the pipeline once on the catalog,
+    as `cats.batch` does: the rough proper-motion cut, `SyntheticIsochrone` and its
+    CMD cut, `cats.proper_motions.ProperMotionSelection`, and then the second
+    `SyntheticIsochrone` with the refined proper-motion cuts. The plots they make
+    are saved in a temporary directory.
+    """
+    pawprint = make_pawprint(track, width=inputs[stream]["width"])
+    pawprint.distance_track = DistanceTrack.from_polynomial(
+        track.pars["distmod_coeffs"]
+    )
+    gaia_table, phot_data = split_astro_photo(catalog)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            rough_pm_poly(pawprint, catalog)
+            iso = SyntheticIsochrone(stream, catalog, pawprint)
+            iso.simpleSln(
+                maxmag=inputs[stream]["maxmag"], scale_err=inputs[stream]["scale_err"]
+            )
+            pms = ProperMotionSelection(stream, catalog, pawprint)
+            iso = SyntheticIsochrone(stream, catalog, pawprint)
+        finally:
+            os.chdir(cwd)
+            plt.close("all")
+
+    _, spline_pm1, spline_pm2, _ = pms.from_galstreams()
+    pms.splines = (spline_pm1, spline_pm2)
+
+    return dict(
+        iso=iso,
+        pms=pms,
+        gaia_data=GaiaData(gaia_table),
+        phot_data=phot_data,
+        join_args=_get_distance_interpolator(track),
+    )
+
+
+def stage_join(state):
+    gaia_data, phot_data = state["gaia_data"], state["phot_data"]
+    return _join_astro_photo(gaia_data, phot_data, *state["join_args"])
+
+
+def stage_sky_mask(state):
+    iso, pms = state["iso"], state["pms"]
+    iso.sel_sky()
+    pms.spatial_mask_on, pms.spatial_mask_off = pms.sel_sky()
+
+
+def stage_cmd_hist(state):
+    state["iso"].data_cmd()
+
+
+def stage_iso_shift(state):
+    state["iso"].correct_isochrone()
+
+
+def stage_masks(state):
+    iso, pms = state["iso"], state["pms"]
+    cmd_footprint, cmd_mask, *_ = iso.simpleSln(
+        maxmag=inputs[stream]["maxmag"], scale_err=inputs[stream]["scale_err"]
+    )
+
+    pms.CMD_mask = cmd_mask
+    pms.mask = pms.spatial_mask_on & pms.CMD_mask
+    pms.off_mask = pms.spatial_mask_off & pms.CMD_mask
+    pms.pm_phi1_cosphi2 = np.asarray(pms.data["pm_phi1_cosphi2_unrefl"])[pms.mask]
+    pms.pm_phi2 = np.asarray(pms.data["pm_phi2_unrefl"])[pms.mask]
+
+    pms.build_poly_and_mask()
+    pms.build_mask(pms.data, *pms.splines, pms.pm_poly)
+    pms.build_pm12_polys_and_masks()
+
+
+def stage_pm_peak(state):
+    state["pms"].find_peak_location(state["pms"].data, draw_histograms=False)
+
+
+stages = {
+    "join": stage_join,
+    "sky_mask": stage_sky_mask,
+    "cmd_hist": stage_cmd_hist,
+    "iso_shift": stage_iso_shift,
+    "masks": stage_masks,
+    "pm_peak": stage_pm_peak,
+}
+
+
+def run_stages(state, repeat=1, names=None):
+    """
+    Run the stages in order, timing each (best of ``repeat``) and then measuring its
+    peak memory in one more run with `tracemalloc` (which slows down allocations, so
+    it is not used while timing).
+
+    Returns
+    -------
+    results : dict
+        ``{stage: {"time": seconds, "peak_memory": bytes}}``
+    """
+    results = {}
+    for name in names or stages:
+        func = stages[name]
+
+        best = np.inf
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            func(state)
+            best = min(best, time.perf_counter() - t0)
+
+        tracemalloc.start()
+        func(state)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = dict(time=best, peak_memory=peak)
+    return results
+
+
+def machine_info():
+    """
+    The platform, CPU and versions that timings depend on, stored with a baseline.
+    """
+    cpu = platform.processor() or platform.machine()
+    if os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu = line.split(":", 1)[1].strip()
+                    break
+    return dict(
+        platform=platform.platform(),
+        cpu=cpu,
+        cpu_count=os.cpu_count(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+    )
+
+
+def git_commit():
+    """The commit of this checkout (``-dirty`` if modified), or None."""
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty", "--abbrev=40"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def load_baseline(path):
+    """
+    Read a baseline file written with ``--save-baseline``.
+
+    Returns
+    -------
+    baseline : dict
+        ``{"machine": ..., "commit": ..., "results": {size: {stage: ...}}}``, with
+        empty results if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return dict(machine=None, commit=None, results={})
+    with open(path) as f:
+        baseline = json.load(f)
+    if "results" not in baseline:
+        # results only, from an unknown machine
+        baseline = dict(machine=None, commit=None, results=baseline)
+    return baseline
+
+
+def compare(results, baseline, tolerance=0.2, compare_time=True):
+    """
+    Compare results to a baseline (both keyed by catalog size, then stage).
+
+    Parameters
+    ----------
+    compare_time : bool (optional)
+        Whether a slowdown counts as a regression. Turn off for a baseline from
+        another machine, whose timings are not comparable.
+
+    Returns
+    -------
+    summary : `astropy.table.Table`
+    regressed : bool
+        Whether any stage got slower or used more memory than ``tolerance`` (as a
+        fraction) relative to the baseline.
+    """
+    rows = []
+    regressed = False
+    for size, stage_results in results.items():
+        for name, res in stage_results.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                t_ratio = mem_ratio = np.nan
+            else:
+                t_ratio = res["time"] / base["time"]
+                mem_ratio = res["peak_memory"] / max(base["peak_memory"], 1)
+            flag = (
+                compare_time and t_ratio > 1 + tolerance
+            ) or mem_ratio > 1 + tolerance
+            regressed |= flag
+            rows.append(
+                (
+                    int(size),
+                    name,
+                    res["time"],
+                    res["peak_memory"] / 2**20,
+                    t_ratio,
+                    mem_ratio,
+                    "REGRESSION" if flag else "",
+                )
+            )
+
+    summary = at.Table(
+        rows=rows,
+        names=[
+            "n_rows",
+            "stage",
+            "time [s]",
+            "peak [MiB]",
+            "t/base",
+            "mem/base",
+            "flag",
+        ],
+    )
+    for name in summary.colnames[2:6]:
+        summary[name].format = ".3f"
+    return summary, regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes", nargs="+", type=float, default=[1e5, 1e6], help="catalog sizes"
+    )
+    parser.add_argument(
+        "--catalog",
+        default=None,
+        help="benchmark a catalog written by cats.benchmarks.synthetic (with the "
+        "default track) instead",
+    )
+    parser.add_argument("--stages", nargs="+", choices=list(stages), default=None)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=default_baseline)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store these results as the baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="fractional slowdown or memory increase reported as a regression",
+    )
+    args = parser.parse_args()
+
+    track = make_track()
+    if args.catalog is not None:
+        catalogs = [read_joined(args.catalog)]
+    else:
+        catalogs = (
+            make_joined_catalog(int(size), track=track, seed=args.seed)
+            for size in args.sizes
+        )
+
+    results = {}
+    for catalog in catalogs:
+        state = setup(catalog, track)
+        results[str(len(catalog))] = run_stages(
+            state, repeat=args.repeat, names=args.stages
+        )
+
+    machine = machine_info()
+    baseline = load_baseline(args.baseline)
+    if args.save_baseline:
+        # only keep results for other sizes from the same machine and commit
+        commit = git_commit()
+        if (baseline["machine"], baseline["commit"]) != (machine, commit):
+            baseline["results"] = {}
+        baseline["results"].update(results)
+        baseline.update(machine=machine, commit=commit)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1)
+            f.write("\n")
+
+    same_machine = baseline["machine"] == machine
+    if not same_machine:
+        print(
+            f"The baseline was measured on {baseline['machine'] or 'an unknown machine'}"
+            ", not this one, so only peak memory is compared."
+        )
+    summary, regressed = compare(
+        results, baseline["results"], args.tolerance, compare_time=same_machine
+    )
+    summary.pprint(max_lines=-1, max_width=-1)
+
+    return int(regressed and not args.save_baseline)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,426 @@
+"""
+Synthetic joined catalogs for benchmarking the CATS pipeline.
+
+A stream is placed along a galstreams-like track (a great-circle frame with smooth
+phi2, distance and proper-motion tracks) on top of a smooth background of field
+stars. Stream stars follow an old, metal-poor isochrone at the track distance, and
+field stars a broad mix of halo and disk colors. Everything is generated from
+closed-form models, so no network access, galstreams track files or isochrone grids
+are needed.
+
+The catalogs have the same columns as the output of
+`cats.data.make_astro_photo_joined_data` for a PS1 stream (see
+`cats.inputs.stream_inputs`).
+
+Usage (to write a large catalog for `cats.benchmarks.pipeline`)::
+
+    python -m cats.benchmarks.synthetic --n 1e8 --output synthetic-1e8.cols
+"""
+import argparse
+from types import SimpleNamespace
+
+import astropy.coordinates as coord
+import astropy.table as at
+import astropy.units as u
+import numpy as np
+from gala.coordinates import GreatCircleICRSFrame
+
+from cats.columnar import ColumnarCatalog, ColumnarWriter
+from cats.coords import reflex_correct_stream, stream_to_icrs
+from cats.pawprint.pawprint import Pawprint
+
+__all__ = [
+    "make_track",
+    "isochrone_model",
+    "make_pawprint",
+    "make_joined_catalog",
+    "write_joined_catalog",
+    "split_astro_photo",
+]
+
+# roughly GD-1 (Price-Whelan & Bonaca 2018)
+track_defaults = dict(
+    pole_ra=34.5,
+    pole_dec=29.7,
+    ra0=200.0,
+    phi1_range=(-90.0, 10.0),
+    phi2_coeffs=[-3.0e-4, -1.0e-2, 0.0],
+    distmod_coeffs=[2.41e-4, 2.421e-2, 15.001],
+    pm1_coeffs=[-1.0e-3, -2.0e-2, -9.0],
+    pm2_coeffs=[0.0, 2.0e-2, -2.5],
+)
+
+# absolute g and g-r of an old ([Fe/H] ~ -1.5), 12 Gyr population in PS1, from the
+# lower main sequence up the red giant branch
+_iso_Mg = np.array([10.0, 8.0, 6.5, 5.5, 4.5, 4.0, 3.6, 3.2, 2.0, 0.5, -1.0, -2.0])
+_iso_gr = np.array([1.15, 0.95, 0.7, 0.5, 0.3, 0.22, 0.3, 0.42, 0.5, 0.62, 0.8, 0.95])
+_iso_mass = np.linspace(0.5, 0.82, len(_iso_Mg))
+
+
+def _poly(coeffs, x):
+    return np.polyval(coeffs, x)
+
+
+def make_track(n=200, stream_name="Synthetic", track_name="synthetic", **kwargs):
+    """
+    A galstreams-like stream track.
+
+    Parameters
+    ----------
+    n : int (optional)
+        Number of points along the track.
+    stream_name, track_name : str (optional)
+    **kwargs
+        Override the entries of ``track_defaults``: the pole and ``ra0`` of the
+        stream frame, the phi1 range, and polynomial coefficients (in phi1) of phi2,
+        the distance modulus and the two (non reflex-corrected) proper motions.
+
+    Returns
+    -------
+    track6d : `types.SimpleNamespace`
+        With the ``stream_name``, ``track_name``, ``stream_frame`` and ``track``
+        attributes of a `galstreams.Track6D` that are used in CATS.
+    """
+    pars = dict(track_defaults, **kwargs)
+
+    stream_frame = GreatCircleICRSFrame.from_pole_ra0(
+        pole=coord.SkyCoord(ra=pars["pole_ra"] * u.deg, dec=pars["pole_dec"] * u.deg),
+        ra0=pars["ra0"] * u.deg,
+    )
+
+    phi1 = np.linspace(*pars["phi1_range"], n)
+    track = coord.SkyCoord(
+        phi1=phi1 * u.deg,
+        phi2=_poly(pars["phi2_coeffs"], phi1) * u.deg,
+        distance=10 ** (_poly(pars["distmod_coeffs"], phi1) / 5 - 2) * u.kpc,
+        pm_phi1_cosphi2=_poly(pars["pm1_coeffs"], phi1) * u.mas / u.yr,
+        pm_phi2=_poly(pars["pm2_coeffs"], phi1) * u.mas / u.yr,
+        radial_velocity=np.zeros(n) * u.km / u.s,
+        frame=stream_frame,
+    )
+
+    return SimpleNamespace(
+        stream_name=stream_name,
+        track_name=track_name,
+        stream_frame=stream_frame,
+        track=track.icrs,
+        pars=pars,
+    )
+
+
+def make_pawprint(track, width=1.0, background_offset=3.0, n=1000):
+    """
+    A `cats.pawprint.pawprint.Pawprint` with stream and background sky footprints
+    along a track from `make_track`, like `Pawprint.pawprint_from_galstreams`.
+
+    Parameters
+    ----------
+    track : `types.SimpleNamespace`
+    width : float (optional)
+        Full width of the footprints in phi2 (deg).
+    background_offset : float (optional)
+        Offset of the background footprint from the track in phi2 (deg).
+    n : int (optional)
+        Number of vertices along each side of the footprints.
+    """
+    pars = track.pars
+    phi1 = np.linspace(*pars["phi1_range"], n)
+    phi2 = _poly(pars["phi2_coeffs"], phi1)
+
+    def _polygon(offset):
+        lon = np.concatenate((phi1, phi1[::-1]))
+        lat = np.concatenate((phi2 - width / 2, phi2[::-1] + width / 2)) + offset
+        return coord.SkyCoord(
+            phi1=lon * u.deg, phi2=lat * u.deg, frame=track.stream_frame
+        )
+
+    data = dict(
+        stream_name=track.stream_name,
+        pawprint_ID=track.track_name,
+        stream_frame=track.stream_frame,
+        width=width,
+        stream_vertices=_polygon(0.0),
+        background_vertices=_polygon(background_offset),
+        cmd_filters=None,
+        cmd_vertices=None,
+        pm_vertices=None,
+        pm1_vertices=None,
+        pm2_vertices=None,
+        track=track,
+    )
+    return Pawprint(data)
+
+
+def isochrone_model(distance_modulus=0.0, n=400):
+    """
+    Closed-form isochrone matching the synthetic stream stars.
+
+    Parameters
+    ----------
+    distance_modulus : float (optional)
+    n : int (optional)
+        Number of points along the isochrone.
+
+    Returns
+    -------
+    color, mag, mass : `numpy.ndarray`
+        g-r color, apparent g magnitude and mass, ordered by increasing mass (as in
+        `cats.CMD.Isochrone`).
+    """
+    mass = np.linspace(_iso_mass[0], _iso_mass[-1], n)
+    mag = np.interp(mass, _iso_mass, _iso_Mg) + distance_modulus
+    color = np.interp(mass, _iso_mass, _iso_gr)
+    return color, mag, mass
+
+
+def _phot_error(mag):
+    # PS1-like photometric errors, see `cats.CMD.Isochrone.get_tolerance`
+    return 0.00363355415 + np.exp((mag - 23.9127145) / 1.09685211)
+
+
+def _faint_weighted_mags(rng, n, low, high, slope=0.3):
+    """Magnitudes with a number density rising as 10**(slope * mag)."""
+    a = 10 ** (slope * low)
+    b = 10 ** (slope * high)
+    return np.log10(a + rng.uniform(size=n) * (b - a)) / slope
+
+
+def make_joined_catalog(
+    n,
+    track=None,
+    stream_frac=0.02,
+    phi2_range=(-10.0, 10.0),
+    stream_width=0.2,
+    pm_dispersion=0.2,
+    maxmag=23.5,
+    seed=42,
+    source_id_offset=0,
+):
+    """
+    Make a synthetic joined catalog of stream and background stars.
+
+    Parameters
+    ----------
+    n : int
+        Number of rows.
+    track : `types.SimpleNamespace` (optional)
+        A track from `make_track`. Defaults to ``make_track()``.
+    stream_frac : float (optional)
+        Fraction of the rows that are stream stars.
+    phi2_range : tuple (optional)
+        The background covers the phi1 range of the track and this phi2 range (deg).
+    stream_width : float (optional)
+        Gaussian width of the stream in phi2 (deg).
+    pm_dispersion : float (optional)
+        Proper motion dispersion of the stream (mas/yr), added to the measurement
+        errors.
+    maxmag : float (optional)
+        Faint limit in g (mag).
+    seed : int (optional)
+    source_id_offset : int (optional)
+        Added to the row number to make ``source_id``, for building a catalog in
+        chunks.
+
+    Returns
+    -------
+    catalog : `astropy.table.Table`
+        Has an ``is_stream`` column with the true stream members.
+    """
+    rng = np.random.default_rng(seed)
+    track = make_track() if track is None else track
+    pars = track.pars
+    phi1_range = pars["phi1_range"]
+
+    n_stream = int(round(stream_frac * n))
+    n_bg = n - n_stream
+
+    # positions
+    phi1 = np.concatenate(
+        (rng.uniform(*phi1_range, n_stream), rng.uniform(*phi1_range, n_bg))
+    )
+    phi2 = np.concatenate(
+        (
+            _poly(pars["phi2_coeffs"], phi1[:n_stream])
+            + rng.normal(0, stream_width, n_stream),
+            rng.uniform(*phi2_range, n_bg),
+        )
+    )
+    distmod = _poly(pars["distmod_coeffs"], phi1)
+    distance = 10 ** (distmod / 5 - 2)
+
+    # photometry: stream stars along the isochrone, the background a mix of a blue
+    # halo turnoff and redder disk dwarfs
+    g = np.empty(n)
+    g_r = np.empty(n)
+    # Salpeter mass function between the ends of the isochrone
+    a, b = _iso_mass[0] ** -1.35, _iso_mass[-1] ** -1.35
+    mass = (a + rng.uniform(size=n_stream) * (b - a)) ** (-1 / 1.35)
+    g[:n_stream] = np.interp(mass, _iso_mass, _iso_Mg) + distmod[:n_stream]
+    g_r[:n_stream] = np.interp(mass, _iso_mass, _iso_gr)
+
+    g[n_stream:] = _faint_weighted_mags(rng, n_bg, 14.0, maxmag + 0.5)
+    halo = rng.uniform(size=n_bg) < 0.4
+    g_r[n_stream:] = np.where(
+        halo, rng.normal(0.3, 0.08, n_bg), rng.uniform(0.35, 1.4, n_bg)
+    )
+
+    g_err = _phot_error(g)
+    r_err = _phot_error(g - g_r)
+    g0 = g + rng.normal(0, 1, n) * g_err
+    r0 = g - g_r + rng.normal(0, 1, n) * r_err
+    i0 = r0 - 0.4 * g_r + rng.normal(0, 1, n) * r_err
+
+    # proper motions (observed, i.e. not reflex corrected) with Gaia-like errors
+    pm_err = 0.02 * 10 ** (0.2 * np.clip(g0 - 15, 0, None))
+    pm1 = np.concatenate(
+        (
+            _poly(pars["pm1_coeffs"], phi1[:n_stream])
+            + rng.normal(0, pm_dispersion, n_stream),
+            rng.normal(-2.0, 5.0, n_bg),
+        )
+    )
+    pm2 = np.concatenate(
+        (
+            _poly(pars["pm2_coeffs"], phi1[:n_stream])
+            + rng.normal(0, pm_dispersion, n_stream),
+            rng.normal(-1.0, 4.0, n_bg),
+        )
+    )
+    pm1 += rng.normal(0, 1, n) * pm_err
+    pm2 += rng.normal(0, 1, n) * pm_err
+
+    # shuffle so stream stars are not a contiguous block
+    order = rng.permutation(n)
+    phi1, phi2, distance, pm1, pm2 = [
+        x[order] for x in (phi1, phi2, distance, pm1, pm2)
+    ]
+    g0, r0, i0, pm_err = [x[order] for x in (g0, r0, i0, pm_err)]
+    is_stream = order < n_stream
+
+    ra, dec, pmra, pmdec = stream_to_icrs(track.stream_frame, phi1, phi2, pm1, pm2)
+    pm1_refl, pm2_refl = reflex_correct_stream(
+        track.stream_frame, phi1, phi2, pm1, pm2, distance
+    )
+
+    pm_unit = u.mas / u.yr
+    catalog = at.Table()
+    catalog["source_id"] = source_id_offset + np.arange(n, dtype=np.int64)
+    catalog["ra"] = ra * u.deg
+    catalog["dec"] = dec * u.deg
+    catalog["parallax"] = (1 / distance + rng.normal(0, 1, n) * pm_err) * u.mas
+    catalog["pmra"] = pmra * pm_unit
+    catalog["pmdec"] = pmdec * pm_unit
+    catalog["pmra_error"] = pm_err * pm_unit
+    catalog["pmdec_error"] = pm_err * pm_unit
+    catalog["phi1"] = phi1 * u.deg
+    catalog["phi2"] = phi2 * u.deg
+    catalog["pm_phi1_cosphi2"] = pm1_refl * pm_unit
+    catalog["pm_phi1_cosphi2_unrefl"] = pm1 * pm_unit
+    catalog["pm_phi2"] = pm2_refl * pm_unit
+    catalog["pm_phi2_unrefl"] = pm2 * pm_unit
+    catalog["star_mask"] = rng.uniform(size=n) > 0.05
+    catalog["g0"] = g0
+    catalog["r0"] = r0
+    catalog["i0"] = i0
+    catalog["is_stream"] = is_stream
+
+    return catalog
+
+
+def write_joined_catalog(path, n, chunk_size=10_000_000, overwrite=False, **kwargs):
+    """
+    Write a synthetic joined catalog to a columnar catalog (see `cats.columnar`) in
+    chunks, so catalogs much larger than memory (1e8 rows and up) can be made.
+
+    Parameters
+    ----------
+    path : str
+    n : int
+        Number of rows.
+    chunk_size : int (optional)
+    overwrite : bool (optional)
+    **kwargs
+        Passed to `make_joined_catalog`. Each chunk gets its own seed, derived from
+        ``seed``.
+
+    Returns
+    -------
+    catalog : `cats.columnar.ColumnarCatalog`
+    """
+    seed = kwargs.pop("seed", 42)
+    track = kwargs.pop("track", None) or make_track()
+
+    with ColumnarWriter(path, overwrite=overwrite) as writer:
+        for i, start in enumerate(range(0, n, chunk_size)):
+            writer.append(
+                make_joined_catalog(
+                    min(chunk_size, n - start),
+                    track=track,
+                    seed=(seed, i),
+                    source_id_offset=start,
+                    **kwargs,
+                )
+            )
+
+    return ColumnarCatalog(path)
+
+
+def split_astro_photo(catalog, overlap_frac=0.95, seed=42):
+    """
+    Split a synthetic joined catalog into the Gaia and (extinction-corrected)
+    photometry inputs of `cats.data._join_astro_photo`, with the photometry shuffled
+    and only partially overlapping in ``source_id``.
+
+    Returns
+    -------
+    gaia_table : `astropy.table.Table`
+        To be wrapped in a `pyia.GaiaData`.
+    phot_data : `types.SimpleNamespace`
+        With the ``data`` attribute and the ``get_ext_corrected_phot`` and
+        ``get_star_mask`` methods of a `cats.photometry.PhotometricSurvey`.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(catalog)
+
+    gaia_cols = ["source_id", "ra", "dec", "parallax", "pmra", "pmdec"]
+    gaia_cols += ["pmra_error", "pmdec_error"]
+    gaia_table = at.Table([catalog[name] for name in gaia_cols])
+
+    rows = rng.permutation(n)[: int(overlap_frac * n)]
+    phot = at.Table({"source_id": np.asarray(catalog["source_id"])[rows]})
+    ext = at.Table({b: np.asarray(catalog[b])[rows] for b in ["g0", "r0", "i0"]})
+    star_mask = np.asarray(catalog["star_mask"])[rows]
+
+    phot_data = SimpleNamespace(
+        data=phot,
+        get_ext_corrected_phot=lambda: ext.copy(),
+        get_star_mask=lambda: star_mask,
+    )
+    return gaia_table, phot_data
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--n", type=float, required=True, help="number of rows")
+    parser.add_argument("--output", required=True, help="columnar catalog path")
+    parser.add_argument("--chunk-size", type=float, default=1e7)
+    parser.add_argument("--stream-frac", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    catalog = write_joined_catalog(
+        args.output,
+        int(args.n),
+        chunk_size=int(args.chunk_size),
+        overwrite=args.overwrite,
+        stream_frac=args.stream_frac,
+        seed=args.seed,
+    )
+    print(f"Wrote {len(catalog)} rows to {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
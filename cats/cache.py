@@ -0,0 +1,97 @@
+"""
+Helpers for the on-disk caches that are shared across surveys, streams and runs
+"""
+import os
+import time
+
+__all__ = ["get_cache_dir", "prune", "touch", "temp_suffix"]
+
+_default_cache_dir = os.path.join("~", ".cache", "cats")
+
+# suffix of the temporary files that cache entries are written to before being
+# renamed into place
+temp_suffix = ".tmp"
+
+
+def get_cache_dir(name=None):
+    """
+    Get (and create) the root cache directory, or a named subdirectory of it.
+
+    The root defaults to ``~/.cache/cats`` and can be changed with the
+    ``CATS_CACHE_DIR`` environment variable, e.g. to point at local scratch disk.
+
+    Parameters
+    ----------
+    name : str (optional)
+        Name of the subdirectory for a specific cache.
+
+    Returns
+    -------
+    path : str
+    """
+    path = os.path.expanduser(os.environ.get("CATS_CACHE_DIR", _default_cache_dir))
+    if name is not None:
+        path = os.path.join(path, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def touch(path):
+    """Mark a cache entry as used, for the least-recently-used order of `prune`."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def prune(path, max_bytes, keep=(), temp_grace=3600.0):
+    """
+    Delete the least recently used files in a cache directory until the total size
+    is at most ``max_bytes``.
+
+    Files are ordered by modification time, which `touch` updates when an entry is
+    used (access times are often not recorded on scratch disks). Temporary files
+    (ending in ``temp_suffix``) may still be written by another process, so they
+    are only deleted once they are older than ``temp_grace``, e.g. when left behind
+    by a run that was killed.
+
+    Parameters
+    ----------
+    path : str
+        Cache directory.
+    max_bytes : int
+    keep : iterable of str (optional)
+        Files that are never deleted, e.g. an entry that was just written.
+    temp_grace : float (optional)
+        Age in seconds after which temporary files are deleted like other files.
+
+    Returns
+    -------
+    removed : list of str
+        The deleted files.
+    """
+    keep = {os.path.abspath(f) for f in keep}
+    now = time.time()
+    entries = []
+    for entry in os.scandir(path):
+        if entry.is_file():
+            stat = entry.stat()
+            if entry.name.endswith(temp_suffix) and now - stat.st_mtime < temp_grace:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, os.path.abspath(entry.path)))
+
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, fname in sorted(entries):
+        if total <= max_bytes:
+            break
+        if fname in keep:
+            continue
+        try:
+            os.remove(fname)
+        except FileNotFoundError:
+            # already removed by another run
+            pass
+        total -= size
+        removed.append(fname)
+    return removed
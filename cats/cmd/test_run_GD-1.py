@@ -1,19 +1,19 @@
 import sys
 
-import astropy.table as at
 import galstreams
 import matplotlib.pyplot as plt
 from astropy.coordinates import SkyCoord
 from CMD import Isochrone
 
 sys.path.append("/Users/Tavangar/CATS_workshop/cats/")
+from cats.columnar import read_joined
 from cats.data import make_astro_photo_joined_data
 from cats.pawprint.pawprint import Footprint2D, Pawprint
 
 
 def main() -> int:
     fn = "/Users/Tavangar/CATS_workshop/cats/data/joined-GD-1.fits"
-    cat = at.Table.read(fn)
+    cat = read_joined(fn)
 
     p = Pawprint.pawprint_from_galstreams("GD-1", "pricewhelan2018")
 
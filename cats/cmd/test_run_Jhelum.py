@@ -1,11 +1,12 @@
-import astropy.table as at
 import matplotlib.pyplot as plt
 from CMD import Isochrone
 
+from cats.columnar import read_joined
+
 
 def main() -> int:
     fn = "./joined-Jhelum.fits"
-    cat = at.Table.read(fn)
+    cat = read_joined(fn)
 
     sky_poly = [
         [-5, -2],
@@ -1,11 +1,12 @@
-import astropy.table as at
 import matplotlib.pyplot as plt
 from CMD import Isochrone
 
+from cats.columnar import read_joined
+
 
 def main() -> int:
     fn = "./joined-Pal5.fits"
-    cat = at.Table.read(fn)
+    cat = read_joined(fn)
 
     sky_poly = [[-20, -1], [10, -1], [10, 1], [-20, 1]]
 
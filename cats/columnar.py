@@ -0,0 +1,315 @@
+"""
+Memory-mapped columnar storage for joined stream catalogs.
+
+A columnar catalog is a directory with one raw binary file per column and a small
+JSON header (``meta.json``) with the number of rows and the name, dtype, shape and
+unit of each column. Columns are memory-mapped the first time they are accessed, so
+opening a catalog is cheap and columns (or pages of columns) that are never used are
+never read from disk.
+"""
+import json
+import os
+
+import astropy.table as at
+import astropy.units as u
+import numpy as np
+
+__all__ = ["ColumnarWriter", "ColumnarCatalog", "write_columnar", "read_joined"]
+
+_meta_filename = "meta.json"
+
+
+def _json_safe(meta):
+    safe = {}
+    for k, v in meta.items():
+        try:
+            json.dumps(v)
+        except TypeError:
+            v = str(v)
+        safe[str(k)] = v
+    return safe
+
+
+class ColumnarWriter:
+    """
+    Write a columnar catalog by appending tables (e.g., joined chunks) one at a time.
+
+    All appended tables must have the same columns as the first one, with dtypes
+    that can be safely cast to the first table's. A column gets a mask as soon as
+    one table has a mask for it, and string columns are widened to the longest
+    string. The header is written by `close`, so use this as a context manager::
+
+        with ColumnarWriter("joined-GD-1.cols") as writer:
+            for chunk in chunks:
+                writer.append(chunk)
+
+    If an exception is raised in the ``with`` block, the header is not written and
+    the column files are removed (see `discard`), so a partial catalog is never
+    readable.
+
+    Parameters
+    ----------
+    path : str
+        Output directory.
+    overwrite : bool (optional)
+        Overwrite an existing catalog at ``path``.
+    """
+
+    def __init__(self, path, overwrite=False):
+        meta_file = os.path.join(path, _meta_filename)
+        if os.path.exists(meta_file):
+            if not overwrite:
+                raise OSError(f"Columnar catalog {path} already exists.")
+            # so a partially overwritten catalog is never readable
+            os.remove(meta_file)
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.nrows = 0
+        self.columns = None
+        self.meta = {}
+
+    def _column_file(self, name, ext="bin"):
+        return os.path.join(self.path, f"{name}.{ext}")
+
+    def append(self, table):
+        """
+        Append the rows of an `astropy.table.Table` to the catalog.
+        """
+        if self.columns is None:
+            self.columns = []
+            for name in table.colnames:
+                col = table[name]
+                self.columns.append(
+                    dict(
+                        name=name,
+                        dtype=col.dtype.str,
+                        shape=list(col.shape[1:]),
+                        unit=None if col.unit is None else col.unit.to_string(),
+                        masked=bool(getattr(col, "mask", None) is not None),
+                    )
+                )
+                # truncate any files left over from an overwritten catalog
+                open(self._column_file(name), "wb").close()
+                if self.columns[-1]["masked"]:
+                    open(self._column_file(name, "mask"), "wb").close()
+            self.meta = _json_safe(table.meta)
+
+        elif table.colnames != [c["name"] for c in self.columns]:
+            raise ValueError("Appended table columns do not match the catalog columns.")
+        else:
+            for info in self.columns:
+                self._match_column(info, table[info["name"]])
+
+        for info in self.columns:
+            col = table[info["name"]]
+            data = np.asarray(col, dtype=info["dtype"])
+            if info["masked"]:
+                mask = np.broadcast_to(np.ma.getmaskarray(col), col.shape)
+                if hasattr(col, "filled"):
+                    data = np.asarray(col.filled(), dtype=info["dtype"])
+                with open(self._column_file(info["name"], "mask"), "ab") as f:
+                    f.write(np.ascontiguousarray(mask).tobytes())
+            with open(self._column_file(info["name"]), "ab") as f:
+                f.write(np.ascontiguousarray(data).tobytes())
+
+        self.nrows += len(table)
+
+    def _match_column(self, info, col):
+        name = info["name"]
+        if list(col.shape[1:]) != info["shape"]:
+            raise ValueError(f"Appended column {name} has a different shape.")
+
+        dtype = np.dtype(info["dtype"])
+        if col.dtype.kind in "SU" and col.dtype.kind == dtype.kind:
+            if col.dtype.itemsize > dtype.itemsize:
+                # rewrite the rows written so far with the wider strings
+                fname = self._column_file(name)
+                np.fromfile(fname, dtype=dtype).astype(col.dtype).tofile(fname)
+                info["dtype"] = col.dtype.str
+        elif not np.can_cast(col.dtype, dtype, casting="safe"):
+            raise ValueError(
+                f"Appended column {name} of dtype {col.dtype} cannot be safely cast "
+                f"to the catalog dtype {dtype}."
+            )
+
+        if not info["masked"] and getattr(col, "mask", None) is not None:
+            # nothing was masked in the rows written so far
+            n = self.nrows * int(np.prod(info["shape"], dtype=int))
+            with open(self._column_file(name, "mask"), "wb") as f:
+                f.write(bytes(n))
+            info["masked"] = True
+
+    def discard(self):
+        """
+        Remove the column files written so far, without writing the header.
+        """
+        for info in self.columns or []:
+            for ext in ["bin", "mask"]:
+                fname = self._column_file(info["name"], ext)
+                if os.path.exists(fname):
+                    os.remove(fname)
+        self.columns = None
+        self.nrows = 0
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Write the header. The catalog is only readable once this has been called.
+        """
+        header = dict(nrows=self.nrows, columns=self.columns or [], meta=self.meta)
+        with open(os.path.join(self.path, _meta_filename), "w") as f:
+            json.dump(header, f, indent=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def write_columnar(table, path, overwrite=False):
+    """
+    Write an `astropy.table.Table` to a columnar catalog at ``path``.
+    """
+    with ColumnarWriter(path, overwrite=overwrite) as writer:
+        writer.append(table)
+
+
+class ColumnarCatalog:
+    """
+    Read-only, lazily memory-mapped view of a columnar catalog.
+
+    Indexing works as for an `astropy.table.Table`, so it can be used in its place,
+    e.g. by `cats.CMD.Isochrone` and `cats.proper_motions.ProperMotionSelection`: a
+    column name returns that column as an `astropy.table.Column` (or
+    `astropy.table.MaskedColumn`), with its unit, that is a view of the memory-mapped
+    file; a list of column names returns an `astropy.table.Table` with those
+    columns; and rows (a boolean mask, integer array or slice) return an
+    `astropy.table.Table` with those rows. Columns can be added with
+    ``catalog[name] = values``, but they are only kept in memory.
+
+    Parameters
+    ----------
+    path : str
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, _meta_filename)) as f:
+            header = json.load(f)
+
+        self.path = path
+        self.nrows = header["nrows"]
+        self.meta = header["meta"]
+        self._info = {c["name"]: c for c in header["columns"]}
+        self._cache = {}
+
+    @property
+    def colnames(self):
+        return list(self._info.keys())
+
+    def keys(self):
+        return self.colnames
+
+    def __len__(self):
+        return self.nrows
+
+    def __contains__(self, name):
+        return name in self._info
+
+    def _map(self, name, ext, dtype, shape):
+        filename = os.path.join(self.path, f"{name}.{ext}")
+        if self.nrows == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode="r", shape=shape)
+
+    def _column(self, name):
+        if name not in self._cache:
+            info = self._info[name]
+            shape = (self.nrows,) + tuple(info["shape"])
+            data = self._map(name, "bin", np.dtype(info["dtype"]), shape)
+            unit = self.unit(name)
+            if info["masked"]:
+                mask = self._map(name, "mask", bool, shape)
+                col = at.MaskedColumn(data, name=name, mask=mask, unit=unit, copy=False)
+            else:
+                col = at.Column(data, name=name, unit=unit, copy=False)
+            self._cache[name] = col
+        return self._cache[name]
+
+    def unit(self, name):
+        unit = self._info[name]["unit"]
+        return None if unit is None else u.Unit(unit)
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return self._column(item)
+        if (
+            isinstance(item, (list, tuple))
+            and len(item) > 0
+            and all(isinstance(name, str) for name in item)
+        ):
+            return self.to_table(columns=list(item))
+        if np.ndim(item) == 0 and not isinstance(item, slice):
+            return self.to_table(rows=[item])[0]
+        return self.to_table(rows=item)
+
+    def __setitem__(self, name, value):
+        """
+        Add (or replace) a column, e.g. values derived from the catalog that later
+        stages reuse. The column is kept in memory and not written to ``path``.
+        """
+        if hasattr(value, "mask"):
+            col = at.MaskedColumn(value, name=name)
+        else:
+            col = at.Column(value, name=name)
+        if len(col) != self.nrows:
+            raise ValueError(
+                f"Column {name} has {len(col)} rows, but the catalog has {self.nrows}."
+            )
+        self._info[name] = dict(
+            name=name,
+            dtype=col.dtype.str,
+            shape=list(col.shape[1:]),
+            unit=None if col.unit is None else col.unit.to_string(),
+            masked=isinstance(col, at.MaskedColumn),
+        )
+        self._cache[name] = col
+
+    def to_table(self, rows=None, columns=None):
+        """
+        Load (a subset of) the catalog into an `astropy.table.Table`.
+
+        Parameters
+        ----------
+        rows : array-like, slice (optional)
+            Boolean mask, integer indices or slice of rows to load. Defaults to all.
+        columns : list of str (optional)
+            Columns to load. Defaults to all.
+        """
+        if columns is None:
+            columns = self.colnames
+        if rows is None:
+            rows = slice(None)
+
+        tbl = at.Table(meta=dict(self.meta))
+        for name in columns:
+            col_cls = at.MaskedColumn if self._info[name]["masked"] else at.Column
+            tbl[name] = col_cls(self._column(name)[rows], unit=self.unit(name))
+        return tbl
+
+
+def read_joined(path):
+    """
+    Open a joined stream catalog: a `ColumnarCatalog` if ``path`` is a columnar
+    catalog directory, otherwise read with `astropy.table.Table.read`.
+    """
+    if os.path.isdir(path):
+        return ColumnarCatalog(path)
+    return at.Table.read(path)
@@ -3,7 +3,273 @@ Assumptions and helpers for working with coordinates
 """
 import astropy.coordinates as coord
 import astropy.units as u
+import numpy as np
 
 galcen_frame = coord.Galactocentric(
     galcen_distance=8.275 * u.kpc, galcen_v_sun=[8.4, 251.8, 8.4] * u.km / u.s
 )
+
+# km/s per kpc mas/yr
+_k = (1 * u.kpc * u.mas / u.yr).to_value(u.km / u.s, u.dimensionless_angles())
+
+_rotation_matrix_cache = {}
+_solar_velocity_cache = {}
+
+
+def _attribute_key(value):
+    # full-precision, hashable form of a frame attribute (the reprs of coordinates
+    # and quantities are rounded)
+    if isinstance(value, coord.SkyCoord):
+        value = value.frame
+    if isinstance(value, coord.BaseCoordinateFrame):
+        data = _attribute_key(value.data) if value.has_data else None
+        return _frame_key(value) + (data,)
+    if isinstance(value, coord.BaseRepresentationOrDifferential):
+        components = tuple(_attribute_key(getattr(value, c)) for c in value.components)
+        differentials = tuple(
+            (k, _attribute_key(d))
+            for k, d in sorted(getattr(value, "differentials", {}).items())
+        )
+        return (value.__class__.__name__,) + components + differentials
+    if isinstance(value, u.Quantity):
+        return (value.unit.to_string(), tuple(np.ravel(value.value).tolist()))
+    return repr(value)
+
+
+def _frame_key(frame):
+    return (frame.__class__.__name__,) + tuple(
+        _attribute_key(getattr(frame, name)) for name in sorted(frame.frame_attributes)
+    )
+
+
+def get_rotation_matrix(stream_frame):
+    """
+    Get the (cached) 3x3 rotation matrix from ICRS Cartesian coordinates to Cartesian
+    coordinates in a stream frame, e.g., a `gala.coordinates.GreatCircleICRSFrame`.
+
+    The matrix is computed once per frame by transforming the ICRS unit vectors with
+    astropy, so it works for any frame that is a pure rotation of ICRS.
+
+    Parameters
+    ----------
+    stream_frame : `astropy.coordinates.BaseCoordinateFrame`
+
+    Returns
+    -------
+    R : `numpy.ndarray`
+        Shape ``(3, 3)``.
+    """
+    key = _frame_key(stream_frame)
+    if key not in _rotation_matrix_cache:
+        unit_vectors = coord.SkyCoord(
+            ra=[0.0, 90.0, 0.0] * u.deg, dec=[0.0, 0.0, 90.0] * u.deg, frame="icrs"
+        )
+        rotated = unit_vectors.transform_to(stream_frame)
+        R = rotated.represent_as(coord.UnitSphericalRepresentation).to_cartesian()
+        _rotation_matrix_cache[key] = R.xyz.value
+    return _rotation_matrix_cache[key]
+
+
+def _tangent_basis(lon, lat):
+    """
+    Unit vectors along increasing longitude and latitude at the given positions (in
+    radians), each with shape ``(3, N)``.
+    """
+    sin_lon, cos_lon = np.sin(lon), np.cos(lon)
+    sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+    e_lon = np.stack((-sin_lon, cos_lon, np.zeros_like(lon)))
+    e_lat = np.stack((-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat))
+    return e_lon, e_lat
+
+
+def icrs_to_stream(stream_frame, ra, dec, pmra=None, pmdec=None):
+    """
+    Rotate ICRS positions and (optionally) proper motions into a stream frame with
+    plain NumPy matrix products, without going through `astropy.coordinates.SkyCoord`.
+
+    Agrees with ``SkyCoord.transform_to(stream_frame)`` to better than 1e-9 deg in
+    (phi1, phi2) and 1e-9 mas/yr in the proper motions.
+
+    Parameters
+    ----------
+    stream_frame : `astropy.coordinates.BaseCoordinateFrame`
+        A frame that is a pure rotation of ICRS, such as a
+        `gala.coordinates.GreatCircleICRSFrame`.
+    ra, dec : array-like or `astropy.units.Quantity`
+        ICRS coordinates, in degrees if not a Quantity.
+    pmra, pmdec : array-like or `astropy.units.Quantity` (optional)
+        ICRS proper motions (``pmra`` includes the cos(dec) factor), in mas/yr if not
+        a Quantity.
+
+    Returns
+    -------
+    phi1, phi2 : `numpy.ndarray`
+        Stream coordinates in degrees, with phi1 wrapped to [-180, 180).
+    pm_phi1_cosphi2, pm_phi2 : `numpy.ndarray`
+        Stream-frame proper motions in mas/yr. Only returned if ``pmra`` and
+        ``pmdec`` are passed in.
+    """
+    R = get_rotation_matrix(stream_frame)
+
+    ra = np.radians(u.Quantity(ra, u.deg).value)
+    dec = np.radians(u.Quantity(dec, u.deg).value)
+    cos_dec = np.cos(dec)
+    xyz = np.stack((cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)))
+
+    x, y, z = R @ xyz.reshape(3, -1)
+    phi1 = np.arctan2(y, x)
+    phi2 = np.arcsin(np.clip(z, -1, 1))
+
+    phi1_deg = np.degrees(phi1)
+    phi1_deg = (phi1_deg + 180.0) % 360.0 - 180.0
+    phi1_deg = phi1_deg.reshape(np.shape(ra))
+    phi2_deg = np.degrees(phi2).reshape(np.shape(ra))
+
+    if pmra is None or pmdec is None:
+        return phi1_deg, phi2_deg
+
+    pmra = u.Quantity(pmra, u.mas / u.yr).value
+    pmdec = u.Quantity(pmdec, u.mas / u.yr).value
+    e_ra, e_dec = _tangent_basis(ra.ravel(), dec.ravel())
+    v = R @ (np.ravel(pmra) * e_ra + np.ravel(pmdec) * e_dec)
+
+    e_phi1, e_phi2 = _tangent_basis(phi1, phi2)
+    pm_phi1_cosphi2 = np.einsum("ij,ij->j", v, e_phi1).reshape(np.shape(ra))
+    pm_phi2 = np.einsum("ij,ij->j", v, e_phi2).reshape(np.shape(ra))
+
+    return phi1_deg, phi2_deg, pm_phi1_cosphi2, pm_phi2
+
+
+def stream_to_icrs(stream_frame, phi1, phi2, pm_phi1_cosphi2=None, pm_phi2=None):
+    """
+    Inverse of `icrs_to_stream`: rotate stream-frame positions and (optionally)
+    proper motions back to ICRS.
+
+    Parameters
+    ----------
+    stream_frame : `astropy.coordinates.BaseCoordinateFrame`
+        A frame that is a pure rotation of ICRS.
+    phi1, phi2 : array-like
+        Stream coordinates, in degrees.
+    pm_phi1_cosphi2, pm_phi2 : array-like (optional)
+        Stream-frame proper motions, in mas/yr.
+
+    Returns
+    -------
+    ra, dec : `numpy.ndarray`
+        ICRS coordinates in degrees, with ra wrapped to [0, 360).
+    pmra, pmdec : `numpy.ndarray`
+        ICRS proper motions in mas/yr (``pmra`` includes the cos(dec) factor). Only
+        returned if ``pm_phi1_cosphi2`` and ``pm_phi2`` are passed in.
+    """
+    R = get_rotation_matrix(stream_frame)
+
+    phi1 = np.radians(np.asarray(phi1, dtype=float))
+    phi2 = np.radians(np.asarray(phi2, dtype=float))
+    cos_phi2 = np.cos(phi2)
+    xyz = np.stack((cos_phi2 * np.cos(phi1), cos_phi2 * np.sin(phi1), np.sin(phi2)))
+
+    x, y, z = R.T @ xyz.reshape(3, -1)
+    ra = np.arctan2(y, x)
+    dec = np.arcsin(np.clip(z, -1, 1))
+
+    ra_deg = (np.degrees(ra) % 360.0).reshape(phi1.shape)
+    dec_deg = np.degrees(dec).reshape(phi1.shape)
+
+    if pm_phi1_cosphi2 is None or pm_phi2 is None:
+        return ra_deg, dec_deg
+
+    e_phi1, e_phi2 = _tangent_basis(phi1.ravel(), phi2.ravel())
+    v = R.T @ (np.ravel(pm_phi1_cosphi2) * e_phi1 + np.ravel(pm_phi2) * e_phi2)
+
+    e_ra, e_dec = _tangent_basis(ra, dec)
+    pmra = np.einsum("ij,ij->j", v, e_ra).reshape(phi1.shape)
+    pmdec = np.einsum("ij,ij->j", v, e_dec).reshape(phi1.shape)
+
+    return ra_deg, dec_deg, pmra, pmdec
+
+
+def skycoord_to_stream(c, stream_frame):
+    """
+    Fast-path stream coordinates (phi1, phi2) in degrees for a
+    `astropy.coordinates.SkyCoord`. See `icrs_to_stream`.
+    """
+    c = c.icrs
+    return icrs_to_stream(stream_frame, c.ra, c.dec)
+
+
+def get_solar_velocity(galactocentric_frame=galcen_frame):
+    """
+    Get the (cached) velocity of the sun relative to the Galactic center at rest, as a
+    Cartesian vector in the ICRS axes.
+
+    Parameters
+    ----------
+    galactocentric_frame : `astropy.coordinates.Galactocentric` (optional)
+        Defaults to `cats.coords.galcen_frame`.
+
+    Returns
+    -------
+    v_sun : `numpy.ndarray`
+        Shape ``(3,)``, in km/s.
+    """
+    key = _frame_key(galactocentric_frame)
+    if key not in _solar_velocity_cache:
+        # the Galactic center, at rest, appears to move at -v_sun as seen from the sun
+        rep = coord.CartesianRepresentation(
+            [0.0, 0.0, 0.0] * u.kpc,
+            differentials=coord.CartesianDifferential([0.0, 0.0, 0.0] * u.km / u.s),
+        )
+        center = galactocentric_frame.realize_frame(rep).transform_to(coord.ICRS())
+        _solar_velocity_cache[key] = -center.velocity.d_xyz.to_value(u.km / u.s)
+    return _solar_velocity_cache[key]
+
+
+def reflex_correct_stream(
+    stream_frame,
+    phi1,
+    phi2,
+    pm_phi1_cosphi2,
+    pm_phi2,
+    distance,
+    galactocentric_frame=galcen_frame,
+):
+    """
+    Correct stream-frame proper motions for the solar reflex motion with plain NumPy
+    array operations.
+
+    This is equivalent to `gala.coordinates.reflex_correct` with zero radial velocity:
+    the solar velocity is projected onto the sky at each star and divided by the
+    (predicted) distance to get the proper motion it induces.
+
+    Parameters
+    ----------
+    stream_frame : `astropy.coordinates.BaseCoordinateFrame`
+        A frame that is a pure rotation of ICRS, such as a
+        `gala.coordinates.GreatCircleICRSFrame`.
+    phi1, phi2 : array-like
+        Stream coordinates, in degrees.
+    pm_phi1_cosphi2, pm_phi2 : array-like
+        Observed stream-frame proper motions, in mas/yr.
+    distance : array-like or `astropy.units.Quantity`
+        Distance to each star, in kpc if not a Quantity.
+    galactocentric_frame : `astropy.coordinates.Galactocentric` (optional)
+        Sets the solar velocity. Defaults to `cats.coords.galcen_frame`.
+
+    Returns
+    -------
+    pm_phi1_cosphi2, pm_phi2 : `numpy.ndarray`
+        Reflex-corrected proper motions, in mas/yr.
+    """
+    v_sun = get_rotation_matrix(stream_frame) @ get_solar_velocity(galactocentric_frame)
+
+    phi1 = np.radians(np.asarray(phi1, dtype=float))
+    phi2 = np.radians(np.asarray(phi2, dtype=float))
+    distance = u.Quantity(distance, u.kpc).value
+
+    e_phi1, e_phi2 = _tangent_basis(phi1.ravel(), phi2.ravel())
+    scale = 1 / (_k * np.ravel(distance))
+    dpm1 = (v_sun @ e_phi1 * scale).reshape(phi1.shape)
+    dpm2 = (v_sun @ e_phi2 * scale).reshape(phi2.shape)
+
+    return pm_phi1_cosphi2 + dpm1, pm_phi2 + dpm2
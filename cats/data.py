@@ -1,41 +1,61 @@
+from concurrent.futures import ProcessPoolExecutor
+
 import astropy.table as at
 import astropy.units as u
-import gala.coordinates as gc
 import numpy as np
-import scipy.interpolate as sci
+from pyia import GaiaData
+
+from cats.columnar import ColumnarCatalog, ColumnarWriter, write_columnar
+from cats.coords import icrs_to_stream, reflex_correct_stream
+from cats.distance import DistanceTrack
+from cats.healpix import add_healpix_index
 
 
-def make_astro_photo_joined_data(gaia_data, phot_data, track6d):
+def _get_distance_interpolator(track6d):
     """
+    Build the stream frame and an interpolator for the predicted distance along the
+    galstreams track.
+
     Parameters
     ----------
-    gaia_data : `pyia.GaiaData`
-    phot_data : `cats.photometry.PhotometricSurvey`
     track6d : `galstreams.Track6D`
 
+    Returns
+    -------
+    stream_fr : `gala.coordinates.GreatCircleICRSFrame`
+    dist_interp : callable
+        Predicted distance (in units of ``dist_unit``) as a function of phi1 in
+        degrees.
+    dist_unit : `astropy.units.Unit`
+        The unit of the track distances.
+    distmod_key : str
+        The key of the `cats.distance.DistanceTrack` of the interpolator.
     """
-    stream_fr = track6d.stream_frame
-
-    track = track6d.track.transform_to(stream_fr)
-    if np.all(track.distance.value == 0):
-        raise ValueError(
-            "A distance track is required: this stream has no distance information in "
-            "the galstreams track."
-        )
-
-    # interpolator to get predicted distance from phi1
-    dist_interp = sci.InterpolatedUnivariateSpline(
-        track.phi1.degree, track.distance.value, k=1
+    # linear interpolation of the distance along the track
+    distance_track = DistanceTrack.from_track6d(track6d, k=1)
+    return (
+        track6d.stream_frame,
+        distance_track.distance_spline,
+        distance_track.distance_unit,
+        distance_track.key,
     )
 
+
+def _join_astro_photo(
+    gaia_data, phot_data, stream_fr, dist_interp, dist_unit, distmod_key
+):
+    """
+    Transform, reflex correct, extinction correct and join a single block of Gaia and
+    photometric data. See `make_astro_photo_joined_data` for details.
+    """
     # get stream coordinates for all stars, and reflex correct with predicted distance
-    _c_tmp = gaia_data.get_skycoord(distance=False).transform_to(stream_fr)
-    c = gaia_data.get_skycoord(
-        distance=dist_interp(_c_tmp.phi1.degree) * track.distance.unit,
-        radial_velocity=0 * u.km / u.s,
+    phi1, phi2, pm1, pm2 = icrs_to_stream(
+        stream_fr, gaia_data.ra, gaia_data.dec, gaia_data.pmra, gaia_data.pmdec
+    )
+    distance = dist_interp(phi1) * dist_unit
+    pm1_refl, pm2_refl = reflex_correct_stream(
+        stream_fr, phi1, phi2, pm1, pm2, distance
     )
-    c_stream = c.transform_to(stream_fr)
-    c_stream_refl = gc.reflex_correct(c_stream)
 
     # get extinction-corrected photometry and star/galaxy mask
     ext = phot_data.get_ext_corrected_phot()
@@ -43,16 +63,304 @@ def make_astro_photo_joined_data(gaia_data, phot_data, track6d):
 
     # start building the final joined table
     joined = gaia_data.data.copy()
-    for name in ["phi1", "phi2", "pm_phi1_cosphi2", "pm_phi2"]:
-        joined[name] = getattr(c_stream_refl, name)
-        if name not in ["phi1", "phi2"]:
-            joined[f"{name}_unrefl"] = getattr(c_stream, name)
+    pm_unit = u.mas / u.yr
+    joined["phi1"] = phi1 * u.deg
+    joined["phi2"] = phi2 * u.deg
+    joined["pm_phi1_cosphi2"] = pm1_refl * pm_unit
+    joined["pm_phi1_cosphi2_unrefl"] = pm1 * pm_unit
+    joined["pm_phi2"] = pm2_refl * pm_unit
+    joined["pm_phi2_unrefl"] = pm2 * pm_unit
+    # as from cats.distance.DistanceTrack.add_distmod_column, so it is reused
+    joined["distmod"] = 5 * np.log10(distance.to_value(u.pc)) - 5
+    joined.meta["distmod_key"] = distmod_key
 
     phot_full = at.hstack([phot_data.data, ext])
-    cols = ["source_id", "star_mask"] + [b for b in ext.colnames if b.endswith("0")]
+    cols = ["source_id", "star_mask"] + [
+        b for b in ext.colnames if b.endswith(("0", "0_err"))
+    ]
     phot_min = phot_full[cols]
 
-    joined = at.join(joined, phot_min, keys="source_id")
-    joined = at.unique(joined, keys="source_id")
+    return join_on_source_id(joined, phot_min)
+
+
+def match_source_ids(left_ids, right_ids):
+    """
+    Find the rows of two catalogs that share an integer ``source_id``.
+
+    This is a sort-based inner join on int64 keys: each key array is sorted once,
+    duplicate keys are reduced to their first occurrence, and the two sorted key
+    sets are intersected.
+
+    Parameters
+    ----------
+    left_ids : array-like
+    right_ids : array-like
+
+    Returns
+    -------
+    left_idx : `numpy.ndarray`
+        Row indices into the left catalog, sorted by ``source_id``.
+    right_idx : `numpy.ndarray`
+        Row indices into the right catalog, aligned with ``left_idx``.
+    """
+    left_ids = np.asarray(left_ids, dtype=np.int64)
+    right_ids = np.asarray(right_ids, dtype=np.int64)
+
+    # np.unique uses a stable sort, so return_index gives the first occurrence
+    left_uniq, left_first = np.unique(left_ids, return_index=True)
+    right_uniq, right_first = np.unique(right_ids, return_index=True)
+
+    _, left_match, right_match = np.intersect1d(
+        left_uniq, right_uniq, assume_unique=True, return_indices=True
+    )
+    return left_first[left_match], right_first[right_match]
+
+
+def join_on_source_id(left, right, keys="source_id", table_names=["1", "2"]):
+    """
+    Inner join two tables on an integer ``source_id`` column, keeping one row per
+    ``source_id``.
+
+    This is equivalent to ``astropy.table.unique(astropy.table.join(left, right,
+    keys=keys), keys=keys)``, but only builds the output table once from the
+    aligned column arrays. Of rows with the same ``source_id`` (e.g., from
+    overlapping tiles), the first in each table is kept, whereas astropy keeps an
+    unspecified one, so the two only agree if such rows are identical.
+
+    Parameters
+    ----------
+    left : `astropy.table.Table`
+    right : `astropy.table.Table`
+    keys : str (optional)
+        Name of the integer column to join on.
+    table_names : list of str (optional)
+        Suffixes appended to column names that appear in both tables, as in
+        `astropy.table.join`.
+
+    Returns
+    -------
+    joined : `astropy.table.Table`
+        Sorted by ``keys``.
+    """
+    left_idx, right_idx = match_source_ids(left[keys], right[keys])
+
+    cols = {}
+    for name in left.colnames:
+        out_name = name
+        if name != keys and name in right.colnames:
+            out_name = f"{name}_{table_names[0]}"
+        cols[out_name] = left[name][left_idx]
+
+    for name in right.colnames:
+        if name == keys:
+            continue
+        out_name = name
+        if name in left.colnames:
+            out_name = f"{name}_{table_names[1]}"
+        cols[out_name] = right[name][right_idx]
+
+    meta = dict(left.meta)
+    meta.update(right.meta)
+    return at.Table(cols, meta=meta, copy=False)
+
+
+def make_astro_photo_joined_data(
+    gaia_data,
+    phot_data,
+    track6d,
+    output_path=None,
+    overwrite=False,
+    healpix_nside=None,
+):
+    """
+    Parameters
+    ----------
+    gaia_data : `pyia.GaiaData`
+    phot_data : `cats.photometry.PhotometricSurvey`
+    track6d : `galstreams.Track6D`
+    output_path : str (optional)
+        If given, also write the joined table to a memory-mappable columnar catalog
+        at this path (see `cats.columnar`).
+    overwrite : bool (optional)
+        Overwrite an existing catalog at ``output_path``.
+    healpix_nside : int (optional)
+        If given, sort the joined table by HEALPix pixel in the stream frame and
+        store the index with it (see `cats.healpix.add_healpix_index`).
+
+    """
+    dist_args = _get_distance_interpolator(track6d)
+    joined = _join_astro_photo(gaia_data, phot_data, *dist_args)
+
+    if healpix_nside is not None:
+        joined = add_healpix_index(joined, healpix_nside)
+
+    if output_path is not None:
+        write_columnar(joined, output_path, overwrite=overwrite)
+
+    return joined
+
+
+def iter_tile_chunks(gaia_files, phot_files, phot_cls):
+    """
+    Lazily read matched pairs of Gaia and photometry tiles (e.g., the ``poly_XX.fits``
+    files written by the Gaia download notebook), one pair at a time.
+
+    Parameters
+    ----------
+    gaia_files : iterable of str
+    phot_files : iterable of str
+        Photometry files, in the same order as ``gaia_files``.
+    phot_cls : subclass of `cats.photometry.PhotometricSurvey`
+
+    Yields
+    ------
+    gaia_data : `pyia.GaiaData`
+    phot_data : `cats.photometry.PhotometricSurvey`
+    """
+    for gaia_file, phot_file in zip(gaia_files, phot_files):
+        yield GaiaData(gaia_file), phot_cls(phot_file)
+
+
+def make_astro_photo_joined_data_chunked(chunks, track6d, output_path, overwrite=False):
+    """
+    Bounded-memory version of `make_astro_photo_joined_data`.
+
+    Each chunk is transformed, reflex corrected, extinction corrected and joined on
+    its own, and the joined chunk is appended to a columnar catalog on disk before
+    the next chunk is read, so peak memory is set by the largest chunk rather than
+    the full catalog.
+
+    Parameters
+    ----------
+    chunks : iterable
+        An iterable (e.g., a generator from `iter_tile_chunks`) that yields
+        ``(gaia_data, phot_data)`` pairs of `pyia.GaiaData` and
+        `cats.photometry.PhotometricSurvey` instances. The chunks should not share
+        any ``source_id`` values, since duplicates are only removed within a chunk.
+    track6d : `galstreams.Track6D`
+    output_path : str
+        Path of the columnar catalog to write (see `cats.columnar`).
+    overwrite : bool (optional)
+        Overwrite an existing catalog at ``output_path``.
+
+    Returns
+    -------
+    joined : `cats.columnar.ColumnarCatalog`
+        The joined catalog, memory-mapped from ``output_path``.
+    """
+    dist_args = _get_distance_interpolator(track6d)
+
+    with ColumnarWriter(output_path, overwrite=overwrite) as writer:
+        for gaia_data, phot_data in chunks:
+            joined = _join_astro_photo(gaia_data, phot_data, *dist_args)
+            writer.append(joined)
+
+            # drop references so the chunk can be freed before the next one is read
+            del gaia_data, phot_data, joined
+
+    return ColumnarCatalog(output_path)
+
+
+def split_by_phi1(gaia_data, phot_data, stream_frame, phi1_edges):
+    """
+    Split Gaia and photometry data into slabs in phi1, the same tiling used by the
+    ``poly_XX.fits`` files from the Gaia download notebook.
+
+    Gaia rows are assigned to slabs by their phi1, and photometry rows follow the
+    Gaia row with the same ``source_id`` so that each match lands in one slab.
+    Photometry rows without a Gaia match are dropped, since they would not survive
+    the join anyway.
+
+    Parameters
+    ----------
+    gaia_data : `pyia.GaiaData`
+    phot_data : `cats.photometry.PhotometricSurvey`
+    stream_frame : `gala.coordinates.GreatCircleICRSFrame`
+    phi1_edges : array-like
+        Slab edges in phi1, in degrees. Stars outside the edges are dropped.
+
+    Returns
+    -------
+    slabs : list of tuple
+        ``(gaia_data, phot_data)`` pairs, one per slab, in order of phi1.
+    """
+    phi1, _ = icrs_to_stream(stream_frame, gaia_data.ra, gaia_data.dec)
+    gaia_slab = np.digitize(phi1, phi1_edges) - 1
+
+    gaia_idx, phot_idx = match_source_ids(
+        gaia_data.data["source_id"], phot_data.data["source_id"]
+    )
+    phot_slab = np.full(len(phot_data.data), -1)
+    phot_slab[phot_idx] = gaia_slab[gaia_idx]
+
+    slabs = []
+    for i in range(len(phi1_edges) - 1):
+        slabs.append(
+            (
+                gaia_data[gaia_slab == i],
+                phot_data.__class__(phot_data.data[phot_slab == i]),
+            )
+        )
+    return slabs
+
+
+def _join_slab(args):
+    slab, phot_cls, dist_args = args
+    gaia_data, phot_data = slab
+    if isinstance(gaia_data, str):
+        gaia_data = GaiaData(gaia_data)
+    if isinstance(phot_data, str):
+        phot_data = phot_cls(phot_data)
+    return _join_astro_photo(gaia_data, phot_data, *dist_args)
+
+
+def make_astro_photo_joined_data_parallel(
+    slabs, track6d, phot_cls=None, max_workers=None, healpix_nside=None
+):
+    """
+    Parallel version of `make_astro_photo_joined_data` that processes slabs of the
+    data (e.g., in phi1) in a process pool.
+
+    The joined slabs are concatenated in the order they are given, and then sorted
+    and deduplicated on ``source_id``, so the output is the same as the serial
+    version no matter how the work was scheduled.
+
+    Parameters
+    ----------
+    slabs : list of tuple
+        ``(gaia, phot)`` pairs. Each pair is either a `pyia.GaiaData` and a
+        `cats.photometry.PhotometricSurvey` instance (e.g., from `split_by_phi1`),
+        or a pair of filenames (e.g., the ``poly_XX.fits`` tiles), which are then
+        read inside the worker processes.
+    track6d : `galstreams.Track6D`
+    phot_cls : subclass of `cats.photometry.PhotometricSurvey` (optional)
+        Required if the photometry slabs are filenames.
+    max_workers : int (optional)
+        Number of worker processes. Defaults to the number of CPUs.
+    healpix_nside : int (optional)
+        If given, sort the joined table by HEALPix pixel in the stream frame and
+        store the index with it (see `cats.healpix.add_healpix_index`).
+
+    Returns
+    -------
+    joined : `astropy.table.Table`
+    """
+    if phot_cls is None and any(isinstance(phot, str) for _, phot in slabs):
+        raise ValueError("phot_cls is required when photometry slabs are filenames.")
+
+    dist_args = _get_distance_interpolator(track6d)
+
+    tasks = [(slab, phot_cls, dist_args) for slab in slabs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        joined = list(executor.map(_join_slab, tasks))
+
+    joined = at.vstack(joined)
+
+    # slabs from overlapping tiles can share stars
+    _, first = np.unique(np.asarray(joined["source_id"]), return_index=True)
+    joined = joined[first]
+
+    if healpix_nside is not None:
+        joined = add_healpix_index(joined, healpix_nside)
 
     return joined
@@ -0,0 +1,175 @@
+"""
+Distance modulus along a stream, shared by the pipeline stages
+"""
+import hashlib
+
+import astropy.table as at
+import astropy.units as u
+import numpy as np
+from scipy.interpolate import InterpolatedUnivariateSpline
+
+from cats.columnar import ColumnarCatalog
+from cats.inputs import stream_inputs as inputs
+
+__all__ = ["DistanceTrack", "get_distance_track"]
+
+
+class DistanceTrack:
+    """
+    Distance modulus as a function of phi1 along a stream.
+
+    Make one with `from_track6d` (a spline through the galstreams track),
+    `from_polynomial` (a polynomial in phi1) or `from_model` (any function, e.g. a
+    fitted model). `add_distmod_column` computes the distance modulus of every star
+    once and stores it in the catalog, where later stages find it.
+
+    Parameters
+    ----------
+    distmod : callable
+        Distance modulus as a function of phi1 in degrees.
+    source : str
+        ``"galstreams"``, ``"polynomial"`` or ``"model"``.
+    key : str
+        Identifies the distance track, to tell whether a catalog column was made
+        with it.
+    """
+
+    def __init__(self, distmod, source, key):
+        self._distmod = distmod
+        self.source = source
+        self.key = key
+
+    @classmethod
+    def from_track6d(cls, track6d, k=3):
+        """
+        Spline of the distance along a `galstreams.Track6D` (or a track read from a
+        pawprint file).
+
+        The spline of the distance itself is kept as ``distance_spline``, in the
+        unit of the track distances, ``distance_unit``.
+
+        Parameters
+        ----------
+        track6d : `galstreams.Track6D`
+        k : int (optional)
+            Degree of the spline.
+        """
+        track = track6d.track.transform_to(track6d.stream_frame)
+        phi1 = track.phi1.degree
+        distance = track.distance.value
+        if np.all(distance == 0):
+            raise ValueError(
+                "A distance track is required: this stream has no distance information "
+                "in the galstreams track."
+            )
+        spline = InterpolatedUnivariateSpline(phi1, distance, k=k)
+        to_pc = track.distance.unit.to(u.pc)
+
+        def distmod(phi1):
+            return 5 * np.log10(spline(phi1) * to_pc) - 5
+
+        h = hashlib.sha256(repr(["galstreams", k]).encode())
+        h.update(np.ascontiguousarray(phi1).tobytes())
+        h.update(np.ascontiguousarray(track.distance.to_value(u.kpc)).tobytes())
+        dt = cls(distmod, "galstreams", h.hexdigest())
+        dt.distance_spline = spline
+        dt.distance_unit = track.distance.unit
+        return dt
+
+    @classmethod
+    def from_polynomial(cls, coeffs):
+        """
+        Distance modulus given by a polynomial in phi1 (deg), with coefficients in
+        decreasing order as for `numpy.poly1d`.
+        """
+        coeffs = np.asarray(coeffs, dtype=float)
+        key = hashlib.sha256(repr(["polynomial", coeffs.tolist()]).encode())
+        return cls(np.poly1d(coeffs), "polynomial", key.hexdigest())
+
+    @classmethod
+    def from_model(cls, func, key=None):
+        """
+        Distance modulus from any function of phi1 (deg), e.g. a fitted model.
+
+        Parameters
+        ----------
+        func : callable
+        key : str (optional)
+            Identifies the model. Defaults to one that is unique to ``func`` in
+            this session, so catalog columns made with other models are not
+            reused.
+        """
+        if key is None:
+            key = f"{func!r}-{id(func)}"
+        return cls(func, "model", key)
+
+    @classmethod
+    def from_inputs(cls, stream, track6d):
+        """
+        The distance track configured for a stream in `cats.inputs.stream_inputs`: a
+        polynomial if it has ``distmod_poly``, otherwise from the galstreams track.
+        """
+        coeffs = inputs[stream].get("distmod_poly")
+        if coeffs is not None:
+            return cls.from_polynomial(coeffs)
+        return cls.from_track6d(track6d)
+
+    def distmod(self, phi1):
+        """Distance modulus at phi1 (deg)."""
+        return np.asarray(self._distmod(np.asarray(phi1, dtype=float)))
+
+    def distance(self, phi1):
+        """Distance (kpc) at phi1 (deg)."""
+        return 10 ** (self.distmod(phi1) / 5 - 2)
+
+    def add_distmod_column(self, catalog, name="distmod"):
+        """
+        Distance modulus of each star in a catalog (from its ``phi1`` column).
+
+        The values are stored in the ``name`` column of the catalog, with ``key``
+        in ``catalog.meta[name + "_key"]``, and are only computed again if the
+        column was made with another distance track. The joined catalogs come with
+        the column for the galstreams track (see `cats.data`).
+
+        Parameters
+        ----------
+        catalog : `astropy.table.Table` or `cats.columnar.ColumnarCatalog`
+            A new column of a `cats.columnar.ColumnarCatalog` is only kept in
+            memory.
+        name : str (optional)
+
+        Returns
+        -------
+        distmod : `numpy.ndarray`
+        """
+        if not isinstance(catalog, (at.Table, ColumnarCatalog)):
+            raise TypeError(
+                "Can only add a distance modulus column to an astropy Table or a "
+                f"ColumnarCatalog, not {type(catalog).__name__}."
+            )
+
+        meta_key = f"{name}_key"
+        if name in catalog.colnames and catalog.meta.get(meta_key) == self.key:
+            return np.asarray(catalog[name])
+
+        distmod = self.distmod(catalog["phi1"])
+        catalog[name] = distmod
+        catalog.meta[meta_key] = self.key
+        return distmod
+
+    def dist_mod_correct(self, catalog, dist_mod):
+        """
+        Distance modulus of each star relative to ``dist_mod`` (the distance
+        modulus of the isochrone), see `add_distmod_column`.
+        """
+        return self.add_distmod_column(catalog) - dist_mod
+
+
+def get_distance_track(stream, pawprint):
+    """
+    The distance track of a pawprint: ``pawprint.distance_track`` if set (e.g. to a
+    fitted model), otherwise made with `DistanceTrack.from_inputs` and stored there.
+    """
+    if getattr(pawprint, "distance_track", None) is None:
+        pawprint.distance_track = DistanceTrack.from_inputs(stream, pawprint.track)
+    return pawprint.distance_track
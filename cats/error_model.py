@@ -0,0 +1,84 @@
+"""
+Photometric uncertainties as a function of magnitude, binned from a catalog
+"""
+import numpy as np
+
+__all__ = ["BinnedErrorModel"]
+
+
+class BinnedErrorModel:
+    """
+    Robust photometric uncertainty as a function of magnitude.
+
+    The stars are grouped by magnitude bin with a single stable sort of their (16
+    bit) bin indices, which numpy does as a radix sort, and the percentiles of the
+    uncertainties are then computed on the contiguous slice of each bin. The cost
+    is O(N) plus a partition per bin, instead of a pass over the whole catalog for
+    every bin.
+
+    Parameters
+    ----------
+    mag, err : array-like
+        Magnitudes and their uncertainties. Non-finite values and non-positive
+        uncertainties (e.g. the -999 of missing PS1 photometry) are ignored.
+    bin_size : float (optional)
+        Width of the magnitude bins.
+    percentiles : sequence of float (optional)
+    min_count : int (optional)
+        Bins with fewer stars are not used.
+
+    Raises
+    ------
+    ValueError
+        If there are no valid stars, or no bin has ``min_count`` of them.
+    """
+
+    def __init__(self, mag, err, bin_size=0.1, percentiles=(16, 50, 84), min_count=10):
+        mag = np.asarray(mag, dtype=float)
+        err = np.asarray(err, dtype=float)
+        good = np.isfinite(mag) & np.isfinite(err) & (err > 0)
+        if not np.all(good):
+            mag, err = mag[good], err[good]
+        if len(mag) == 0:
+            raise ValueError("No finite magnitudes with positive uncertainties.")
+
+        self.bin_size = bin_size
+        self.percentiles = list(percentiles)
+        self.lo = np.floor(mag.min() / bin_size) * bin_size
+        if (mag.max() - self.lo) / bin_size >= np.iinfo(np.uint16).max:
+            raise ValueError("Too many magnitude bins, use a larger bin_size.")
+
+        # the offsets are positive, so truncating is flooring
+        idx = ((mag - self.lo) * (1 / bin_size)).astype(np.uint16)
+        order = np.argsort(idx, kind="stable")
+        counts = np.bincount(idx)
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        err = err[order]
+
+        keep = np.flatnonzero(counts >= max(min_count, 1))
+        if len(keep) == 0:
+            raise ValueError(
+                f"No magnitude bin has at least {min_count} stars, use a larger "
+                "bin_size or a smaller min_count."
+            )
+        self.centers = self.lo + (keep + 0.5) * bin_size
+        self.counts = counts[keep]
+        self.values = np.empty((len(self.percentiles), len(keep)))
+        for k, b in enumerate(keep):
+            self.values[:, k] = np.percentile(
+                err[bounds[b] : bounds[b + 1]], self.percentiles
+            )
+
+    def __call__(self, mag, percentile=50):
+        """
+        Uncertainty at magnitudes, interpolated between the bin centers (and equal to
+        the first or last bin beyond them).
+
+        Parameters
+        ----------
+        mag : float or array-like
+        percentile : float (optional)
+            One of ``percentiles``.
+        """
+        values = self.values[self.percentiles.index(percentile)]
+        return np.interp(mag, self.centers, values)
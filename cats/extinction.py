@@ -0,0 +1,215 @@
+"""
+Persistent, HEALPix-keyed cache of E(B-V) values from dust maps
+"""
+import os
+import tempfile
+
+import astropy.coordinates as coord
+import astropy.units as u
+import healpy as hp
+import numpy as np
+
+from cats.cache import get_cache_dir, prune, temp_suffix, touch
+
+__all__ = ["EBVCache", "get_ebv"]
+
+# bound on the total size (in bytes) of the cache of each dust map and nside
+ebv_cache_size = 256 * 2**20
+
+# batches of new pixels are merged when a cache has more than this many files
+_max_batches = 32
+
+_caches = {}
+
+
+class EBVCache:
+    """
+    On-disk cache of E(B-V) keyed by dust-map class and (nested) HEALPix pixel.
+
+    Stars are assigned to high-resolution HEALPix pixels, and the dust map is only
+    queried (at the pixel centers) for pixels that are not already in the cache. The
+    default ``nside=4096`` gives 0.86 arcmin pixels, well below the 6.1 arcmin
+    resolution of SFD. Since the cache is shared by all surveys and streams, a repeat
+    run over the same sky never instantiates the dust map at all.
+
+    The cache is a directory of ``.npz`` batches: the pixels missing from each query
+    are written as a new batch, so a miss costs the same however large the cache
+    is. The smallest batches are merged when there are more than ``_max_batches``,
+    and the least recently used ones are removed when the cache is larger than
+    ``ebv_cache_size`` bytes (see `cats.cache.prune`).
+
+    Parameters
+    ----------
+    dustmaps_cls : class
+        A `dustmaps` query class, e.g. `dustmaps.sfd.SFDQuery`.
+    nside : int (optional)
+        HEALPix resolution of the cache.
+    cache_dir : str (optional)
+        Defaults to the ``ebv`` subdirectory of `cats.cache.get_cache_dir`.
+    """
+
+    def __init__(self, dustmaps_cls, nside=4096, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = get_cache_dir("ebv")
+
+        self.dustmaps_cls = dustmaps_cls
+        self.nside = nside
+        self.path = os.path.join(cache_dir, f"{dustmaps_cls.__name__}-nside{nside}")
+        os.makedirs(self.path, exist_ok=True)
+
+        # a cache written as a single file becomes the first batch
+        legacy = self.path + ".npz"
+        try:
+            os.replace(legacy, os.path.join(self.path, "legacy.npz"))
+        except FileNotFoundError:
+            pass
+
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        # the batch files read so far, and for each (sorted) pixel its E(B-V) and
+        # the index of its batch in files
+        self.files = []
+        self.pixels = np.array([], dtype=np.int64)
+        self.ebv = np.array([], dtype=np.float32)
+        self.batch = np.array([], dtype=np.int64)
+
+    def _batch_files(self):
+        return sorted(f for f in os.listdir(self.path) if f.endswith(".npz"))
+
+    def _read_batch(self, name):
+        try:
+            with np.load(os.path.join(self.path, name)) as f:
+                return f["pixels"], f["ebv"]
+        except FileNotFoundError:
+            # merged or removed by another run
+            return None
+
+    def _load(self):
+        """
+        Read the batches that are not in memory yet, e.g. written by other runs.
+        """
+        known = set(self.files)
+        pixels, ebv, batch = [self.pixels], [self.ebv], [self.batch]
+        for name in self._batch_files():
+            data = None if name in known else self._read_batch(name)
+            if data is not None:
+                pixels.append(data[0])
+                ebv.append(data[1])
+                batch.append(np.full(len(data[0]), len(self.files)))
+                self.files.append(name)
+
+        self.pixels, first = np.unique(np.concatenate(pixels), return_index=True)
+        self.ebv = np.concatenate(ebv)[first]
+        self.batch = np.concatenate(batch)[first]
+
+    def _write_batch(self, pixels, ebv):
+        # write atomically so concurrent runs never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=temp_suffix)
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, pixels=pixels, ebv=ebv)
+        fname = tmp[: -len(temp_suffix)] + ".npz"
+        os.replace(tmp, fname)
+        return fname
+
+    def _lookup(self, pixels):
+        """
+        Look up sorted, unique pixels. Returns the E(B-V) values and a mask of which
+        pixels were found, and marks the batches they were found in as used.
+        """
+        if len(self.pixels) == 0:
+            return np.full(len(pixels), np.nan), np.zeros(len(pixels), dtype=bool)
+        idx = np.clip(np.searchsorted(self.pixels, pixels), 0, len(self.pixels) - 1)
+        found = self.pixels[idx] == pixels
+        for i in np.unique(self.batch[idx[found]]):
+            touch(os.path.join(self.path, self.files[i]))
+        return np.where(found, self.ebv[idx].astype(np.float64), np.nan), found
+
+    def _update(self, pixels, ebv):
+        fname = self._write_batch(pixels, ebv.astype(np.float32))
+        # also picks up the new batch, and any other run has added since
+        self._load()
+
+        names = self._batch_files()
+        if len(names) > _max_batches:
+            self._merge_batches(names)
+        prune(self.path, ebv_cache_size, keep=[fname])
+
+    def _merge_batches(self, names):
+        # merge the smallest half of the batches into one
+        sizes = []
+        for name in names:
+            try:
+                sizes.append(os.path.getsize(os.path.join(self.path, name)))
+            except FileNotFoundError:
+                sizes.append(np.inf)
+        small = [names[i] for i in np.argsort(sizes)[: len(names) // 2]]
+
+        batches = [b for b in map(self._read_batch, small) if b is not None]
+        if not batches:
+            return
+        pixels, first = np.unique(
+            np.concatenate([b[0] for b in batches]), return_index=True
+        )
+        self._write_batch(pixels, np.concatenate([b[1] for b in batches])[first])
+        for name in small:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+
+        self._reset()
+        self._load()
+
+    def query(self, c):
+        """
+        Get E(B-V) at the positions of a `astropy.coordinates.SkyCoord`.
+
+        Returns
+        -------
+        ebv : `numpy.ndarray`
+        """
+        c = c.icrs
+        pix = hp.ang2pix(
+            self.nside, c.ra.degree, c.dec.degree, nest=True, lonlat=True
+        ).astype(np.int64)
+        upix, inv = np.unique(pix, return_inverse=True)
+
+        ebv, found = self._lookup(upix)
+        if not np.all(found):
+            # other runs may have added the pixels since the cache was read
+            self._load()
+            ebv, found = self._lookup(upix)
+        if not np.all(found):
+            missing = upix[~found]
+            lon, lat = hp.pix2ang(self.nside, missing, nest=True, lonlat=True)
+            c_missing = coord.SkyCoord(lon * u.deg, lat * u.deg, frame="icrs")
+            # stored as float32, so round here too for the same answer on every run
+            ebv_missing = np.asarray(self.dustmaps_cls().query(c_missing), np.float32)
+            self._update(missing, ebv_missing)
+            ebv[~found] = ebv_missing
+
+        return ebv[inv.reshape(pix.shape)]
+
+
+def get_ebv(c, dustmaps_cls, nside=4096):
+    """
+    Get E(B-V) at the positions of a `astropy.coordinates.SkyCoord` through the shared
+    `EBVCache` for this dust map.
+
+    Parameters
+    ----------
+    c : `astropy.coordinates.SkyCoord`
+    dustmaps_cls : class
+        A `dustmaps` query class, e.g. `dustmaps.sfd.SFDQuery`.
+    nside : int (optional)
+
+    Returns
+    -------
+    ebv : `numpy.ndarray`
+    """
+    key = (dustmaps_cls, nside)
+    if key not in _caches:
+        _caches[key] = EBVCache(dustmaps_cls, nside=nside)
+    return _caches[key].query(c)
@@ -0,0 +1,101 @@
+"""
+HEALPix spatial index for joined stream catalogs.
+
+The index is built on the stream-frame coordinates (phi1, phi2) treated as
+longitude and latitude, so that it lines up with the sky footprints in a
+`cats.pawprint.pawprint.Pawprint`. Catalog rows are sorted by nested pixel ID and
+the pixel IDs are stored in the ``hpx`` column, so the rows in any pixel form one
+contiguous block that can be found with a binary search.
+"""
+import healpy as hp
+import numpy as np
+
+__all__ = ["stream_healpix", "add_healpix_index", "get_healpix_index", "pixel_rows"]
+
+index_column = "hpx"
+nside_key = "hpx_nside"
+
+
+def stream_healpix(phi1, phi2, nside):
+    """
+    Nested HEALPix pixel IDs of stream-frame coordinates.
+
+    Parameters
+    ----------
+    phi1, phi2 : array-like
+        Stream coordinates, in degrees.
+    nside : int
+
+    Returns
+    -------
+    pixels : `numpy.ndarray`
+    """
+    return hp.ang2pix(
+        nside, np.asarray(phi1), np.asarray(phi2), nest=True, lonlat=True
+    ).astype(np.int64)
+
+
+def add_healpix_index(catalog, nside=256):
+    """
+    Sort a catalog by the nested HEALPix pixel of each star in the stream frame, and
+    store the pixel IDs in the ``hpx`` column and ``nside`` in the table meta.
+
+    Parameters
+    ----------
+    catalog : `astropy.table.Table`
+        Must have ``phi1`` and ``phi2`` columns.
+    nside : int (optional)
+        The default of 256 gives 0.23 deg pixels.
+
+    Returns
+    -------
+    catalog : `astropy.table.Table`
+        A sorted copy of the input catalog.
+    """
+    pixels = stream_healpix(catalog["phi1"], catalog["phi2"], nside)
+    order = np.argsort(pixels, kind="stable")
+
+    catalog = catalog[order]
+    catalog[index_column] = pixels[order]
+    catalog.meta[nside_key] = nside
+    return catalog
+
+
+def get_healpix_index(catalog):
+    """
+    Get the sorted pixel IDs and ``nside`` of a catalog built with
+    `add_healpix_index`, or ``(None, None)`` if it has no index.
+    """
+    nside = getattr(catalog, "meta", {}).get(nside_key)
+    if nside is None or index_column not in catalog.colnames:
+        return None, None
+    return np.asarray(catalog[index_column]), nside
+
+
+def pixel_rows(sorted_pixels, pixels):
+    """
+    Row indices of all stars in the given pixels, found by binary search on the
+    sorted pixel IDs of a catalog. The cost scales with the number of pixels and
+    matching rows, not the size of the catalog.
+
+    Parameters
+    ----------
+    sorted_pixels : `numpy.ndarray`
+        Sorted pixel IDs of every row in the catalog.
+    pixels : array-like
+        Pixel IDs to select.
+
+    Returns
+    -------
+    rows : `numpy.ndarray`
+    """
+    starts = np.searchsorted(sorted_pixels, pixels, side="left")
+    stops = np.searchsorted(sorted_pixels, pixels, side="right")
+    lengths = stops - starts
+    total = lengths.sum()
+    if total == 0:
+        return np.array([], dtype=np.int64)
+
+    # concatenated aranges from each start to each stop
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total)
@@ -12,6 +12,8 @@ stream_inputs = odict(
                 pawprint_id="pricewhelan2018",
                 # stream stuff
                 width=2.0,  # full width in degrees (add units in pawprint)
+                # distance modulus vs phi1, from Adrian and Kiyan's separate work
+                distmod_poly=[2.41e-4, 2.421e-2, 15.001],
                 # data stuff
                 phot_survey="PS1",
                 band1="g",
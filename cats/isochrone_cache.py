@@ -0,0 +1,176 @@
+"""
+Persistent cache of sampled isochrones, shared across streams and runs
+
+Usage (to fill the cache for every stream in `cats.inputs.stream_inputs`)::
+
+    python -m cats.isochrone_cache
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from cats.cache import get_cache_dir, prune, temp_suffix, touch
+from cats.inputs import stream_inputs as inputs
+
+__all__ = ["feh_to_z", "isochrone_cache_file", "sample_isochrone"]
+
+# bound on the total size (in bytes) of the isochrone cache
+isochrone_cache_size = 64 * 2**20
+
+# bumped when the sampling changes, to invalidate old cache entries
+_isochrone_cache_version = 1
+
+
+def feh_to_z(feh):
+    """Metal mass fraction Z from [Fe/H], for the Dotter isochrones."""
+    Y_p = 0.245  # Primordial He abundance (WMAP, 2003)
+    c = 1.54  # He enrichment ratio
+    ZX_solar = 0.0229
+    return (1 - Y_p) / ((1 + c) + (1 / ZX_solar) * 10 ** (-feh))
+
+
+def isochrone_cache_file(survey, age, feh, distance, band1, band2, alpha):
+    """Cache file for an isochrone with these parameters."""
+    key = [_isochrone_cache_version, survey, band1, band2]
+    key += [float(x) for x in (age, feh, distance, alpha)]
+    name = hashlib.sha256(repr(key).encode()).hexdigest()
+    return os.path.join(get_cache_dir("isochrones"), name + ".npz")
+
+
+def _compute_isochrone(survey, age, feh, distance, band1, band2, alpha):
+    # the model packages are only needed on a cache miss
+    if survey == "Gaia":
+        from isochrones.mist import MIST_Isochrone
+
+        mist = MIST_Isochrone()
+        iso = mist.isochrone(
+            age=np.log10(1e9 * age),  # has to be given in logAge
+            feh=feh,
+            eep_range=None,  # get the whole isochrone,
+            distance=1e3 * distance,  # given in parsecs
+        )
+        return dict(
+            initial_mass=iso.initial_mass.values,
+            actual_mass=iso.mass.values,
+            mag=iso.G_mag.values,
+            color_1=iso.BP_mag.values,
+            color_2=iso.RP_mag.values,
+        )
+
+    from ugali.analysis.isochrone import factory as isochrone_factory
+
+    iso = isochrone_factory(
+        "Dotter",
+        survey=survey,
+        age=age,
+        distance_modulus=5 * np.log10(1000 * distance) - 5,
+        z=feh_to_z(feh),
+        band_1=band1,
+        band_2=band2,
+    )
+    iso.afe = alpha
+
+    initial_mass, mass_pdf, actual_mass, mag_1, mag_2 = iso.sample(mass_steps=4e2)
+    return dict(
+        initial_mass=initial_mass,
+        mass_pdf=mass_pdf,
+        actual_mass=actual_mass,
+        mag_1=mag_1 + iso.distance_modulus,
+        mag_2=mag_2 + iso.distance_modulus,
+    )
+
+
+def sample_isochrone(survey, age, feh, distance, band1, band2, alpha=0, cache=True):
+    """
+    Sample an isochrone, through an on-disk cache.
+
+    For ``survey="Gaia"`` this is the MIST isochrone from `isochrones`, otherwise the
+    Dotter isochrone from `ugali` sampled in 400 mass steps. The arrays are stored
+    in an ``.npz`` file in the ``isochrones`` subdirectory of
+    `cats.cache.get_cache_dir`, so repeat calls with the same parameters do not read
+    the model grids at all. The least recently used entries are removed when the
+    cache is larger than ``isochrone_cache_size`` bytes.
+
+    Parameters
+    ----------
+    survey : str
+        Photometric survey, e.g. ``"PS1"`` or ``"Gaia"``.
+    age : float
+        Gyr.
+    feh : float
+    distance : float
+        kpc.
+    band1, band2 : str
+    alpha : float (optional)
+        [alpha/Fe].
+    cache : bool (optional)
+        If False, always compute the isochrone (and do not store it).
+
+    Returns
+    -------
+    arrays : dict of `numpy.ndarray`
+        ``initial_mass``, ``actual_mass``, ``mag`` (G), ``color_1`` (BP) and
+        ``color_2`` (RP) for Gaia, otherwise ``initial_mass``, ``mass_pdf``,
+        ``actual_mass``, ``mag_1`` and ``mag_2``. Magnitudes are apparent, at the
+        given distance.
+    """
+    args = (survey, age, feh, distance, band1, band2, alpha)
+    if not cache:
+        return _compute_isochrone(*args)
+
+    fname = isochrone_cache_file(*args)
+    if os.path.exists(fname):
+        touch(fname)
+        with np.load(fname) as f:
+            return dict(f)
+
+    arrays = _compute_isochrone(*args)
+    arrays = {k: np.asarray(v, dtype=float) for k, v in arrays.items()}
+
+    # write atomically so concurrent runs never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname), suffix=temp_suffix)
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, fname)
+    prune(os.path.dirname(fname), isochrone_cache_size, keep=[fname])
+    return arrays
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Fill the isochrone cache for the streams in cats.inputs."
+    )
+    parser.add_argument(
+        "--streams", nargs="+", choices=list(inputs), default=list(inputs)
+    )
+    args = parser.parse_args()
+
+    failed = []
+    for stream in args.streams:
+        pars = inputs[stream]
+        t0 = time.perf_counter()
+        try:
+            sample_isochrone(
+                pars["phot_survey"],
+                pars["age"],
+                pars["feh"],
+                pars["distance"],
+                pars["band1"],
+                pars["band2"],
+                alpha=pars["alpha"],
+            )
+        except Exception as e:
+            print(f"{stream}: failed ({e!r})")
+            failed.append(stream)
+            continue
+        print(f"{stream}: {time.perf_counter() - t0:.2f} s")
+
+    return int(len(failed) > 0)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,260 @@
+"""
+Precomputed age-metallicity grids of isochrones, with fast interpolation
+
+Usage (to build the grids for the surveys and bands in `cats.inputs.stream_inputs`)::
+
+    python -m cats.isochrone_grid
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+from scipy.signal import argrelextrema
+
+from cats.cache import get_cache_dir, temp_suffix, touch
+from cats.inputs import stream_inputs as inputs
+from cats.isochrone_cache import sample_isochrone
+
+__all__ = ["IsochroneGrid", "get_isochrone_grid"]
+
+default_ages = np.linspace(8.0, 13.5, 23)  # Gyr
+default_fehs = np.linspace(-2.5, -0.5, 21)
+
+# distance of the sampled isochrones, for a distance modulus of zero
+_absolute_distance = 0.01  # kpc
+
+# weight of color relative to magnitude in the CMD arc length, so that the subgiant
+# branch (mostly in color) is sampled about as densely as the red giant branch
+_color_weight = 4.0
+
+# bumped when the resampling changes, to invalidate old grids
+_isochrone_grid_version = 2
+
+
+def _resample(iso, n_points, ms_fraction=0.5):
+    """
+    Cut an isochrone sampled by `cats.isochrone_cache.sample_isochrone` before the
+    horizontal branch (like `cats.CMD.Isochrone.generate_isochrone`) and resample it
+    at ``n_points`` points.
+
+    The main-sequence turnoff (the bluest point) is always point
+    ``round(ms_fraction * (n_points - 1))``, and the points before and after it are
+    evenly spaced in arc length along the isochrone in the CMD. Uniform steps in
+    initial mass would put only a few points past the turnoff, where the mass range
+    is small, so the subgiant and red giant branches of neighbouring isochrones
+    would not line up.
+
+    ``mass_pdf`` (the fraction of stars at each sampled point) is rebinned to the
+    new points, so that it keeps the same total.
+    """
+    if "mag" in iso:
+        mag, color = iso["mag"], iso["color_1"] - iso["color_2"]
+        mass_pdf = None
+    else:
+        mag, color = iso["mag_1"], iso["mag_1"] - iso["mag_2"]
+        mass_pdf = iso["mass_pdf"]
+
+    turn_idx = argrelextrema(mag, np.less)[0][0]
+    mag, color = mag[:turn_idx], color[:turn_idx]
+    mass = iso["actual_mass"][:turn_idx]
+
+    s = np.concatenate(
+        ([0], np.cumsum(np.hypot(_color_weight * np.diff(color), np.diff(mag))))
+    )
+    s_turnoff = s[np.argmin(color)]
+    n_ms = int(round(ms_fraction * (n_points - 1))) + 1
+    x = np.concatenate(
+        (
+            np.linspace(s[0], s_turnoff, n_ms),
+            np.linspace(s_turnoff, s[-1], n_points - n_ms + 1)[1:],
+        )
+    )
+    columns = [np.interp(x, s, c) for c in (mag, color, mass)]
+
+    if mass_pdf is None:
+        columns.append(np.full(n_points, np.nan))
+    else:
+        # the fraction of stars between the midpoints of the new points, from the
+        # cumulative fraction along the isochrone
+        mass_pdf = mass_pdf[:turn_idx]
+        cdf = np.cumsum(mass_pdf) - mass_pdf / 2
+        edges = np.concatenate(([s[0]], (x[1:] + x[:-1]) / 2, [s[-1]]))
+        pdf = np.diff(np.interp(edges, s, cdf))
+        columns.append(pdf * (mass_pdf.sum() / pdf.sum()))
+
+    return np.stack(columns)
+
+
+class IsochroneGrid:
+    """
+    Isochrones on a regular grid of age and [Fe/H], aligned by evolutionary phase.
+
+    Each isochrone is cut before the horizontal branch and resampled with the main
+    sequence turnoff at the same point, and evenly spaced in CMD arc length on
+    either side of it, so point ``i`` of every isochrone is at about the same
+    evolutionary stage (from the bottom of the main sequence to the tip of the red
+    giant branch). Isochrones at any (age, feh) are then bilinear interpolations of
+    the four surrounding grid nodes, point by point, which is vectorized over any
+    number of (age, feh, distance modulus).
+
+    Parameters
+    ----------
+    ages, fehs : array-like
+        Increasing grid axes, in Gyr and dex.
+    mag, color, mass, mass_pdf : array-like
+        Shape ``(len(ages), len(fehs), n_points)``. Absolute magnitudes. ``mass_pdf``
+        (the fraction of stars at each point) is NaN where the isochrones do not
+        have one (MIST).
+    """
+
+    columns = ["mag", "color", "mass", "mass_pdf"]
+
+    def __init__(self, ages, fehs, mag, color, mass, mass_pdf):
+        self.ages = np.asarray(ages, dtype=float)
+        self.fehs = np.asarray(fehs, dtype=float)
+        # (n_age, n_feh, column, point), so one fancy index gets every column
+        self.values = np.stack(
+            [np.asarray(c, dtype=float) for c in (mag, color, mass, mass_pdf)], axis=2
+        )
+
+    @classmethod
+    def build(cls, survey, band1, band2, ages=None, fehs=None, alpha=0, n_points=200):
+        """
+        Sample the isochrone at every grid node, through the isochrone cache.
+
+        Parameters
+        ----------
+        survey, band1, band2 : str
+            As in `cats.isochrone_cache.sample_isochrone`.
+        ages, fehs : array-like (optional)
+            Defaults to ``default_ages`` and ``default_fehs``.
+        alpha : float (optional)
+        n_points : int (optional)
+            Points per isochrone.
+        """
+        ages = default_ages if ages is None else np.asarray(ages, dtype=float)
+        fehs = default_fehs if fehs is None else np.asarray(fehs, dtype=float)
+        values = np.empty((len(ages), len(fehs), len(cls.columns), n_points))
+        for i, age in enumerate(ages):
+            for j, feh in enumerate(fehs):
+                iso = sample_isochrone(
+                    survey, age, feh, _absolute_distance, band1, band2, alpha=alpha
+                )
+                values[i, j] = _resample(iso, n_points)
+        return cls(ages, fehs, *np.moveaxis(values, 2, 0))
+
+    @classmethod
+    def read(cls, fname):
+        with np.load(fname) as f:
+            return cls(f["ages"], f["fehs"], *[f[c] for c in cls.columns])
+
+    def write(self, fname):
+        np.savez(
+            fname,
+            ages=self.ages,
+            fehs=self.fehs,
+            **{c: self.values[:, :, i] for i, c in enumerate(self.columns)},
+        )
+
+    def _weights(self, axis, x):
+        # index of the lower node and weight of the upper node, clipped to the grid
+        i = np.clip(np.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+        t = np.clip((x - axis[i]) / (axis[i + 1] - axis[i]), 0, 1)
+        return i, t[..., None, None]
+
+    def __call__(self, age, feh, dist_mod=0.0):
+        """
+        Interpolate isochrones. The arguments are broadcast against each other, and
+        ages and metallicities outside the grid are clipped to its edges.
+
+        Parameters
+        ----------
+        age : float or array-like
+            Gyr.
+        feh : float or array-like
+        dist_mod : float or array-like (optional)
+
+        Returns
+        -------
+        color, mag, mass, mass_pdf : `numpy.ndarray`
+            Shape ``np.broadcast(age, feh, dist_mod).shape + (n_points,)``, with
+            apparent magnitudes.
+        """
+        age, feh, dist_mod = np.broadcast_arrays(
+            *[np.asarray(x, dtype=float) for x in (age, feh, dist_mod)]
+        )
+        i, ta = self._weights(self.ages, age)
+        j, tf = self._weights(self.fehs, feh)
+
+        v = self.values
+        lo = v[i, j] + tf * (v[i, j + 1] - v[i, j])
+        hi = v[i + 1, j] + tf * (v[i + 1, j + 1] - v[i + 1, j])
+        values = lo + ta * (hi - lo)
+
+        mag = values[..., 0, :] + dist_mod[..., None]
+        return values[..., 1, :], mag, values[..., 2, :], values[..., 3, :]
+
+
+def get_isochrone_grid(
+    survey, band1, band2, ages=None, fehs=None, alpha=0, n_points=200
+):
+    """
+    Get an `IsochroneGrid`, built once and then read from the ``isochrone_grids``
+    subdirectory of `cats.cache.get_cache_dir`.
+
+    Parameters are as in `IsochroneGrid.build`.
+    """
+    ages = default_ages if ages is None else np.asarray(ages, dtype=float)
+    fehs = default_fehs if fehs is None else np.asarray(fehs, dtype=float)
+
+    key = [_isochrone_grid_version, survey, band1, band2, float(alpha), int(n_points)]
+    h = hashlib.sha256(repr(key).encode())
+    h.update(ages.tobytes())
+    h.update(fehs.tobytes())
+    fname = os.path.join(get_cache_dir("isochrone_grids"), h.hexdigest() + ".npz")
+
+    if os.path.exists(fname):
+        touch(fname)
+        return IsochroneGrid.read(fname)
+
+    grid = IsochroneGrid.build(
+        survey, band1, band2, ages=ages, fehs=fehs, alpha=alpha, n_points=n_points
+    )
+    # write atomically so concurrent runs never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname), suffix=temp_suffix)
+    with os.fdopen(fd, "wb") as f:
+        grid.write(f)
+    os.replace(tmp, fname)
+    return grid
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Build the isochrone grids for the surveys in cats.inputs."
+    )
+    parser.add_argument(
+        "--streams", nargs="+", choices=list(inputs), default=list(inputs)
+    )
+    parser.add_argument("--n-points", type=int, default=200)
+    args = parser.parse_args()
+
+    done = set()
+    for stream in args.streams:
+        pars = inputs[stream]
+        key = (pars["phot_survey"], pars["band1"], pars["band2"], pars["alpha"])
+        if key in done:
+            continue
+        done.add(key)
+
+        t0 = time.perf_counter()
+        get_isochrone_grid(*key[:3], alpha=key[3], n_points=args.n_points)
+        print(f"{'/'.join(map(str, key[:3]))}: {time.perf_counter() - t0:.2f} s")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,290 @@
+"""
+Vectorized point-in-polygon tests for footprints with many vertices.
+"""
+import numpy as np
+
+__all__ = ["PolygonIndex", "PolygonRaster", "simplify_polygon"]
+
+
+class PolygonIndex:
+    """
+    Point-in-polygon engine with edges bucketed into strips.
+
+    The polygon's bounding box is cut into horizontal strips, and each edge is
+    listed in the strips its extent overlaps (a CSR layout: ``indptr`` into
+    ``edges``). A point is tested by casting a ray in +x along its strip and
+    counting crossings (even-odd rule) with only the edges in that strip, so the
+    cost is O(N * k) for k edges per strip, instead of O(N * V) for matplotlib's
+    `matplotlib.path.Path.contains_points`. Points outside the bounding box are
+    rejected up front.
+
+    The crossing test is matplotlib's, term for term, so the result is identical
+    to ``Path(vertices).contains_points(points)``, including for points exactly on
+    vertices and edges.
+
+    Parameters
+    ----------
+    vertices : array-like
+        Shape ``(V, 2)``. The polygon is closed implicitly.
+    n_buckets : int (optional)
+        Number of strips. Defaults to the number of edges, reduced if long edges
+        would make the bucket lists much longer than the number of edges.
+    """
+
+    def __init__(self, vertices, n_buckets=None):
+        v = np.asarray(vertices, dtype=float)
+        if len(v) > 1 and np.all(v[0] == v[-1]):
+            v = v[:-1]
+
+        self.lo = v.min(axis=0)
+        self.hi = v.max(axis=0)
+        # strips along y and rays along +x, as in matplotlib, so that points on
+        # the boundary are classified the same way
+        self.axis = 1
+
+        u0 = v[:, self.axis]
+        w0 = v[:, 1 - self.axis]
+        u1 = np.roll(u0, -1)
+        w1 = np.roll(w0, -1)
+        # edges parallel to the rays never cross them
+        keep = u0 != u1
+        self.u0, self.u1, self.w0, self.w1 = u0[keep], u1[keep], w0[keep], w1[keep]
+
+        n_edges = len(self.u0)
+        self.n_buckets = max(n_buckets or n_edges, 1)
+        u_lo, u_hi = self.lo[self.axis], self.hi[self.axis]
+        while True:
+            self.width = (u_hi - u_lo) / self.n_buckets or 1.0
+            first = self._bucket(np.minimum(self.u0, self.u1))
+            last = self._bucket(np.maximum(self.u0, self.u1))
+            spans = last - first + 1
+            if n_buckets or self.n_buckets == 1:
+                break
+            if spans.sum() <= 8 * n_edges + self.n_buckets:
+                break
+            self.n_buckets //= 2
+
+        total = spans.sum()
+        edge_ids = np.repeat(np.arange(n_edges), spans)
+        bucket_ids = np.repeat(first, spans) + (
+            np.arange(total) - np.repeat(np.cumsum(spans) - spans, spans)
+        )
+        self.edges = edge_ids[np.argsort(bucket_ids, kind="stable")]
+        self.indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(bucket_ids, minlength=self.n_buckets)))
+        )
+
+    def _bucket(self, u):
+        b = np.floor((u - self.lo[self.axis]) / self.width).astype(np.int64)
+        return np.clip(b, 0, self.n_buckets - 1)
+
+    def contains_points(self, points, chunk_size=2**22):
+        """
+        Which points are inside the polygon.
+
+        Parameters
+        ----------
+        points : array-like
+            Shape ``(N, 2)``.
+        chunk_size : int (optional)
+            Maximum number of point-edge pairs tested at once, to bound memory.
+
+        Returns
+        -------
+        mask : `numpy.ndarray`
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        mask = np.zeros(len(points), dtype=bool)
+
+        idx = np.flatnonzero(np.all((points >= self.lo) & (points <= self.hi), axis=1))
+        u = points[idx, self.axis]
+        w = points[idx, 1 - self.axis]
+        b = self._bucket(u)
+        counts = self.indptr[b + 1] - self.indptr[b]
+        cum = np.cumsum(counts)
+
+        i0 = 0
+        while i0 < len(idx):
+            done = cum[i0 - 1] if i0 > 0 else 0
+            i1 = max(np.searchsorted(cum, done + chunk_size, side="right"), i0 + 1)
+
+            c = counts[i0:i1]
+            pt = np.repeat(np.arange(i1 - i0), c)
+            offsets = np.arange(len(pt)) - np.repeat(np.cumsum(c) - c, c)
+            e = self.edges[np.repeat(self.indptr[b[i0:i1]], c) + offsets]
+
+            uu = u[i0:i1][pt]
+            u0, u1, w0, w1 = self.u0[e], self.u1[e], self.w0[e], self.w1[e]
+            # matplotlib's point_in_path: the edge straddles the ray, and the point
+            # is left of the edge (same operands, so the same rounding)
+            above = u1 >= uu
+            cross = (u0 >= uu) != above
+            cross &= ((u1 - uu) * (w0 - w1) >= (w1 - w[i0:i1][pt]) * (u0 - u1)) == above
+
+            mask[idx[i0:i1]] = np.bincount(pt[cross], minlength=i1 - i0) % 2 == 1
+            i0 = i1
+
+        return mask
+
+
+class PolygonRaster:
+    """
+    Raster lookup table for a fixed polygon.
+
+    The polygon's bounding box is cut into a grid of cells, each marked as inside,
+    outside or boundary. Boundary cells are found by sampling every edge at half
+    the cell size and growing the touched cells by one cell in each direction, so
+    any cell an edge passes through is marked. No edge passes through the other
+    cells, so each is wholly inside or outside, as decided by its center. A point
+    is then classified by indexing into the grid, and only points in boundary
+    cells are tested exactly with the `PolygonIndex`.
+
+    Parameters
+    ----------
+    vertices : array-like
+        Shape ``(V, 2)``.
+    shape : tuple of int (optional)
+        Number of cells along each axis.
+    index : `PolygonIndex` (optional)
+        Used for the exact tests. Made from ``vertices`` if not given.
+    """
+
+    outside, inside, boundary = 0, 1, 2
+
+    def __init__(self, vertices, shape=(512, 512), index=None):
+        v = np.asarray(vertices, dtype=float)
+        self.index = PolygonIndex(v) if index is None else index
+        self.shape = tuple(int(n) for n in shape)
+        self.lo = v.min(axis=0)
+        self.hi = v.max(axis=0)
+        self.cell = (self.hi - self.lo) / self.shape
+        self.cell[self.cell == 0] = 1.0
+
+        # sample the edges (including the closing one) at half the cell size
+        start = v
+        delta = np.roll(v, -1, axis=0) - v
+        n_samples = np.ceil(np.max(np.abs(delta) / (0.5 * self.cell), axis=1))
+        n_samples = n_samples.astype(np.int64) + 1
+        edge = np.repeat(np.arange(len(v)), n_samples)
+        t = np.arange(n_samples.sum()) - np.repeat(
+            np.cumsum(n_samples) - n_samples, n_samples
+        )
+        t = t / np.repeat(n_samples, n_samples)
+        samples = start[edge] + t[:, None] * delta[edge]
+
+        touched = np.zeros(self.shape, dtype=bool)
+        touched[tuple(self._cells(samples).T)] = True
+        padded = np.pad(touched, 1)
+        is_boundary = np.zeros(self.shape, dtype=bool)
+        for di in range(3):
+            for dj in range(3):
+                is_boundary |= padded[di : di + self.shape[0], dj : dj + self.shape[1]]
+
+        centers = np.stack(
+            np.meshgrid(
+                self.lo[0] + (np.arange(self.shape[0]) + 0.5) * self.cell[0],
+                self.lo[1] + (np.arange(self.shape[1]) + 0.5) * self.cell[1],
+                indexing="ij",
+            ),
+            axis=-1,
+        ).reshape(-1, 2)
+        center_inside = self.index.contains_points(centers).reshape(self.shape)
+
+        self.grid = np.where(center_inside, self.inside, self.outside).astype(np.uint8)
+        self.grid[is_boundary] = self.boundary
+
+    def _cells(self, points):
+        ij = np.floor((points - self.lo) / self.cell).astype(np.int64)
+        return np.clip(ij, 0, np.array(self.shape) - 1)
+
+    def contains_points(self, points):
+        """
+        Which points are inside the polygon.
+
+        Parameters
+        ----------
+        points : array-like
+            Shape ``(N, 2)``.
+
+        Returns
+        -------
+        mask : `numpy.ndarray`
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        mask = np.zeros(len(points), dtype=bool)
+
+        idx = np.flatnonzero(np.all((points >= self.lo) & (points <= self.hi), axis=1))
+        ij = self._cells(points[idx])
+        state = self.grid[ij[:, 0], ij[:, 1]]
+
+        mask[idx[state == self.inside]] = True
+        rows = idx[state == self.boundary]
+        mask[rows] = self.index.contains_points(points[rows])
+        return mask
+
+
+def _segment_distance(points, start, end):
+    """Distance of each point to the segment from ``start`` to ``end``."""
+    d = end - start
+    length2 = d @ d
+    if length2 == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip((points - start) @ d / length2, 0, 1)
+    return np.hypot(*(points - start - t[:, None] * d).T)
+
+
+def _douglas_peucker(points, tolerance):
+    """Indices of the vertices of an open polyline kept by Douglas-Peucker."""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        dist = _segment_distance(points[i + 1 : j], points[i], points[j])
+        k = np.argmax(dist)
+        if dist[k] > tolerance:
+            k += i + 1
+            keep[k] = True
+            stack += [(i, k), (k, j)]
+
+    return np.flatnonzero(keep)
+
+
+def simplify_polygon(vertices, tolerance):
+    """
+    Simplify a closed polygon with the Douglas-Peucker algorithm.
+
+    Every vertex that is removed lies within ``tolerance`` of the simplified
+    boundary, so no point of the original boundary is further than ``tolerance``
+    from the simplified one (in the units of the vertices, e.g. degrees in
+    (phi1, phi2)). Points further than that from the boundary are classified the
+    same by both polygons.
+
+    Parameters
+    ----------
+    vertices : array-like
+        Shape ``(V, 2)``. The polygon is closed implicitly.
+    tolerance : float
+        Maximum deviation of the boundary.
+
+    Returns
+    -------
+    vertices : `numpy.ndarray`
+        The kept vertices, in their original order.
+    """
+    v = np.asarray(vertices, dtype=float)
+    if len(v) > 1 and np.all(v[0] == v[-1]):
+        v = v[:-1]
+    if len(v) <= 3:
+        return v
+
+    # split the ring at the vertex furthest from the first one, and simplify the
+    # two open chains
+    far = np.argmax(np.hypot(*(v - v[0]).T))
+    first = _douglas_peucker(v[: far + 1], tolerance)
+    second = _douglas_peucker(np.concatenate((v[far:], v[:1])), tolerance) + far
+
+    return v[np.concatenate((first, second[1:-1]))]
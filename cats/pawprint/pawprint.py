@@ -1,14 +1,22 @@
+import hashlib
 import os
+import tempfile
 
 import asdf
 import astropy.table as apt
 import astropy.units as u
 import galstreams as gst
+import healpy as hp
 import numpy as np
 from astropy.coordinates import SkyCoord
 from gala.coordinates import GreatCircleICRSFrame
 from matplotlib.path import Path as mpl_path
 
+from cats.cache import get_cache_dir, prune, temp_suffix, touch
+from cats.coords import skycoord_to_stream
+from cats.healpix import get_healpix_index, pixel_rows
+from cats.pawprint.geometry import PolygonIndex, PolygonRaster, simplify_polygon
+
 # class densityClass: #TODO: how to represent densities?
 
 
@@ -20,9 +28,7 @@ class Footprint2D(dict):
             else:
                 vc = SkyCoord(vertex_coordinates)
             self.edges = vc
-            self.vertices = np.array(
-                [vc.transform_to(stream_frame).phi1, vc.transform_to(stream_frame).phi2]
-            ).T
+            self.vertices = np.array(skycoord_to_stream(vc, stream_frame)).T
 
         elif footprint_type == "cartesian":
             self.edges = vertex_coordinates
@@ -31,6 +37,15 @@ class Footprint2D(dict):
         self.stream_frame = stream_frame
         self.footprint_type = footprint_type
         self.footprint = mpl_path(self.vertices)
+        self.polygon_index = PolygonIndex(self.vertices)
+        self.tolerance = None
+        self.mask_vertices = np.asarray(self.vertices, dtype=float)
+        self._simplified = {None: (self.mask_vertices, self.polygon_index)}
+        self.raster_shape = None
+        self._rasters = {}
+        self._healpix_pixels = {}
+        # bumped whenever the polygon used for the masks changes
+        self.version = 0
 
     @classmethod
     def from_vertices(cls, vertex_coordinates, footprint_type):
@@ -57,23 +72,521 @@ class Footprint2D(dict):
                 print("can't!")
                 return
             else:
-                pts = np.array(
-                    [
-                        data.transform_to(self.stream_frame).phi1.value,
-                        data.transform_to(self.stream_frame).phi2.value,
-                    ]
-                ).T
-                return self.footprint.contains_points(pts)
+                pts = np.array(skycoord_to_stream(data, self.stream_frame)).T
+                return self._contains_points(pts)
         else:
-            return self.footprint.contains_points(data)
+            return self._contains_points(data)
+
+    def _contains_points(self, pts):
+        if self.raster_shape is None:
+            return self.polygon_index.contains_points(pts)
+
+        key = (self.tolerance, self.raster_shape)
+        if key not in self._rasters:
+            self._rasters[key] = PolygonRaster(
+                self.mask_vertices, self.raster_shape, index=self.polygon_index
+            )
+        return self._rasters[key].contains_points(pts)
+
+    def rasterize(self, shape=(512, 512)):
+        """
+        Use a raster lookup table (see `cats.pawprint.geometry.PolygonRaster`) in
+        all later `inside_footprint` calls: stars in grid cells wholly inside or
+        outside the footprint are classified by indexing into the grid, and only
+        stars in cells on the boundary are tested against the polygon. The result
+        is the same as without the raster.
+
+        Worth it for footprints that are evaluated repeatedly on many stars. The
+        raster is built on the first call, and cached per ``shape`` and
+        simplification tolerance (see `simplify`).
+
+        Parameters
+        ----------
+        shape : tuple of int or None (optional)
+            Number of grid cells along each axis. None turns the raster off.
+
+        Returns
+        -------
+        self : `Footprint2D`
+        """
+        self.raster_shape = None if shape is None else tuple(shape)
+        self.version += 1
+        return self
+
+    def simplify(self, tolerance):
+        """
+        Use a simplified polygon, whose boundary deviates by at most ``tolerance``
+        from the full footprint, in all later mask calls (`inside_footprint` and
+        `inside_footprint_healpix`). Only stars within ``tolerance`` of the boundary
+        can be classified differently.
+
+        The simplified polygons are cached per tolerance, and ``tolerance=None``
+        switches back to the full footprint. `vertices` always holds the full
+        footprint.
+
+        Parameters
+        ----------
+        tolerance : float or None
+            Maximum boundary deviation, in the units of the vertices (degrees in
+            (phi1, phi2) for sky footprints).
+
+        Returns
+        -------
+        self : `Footprint2D`
+        """
+        if tolerance not in self._simplified:
+            vertices = simplify_polygon(self.vertices, tolerance)
+            self._simplified[tolerance] = vertices, PolygonIndex(vertices)
+
+        self.tolerance = tolerance
+        self.mask_vertices, self.polygon_index = self._simplified[tolerance]
+        self.version += 1
+        return self
+
+    def _state_arrays(self):
+        return [self.vertices]
+
+    def state(self):
+        """
+        Identifies the selection the footprint currently makes: a hash of its
+        vertices, and ``version``, which `simplify` and `rasterize` increment. Used
+        by `Pawprint.selection` to tell whether a mask is stale.
+        """
+        h = hashlib.sha1()
+        for a in self._state_arrays():
+            h.update(np.ascontiguousarray(a, dtype=float).tobytes())
+        return h.hexdigest(), self.version
+
+    def healpix_pixels(self, nside):
+        """
+        Nested HEALPix pixels (in the stream frame, see `cats.healpix`) that are
+        fully inside the footprint or cross its boundary. Cached per ``nside`` (and
+        simplification tolerance, see `simplify`).
+
+        A pixel is on the boundary if its bounding box in (phi1, phi2) overlaps the
+        bounding box of any polygon edge. Otherwise no edge passes through it, so the
+        whole pixel is inside or outside depending on its center.
+
+        Parameters
+        ----------
+        nside : int
+
+        Returns
+        -------
+        inside : `numpy.ndarray`
+            Sorted IDs of pixels fully inside the footprint.
+        boundary : `numpy.ndarray`
+            Sorted IDs of pixels that cross the footprint boundary.
+        """
+        key = (nside, self.tolerance)
+        if key in self._healpix_pixels:
+            return self._healpix_pixels[key]
+
+        verts = self.mask_vertices
+        lon_min, lat_min = verts.min(axis=0)
+        lon_max, lat_max = verts.max(axis=0)
+
+        # all pixels in the latitude band, then clip to the longitude range
+        pix = hp.query_strip(
+            nside,
+            np.radians(90 - min(lat_max, 90)),
+            np.radians(90 - max(lat_min, -90)),
+            inclusive=True,
+            nest=True,
+        )
+        xyz = hp.boundaries(nside, pix, step=4, nest=True)
+        lon, lat = hp.vec2ang(np.moveaxis(xyz, 1, -1).reshape(-1, 3), lonlat=True)
+        lon = ((lon + 180) % 360 - 180).reshape(len(pix), -1)
+        lat = lat.reshape(len(pix), -1)
+
+        # pad the sampled pixel bounding boxes, since pixel edges are curved
+        pad = 0.1 * np.degrees(hp.nside2resol(nside))
+        pix_lon_min, pix_lon_max = lon.min(axis=1) - pad, lon.max(axis=1) + pad
+        pix_lat_min, pix_lat_max = lat.min(axis=1) - pad, lat.max(axis=1) + pad
+        wraps = (lon.max(axis=1) - lon.min(axis=1)) > 180
+
+        keep = wraps | (
+            (pix_lon_max >= lon_min)
+            & (pix_lon_min <= lon_max)
+            & (pix_lat_max >= lat_min)
+            & (pix_lat_min <= lat_max)
+        )
+        pix, wraps = pix[keep], wraps[keep]
+        pix_lon_min, pix_lon_max = pix_lon_min[keep], pix_lon_max[keep]
+        pix_lat_min, pix_lat_max = pix_lat_min[keep], pix_lat_max[keep]
+
+        edges_start = verts
+        edges_end = np.roll(verts, -1, axis=0)
+        edge_min = np.minimum(edges_start, edges_end)
+        edge_max = np.maximum(edges_start, edges_end)
+
+        is_boundary = wraps.copy()
+        chunk = max(1, 2**22 // len(verts))
+        for i in range(0, len(pix), chunk):
+            sl = slice(i, i + chunk)
+            overlap = (
+                (pix_lon_max[sl, None] >= edge_min[None, :, 0])
+                & (pix_lon_min[sl, None] <= edge_max[None, :, 0])
+                & (pix_lat_max[sl, None] >= edge_min[None, :, 1])
+                & (pix_lat_min[sl, None] <= edge_max[None, :, 1])
+            )
+            is_boundary[sl] |= overlap.any(axis=1)
+
+        center_lon, center_lat = hp.pix2ang(nside, pix, nest=True, lonlat=True)
+        center_lon = (center_lon + 180) % 360 - 180
+        center_inside = self.polygon_index.contains_points(
+            np.stack((center_lon, center_lat)).T
+        )
+
+        inside = np.sort(pix[~is_boundary & center_inside])
+        boundary = np.sort(pix[is_boundary])
+        self._healpix_pixels[key] = inside, boundary
+        return inside, boundary
+
+    def inside_footprint_healpix(self, phi1, phi2, sorted_pixels, nside):
+        """
+        Footprint mask using a HEALPix index of the catalog (see
+        `cats.healpix.add_healpix_index`).
+
+        Stars in pixels fully inside the footprint are accepted without a test, stars
+        in pixels outside it are skipped, and only stars in boundary pixels are
+        tested exactly, so the cost scales with the footprint area rather than the
+        catalog size.
+
+        Parameters
+        ----------
+        phi1, phi2 : array-like
+            Stream coordinates of every star, in degrees.
+        sorted_pixels : `numpy.ndarray`
+            The (sorted) ``hpx`` index column of the catalog.
+        nside : int
+            The ``nside`` of the index.
+
+        Returns
+        -------
+        mask : `numpy.ndarray`
+        """
+        inside, boundary = self.healpix_pixels(nside)
+
+        mask = np.zeros(len(sorted_pixels), dtype=bool)
+        mask[pixel_rows(sorted_pixels, inside)] = True
+
+        rows = pixel_rows(sorted_pixels, boundary)
+        pts = np.stack((np.asarray(phi1)[rows], np.asarray(phi2)[rows])).T
+        mask[rows] = self.inside_footprint(pts)
+        return mask
 
     def export(self):
+        """
+        Serializable description of the footprint, see `from_export`. Sky
+        footprints keep their edges in ICRS, so the vertices are recomputed
+        exactly on loading.
+        """
         data = {}
-        data["stream_frame"] = self.stream_frame
-        data["vertices"] = self.vertices
         data["footprint_type"] = self.footprint_type
+        if self.stream_frame is not None:
+            data["stream_frame"] = _export_frame(self.stream_frame)
+        if self.footprint_type == "sky":
+            edges = self.edges.icrs
+            data["ra"] = edges.ra.degree
+            data["dec"] = edges.dec.degree
+        else:
+            data["vertices"] = np.asarray(self.vertices, dtype=float)
+        data["tolerance"] = self.tolerance
+        data["raster_shape"] = (
+            None if self.raster_shape is None else list(self.raster_shape)
+        )
         return data
 
+    @classmethod
+    def from_export(cls, data, stream_frame=None):
+        """
+        Rebuild a footprint from the output of `export` (e.g. read from a pawprint
+        file), including its simplification tolerance and raster settings. The
+        stream frame stored with the footprint takes precedence over
+        ``stream_frame``.
+        """
+        if data.get("stream_frame") is not None:
+            stream_frame = _import_frame(data["stream_frame"])
+        if data["footprint_type"] == "track":
+            footprint = TrackFootprint(
+                data["phi1"],
+                data["phi2"],
+                2 * np.asarray(data["half_width"]),
+                stream_frame,
+                phi2_offset=data["phi2_offset"],
+            )
+        elif data["footprint_type"] == "sky":
+            edges = SkyCoord(
+                ra=np.asarray(data["ra"]) * u.deg,
+                dec=np.asarray(data["dec"]) * u.deg,
+                frame="icrs",
+            )
+            footprint = cls(edges, "sky", stream_frame=stream_frame)
+        else:
+            footprint = cls(np.array(data["vertices"]), data["footprint_type"])
+
+        if data.get("tolerance") is not None:
+            footprint.simplify(data["tolerance"])
+        if data.get("raster_shape") is not None:
+            footprint.rasterize(data["raster_shape"])
+        return footprint
+
+
+class TrackFootprint(Footprint2D):
+    """
+    Sky footprint around a stream track, stored as linear splines in phi1 of the
+    track's phi2 center and half-width instead of as a polygon.
+
+    A star is inside if its phi1 is within the track and
+    ``|phi2 - center(phi1) - phi2_offset| < half_width(phi1)``, which costs one
+    interpolation per star. This is the same selection as the polygon made by
+    `galstreams.Track6D.create_sky_polygon_footprint_from_track`, which is also
+    kept as `vertices` (for plotting and `Footprint2D.healpix_pixels`). There is
+    no polygon test to speed up, so `simplify` and `rasterize` have no effect.
+
+    Parameters
+    ----------
+    phi1, phi2 : array-like
+        The track in the stream frame, in degrees.
+    width : float or array-like
+        Full width of the footprint in phi2 (deg), constant or at each track point.
+    stream_frame : `astropy.coordinates.BaseCoordinateFrame`
+    phi2_offset : float (optional)
+        Offset from the track in phi2 (deg), e.g. for background footprints.
+    """
+
+    def __init__(self, phi1, phi2, width, stream_frame, phi2_offset=0.0):
+        phi1 = np.asarray(phi1, dtype=float)
+        order = np.argsort(phi1)
+        self.phi1 = phi1[order]
+        self.phi2 = np.asarray(phi2, dtype=float)[order]
+        self.half_width = np.broadcast_to(
+            np.asarray(width, dtype=float) / 2, phi1.shape
+        )[order]
+        self.phi2_offset = float(phi2_offset)
+
+        lat = self.phi2 + self.phi2_offset
+        vertices = SkyCoord(
+            phi1=np.concatenate((self.phi1, self.phi1[::-1])) * u.deg,
+            phi2=np.concatenate((lat + self.half_width, (lat - self.half_width)[::-1]))
+            * u.deg,
+            frame=stream_frame,
+        )
+        super().__init__(vertices, footprint_type="sky", stream_frame=stream_frame)
+        self.footprint_type = "track"
+
+    @classmethod
+    def from_track6d(cls, track6d, width, phi2_offset=0.0):
+        """
+        Footprint around a `galstreams.Track6D`, in its stream frame.
+
+        Parameters
+        ----------
+        track6d : `galstreams.Track6D`
+        width : float, array-like or `astropy.units.Quantity`
+            Full width in phi2 (deg if not a Quantity).
+        phi2_offset : float or `astropy.units.Quantity` (optional)
+        """
+        stream_frame = track6d.stream_frame
+        track = track6d.track.transform_to(stream_frame)
+        return cls(
+            track.phi1.degree,
+            track.phi2.degree,
+            u.Quantity(width, u.deg).value,
+            stream_frame,
+            phi2_offset=u.Quantity(phi2_offset, u.deg).value,
+        )
+
+    def _state_arrays(self):
+        return [self.phi1, self.phi2, self.half_width, [self.phi2_offset]]
+
+    def simplify(self, tolerance):
+        """
+        No effect: the mask is computed from the track, not from a polygon.
+        """
+        return self
+
+    def rasterize(self, shape=(512, 512)):
+        """
+        No effect: the mask is computed from the track, not from a polygon.
+        """
+        return self
+
+    def inside_track(self, phi1, phi2):
+        """
+        Footprint mask from stream coordinates in degrees.
+        """
+        phi1 = np.asarray(phi1, dtype=float)
+        phi2 = np.asarray(phi2, dtype=float)
+        mask = (phi1 >= self.phi1[0]) & (phi1 <= self.phi1[-1])
+        mask &= (phi2 > self.polygon_index.lo[1]) & (phi2 < self.polygon_index.hi[1])
+        idx = np.flatnonzero(mask)
+
+        # one binary search per star, shared by the center and half-width splines
+        x = phi1[idx]
+        j = np.searchsorted(self.phi1, x, side="right") - 1
+        j = np.clip(j, 0, len(self.phi1) - 2)
+        dx = self.phi1[j + 1] - self.phi1[j]
+        t = np.divide(x - self.phi1[j], dx, out=np.zeros_like(x), where=dx > 0)
+        center = self.phi2[j] + t * np.diff(self.phi2)[j]
+        half_width = self.half_width[j] + t * np.diff(self.half_width)[j]
+
+        mask[idx] = np.abs(phi2[idx] - center - self.phi2_offset) < half_width
+        return mask
+
+    def inside_footprint(self, data):
+        if isinstance(data, SkyCoord):
+            if self.stream_frame is None:
+                print("can't!")
+                return
+            return self.inside_track(*skycoord_to_stream(data, self.stream_frame))
+        data = np.asarray(data)
+        return self.inside_track(data[:, 0], data[:, 1])
+
+    def export(self):
+        data = super().export()
+        del data["vertices"]
+        data["phi1"] = self.phi1
+        data["phi2"] = self.phi2
+        data["half_width"] = self.half_width
+        data["phi2_offset"] = self.phi2_offset
+        return data
+
+
+class StreamTrack:
+    """
+    Stream track read from a pawprint file, with the attributes of a
+    `galstreams.Track6D` that are used in CATS. The track arrays are only read
+    from ``fname`` (and the `astropy.coordinates.SkyCoord` built) when ``track`` is
+    first accessed.
+    """
+
+    def __init__(self, stream_name, track_name, stream_frame, track_width, fname):
+        self.stream_name = stream_name
+        self.track_name = track_name
+        self.stream_frame = stream_frame
+        self.track_width = track_width
+        self.fname = fname
+        self._track = None
+
+    @property
+    def track(self):
+        if self._track is None:
+            with asdf.open(self.fname, lazy_load=True, memmap=False) as f:
+                a = _to_builtin(f.tree["pawprint"]["track"]["arrays"])
+            self._track = SkyCoord(
+                ra=a["ra"] * u.deg,
+                dec=a["dec"] * u.deg,
+                distance=a["distance"] * u.kpc,
+                pm_ra_cosdec=a["pm_ra_cosdec"] * u.mas / u.yr,
+                pm_dec=a["pm_dec"] * u.mas / u.yr,
+                radial_velocity=a["radial_velocity"] * u.km / u.s,
+                frame="icrs",
+            )
+        return self._track
+
+
+def _to_builtin(node, skip=()):
+    """
+    Copy a tree read from an ASDF file into dicts, lists and numpy arrays, so it
+    can be used once the file is closed. Arrays are only read from their blocks
+    here, and the subtrees named in ``skip`` are left out.
+    """
+    if isinstance(node, dict):
+        return {k: _to_builtin(v, skip) for k, v in node.items() if k not in skip}
+    if isinstance(node, (list, tuple)):
+        return [_to_builtin(v, skip) for v in node]
+    if isinstance(node, np.ndarray) or hasattr(node, "__array__"):
+        return np.array(node)
+    return node
+
+
+def _export_frame(frame):
+    if not isinstance(frame, GreatCircleICRSFrame):
+        raise TypeError(f"Cannot save a stream frame of type {type(frame).__name__}.")
+    data = {"priority": str(frame.priority)}
+    for name in ["pole", "origin"]:
+        c = SkyCoord(getattr(frame, name)).icrs
+        data[name] = [float(c.ra.degree), float(c.dec.degree)]
+    return data
+
+
+def _import_frame(data):
+    return GreatCircleICRSFrame(
+        pole=SkyCoord(*data["pole"], unit=u.deg, frame="icrs"),
+        origin=SkyCoord(*data["origin"], unit=u.deg, frame="icrs"),
+        priority=data["priority"],
+    )
+
+
+def _export_quantity(value):
+    if isinstance(value, u.Quantity):
+        return {"value": value.value, "unit": value.unit.to_string()}
+    return value
+
+
+def _import_quantity(value):
+    if isinstance(value, dict) and set(value) == {"value", "unit"}:
+        return u.Quantity(value["value"], value["unit"])
+    return value
+
+
+def _export_footprints(footprints):
+    if footprints is None:
+        return None
+    if isinstance(footprints, Footprint2D):
+        return footprints.export()
+    return {k: v.export() for k, v in footprints.items()}
+
+
+def _import_footprints(data, stream_frame):
+    if data is None:
+        return None
+    if "footprint_type" in data:
+        return Footprint2D.from_export(data, stream_frame)
+    return {k: Footprint2D.from_export(v, stream_frame) for k, v in data.items()}
+
+
+# bound on the total size (in bytes) of the cache used by
+# Pawprint.pawprint_from_galstreams
+galstreams_cache_size = 256 * 2**20
+
+# bumped when the pawprint file layout changes, to invalidate old cache entries
+_galstreams_cache_version = 3
+
+
+def _galstreams_cache_file(files, args):
+    """Cache file for a pawprint made from these galstreams files and arguments."""
+    h = hashlib.sha256()
+    args = [_export_quantity(a) for a in args]
+    h.update(repr([_galstreams_cache_version] + args).encode())
+    for fname in files:
+        with open(fname, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return os.path.join(get_cache_dir("pawprints"), h.hexdigest() + ".asdf")
+
+
+# bit of each footprint in the selection bitfield made by Pawprint.evaluate
+footprint_bits = {
+    "sky_stream": 0,
+    "sky_background": 1,
+    "pm": 2,
+    "pm1": 3,
+    "pm2": 4,
+    "cmd": 5,
+    "hb": 6,
+}
+
+
+def selection_mask(bits, *names):
+    """
+    Mask of the stars inside all the named footprints (see ``footprint_bits``),
+    from a bitfield made by `Pawprint.evaluate`.
+    """
+    flags = np.uint16(sum(1 << footprint_bits[name] for name in names))
+    return (bits & flags) == flags
+
 
 class Pawprint(dict):
     """Dictionary class to store a "pawprint":
@@ -90,17 +603,16 @@ class Pawprint(dict):
         self.pawprint_ID = data["pawprint_ID"]
         self.stream_frame = data["stream_frame"]
         self.width = data["width"]
+        # sky footprints can be given as vertices or as footprints, such as a
+        # TrackFootprint
         self.skyprint = {
-            "stream": Footprint2D(
-                data["stream_vertices"],
-                footprint_type="sky",
-                stream_frame=self.stream_frame,
-            ),
-            "background": Footprint2D(
-                data["background_vertices"],
-                footprint_type="sky",
-                stream_frame=self.stream_frame,
-            ),
+            k: v
+            if isinstance(v, Footprint2D)
+            else Footprint2D(v, footprint_type="sky", stream_frame=self.stream_frame)
+            for k, v in [
+                ("stream", data["stream_vertices"]),
+                ("background", data["background_vertices"]),
+            ]
         }
         # WG3: how to implement distance dependence in isochrone selections?
         self.cmd_filters = data["cmd_filters"]
@@ -135,55 +647,81 @@ class Pawprint(dict):
             self.pm2print = None
 
         self.track = data["track"]
+        # cats.distance.DistanceTrack, made by cats.distance.get_distance_track
+        self.distance_track = None
+
+        self.selection_bits = None
+        self._evaluated = {}
+        self._evaluated_catalog = None
 
     @classmethod
     def from_file(cls, fname):
-        import asdf
+        """
+        Read a pawprint written by `save_pawprint`. No galstreams files are read:
+        the track, stream frame and footprints all come from the file.
+        """
+        with asdf.open(fname, lazy_load=True, memmap=False) as a:
+            # the track arrays are only read by StreamTrack when needed
+            tree = _to_builtin(a.tree["pawprint"], skip=("arrays",))
 
-        data = {}
-        with asdf.open("fname") as a:
-            # first transfer the stuff that goes directly
-            data["stream_name"] = a["stream_name"]
-            data["pawprint_ID"] = a["pawprint_ID"]
-            data["stream_frame"] = a["stream_frame"]
-            data["width"] = a["width"]
-            data["cmd_filters"] = a["cmd_filters"]
-
-            # now create footprints from vertices
-            data["sky"] = {}
-
-            if a["on_stream"]["cmd"] is not None:
-                data["cmd_vertices"] = dict(
-                    [
-                        (
-                            k,
-                            Footprint2D(
-                                a["on_stream"]["cmd"][k]["vertices"],
-                                a["on_stream"]["cmd"][k],
-                            )["footprint_type"],
-                        )
-                        for k in a["on_stream"]["cmd"].keys()
-                    ]
-                )
-
-            if a["on_stream"]["pm"] is not None:
-                data["cmd_vertices"] = dict(
-                    [
-                        (
-                            k,
-                            Footprint2D(
-                                a["on_stream"]["cmd"][k]["vertices"],
-                                a["on_stream"]["cmd"][k],
-                            )["footprint_type"],
-                        )
-                        for k in a["on_stream"]["cmd"].keys()
-                    ]
-                )
+        stream_frame = _import_frame(tree["stream_frame"])
+        track = tree["track"]
+        data = {
+            "stream_name": tree["stream_name"],
+            "pawprint_ID": tree["pawprint_ID"],
+            "stream_frame": stream_frame,
+            "width": _import_quantity(tree["width"]),
+            "cmd_filters": None,
+            "pm_vertices": None,
+            "pm1_vertices": None,
+            "pm2_vertices": None,
+            "track": StreamTrack(
+                track["stream_name"],
+                track["track_name"],
+                stream_frame,
+                {k: _import_quantity(v) for k, v in track["track_width"].items()},
+                os.path.abspath(fname),
+            ),
+        }
+        footprints = tree["footprints"]
+        data["stream_vertices"] = Footprint2D.from_export(
+            footprints["sky"]["stream"], stream_frame
+        )
+        data["background_vertices"] = Footprint2D.from_export(
+            footprints["sky"]["background"], stream_frame
+        )
 
-        return cls(data)
+        pawprint = cls(data)
+        pawprint.cmd_filters = tree["cmd_filters"]
+        for name in ["cmdprint", "hbprint", "pmprint", "pm1print", "pm2print"]:
+            setattr(pawprint, name, _import_footprints(footprints[name], stream_frame))
+        return pawprint
 
     @classmethod
-    def pawprint_from_galstreams(cls, stream_name, pawprint_ID, width):
+    def pawprint_from_galstreams(
+        cls,
+        stream_name,
+        pawprint_ID,
+        width,
+        track_footprint=False,
+        phi2_offset=3.0 * u.deg,
+        cache=True,
+    ):
+        """
+        Pawprint with sky footprints around a galstreams track.
+
+        If ``track_footprint`` is True, the sky footprints are `TrackFootprint`
+        objects, which select stars by their offset from the track instead of with a
+        polygon. The background footprint is offset by ``phi2_offset`` from the
+        track.
+
+        If ``cache`` is True, the pawprint is saved in the ``pawprints``
+        subdirectory of `cats.cache.get_cache_dir`, keyed by a hash of the
+        galstreams track and summary files and of the arguments, and later calls
+        read it from there with `from_file` instead of parsing the galstreams
+        files. The least recently used entries are removed when the cache is
+        larger than ``galstreams_cache_size`` bytes.
+        """
         galstreams_dir = os.path.dirname(gst.__file__)
         galstreams_tracks = os.path.join(galstreams_dir, "tracks/")
 
@@ -236,14 +774,29 @@ class Pawprint(dict):
             )  # it shouldn't matter, but if it's zero it does crazy things
             mid_pole = SkyCoord(**x)
 
+            if hasattr(GreatCircleICRSFrame, "from_pole_ra0"):
+                # newer gala versions only accept ra0 through from_pole_ra0; as in
+                # galstreams, the origin is the side of the great circle nearest the
+                # mid-point, so that the mid-point is at phi1 ~ 0
+                return GreatCircleICRSFrame.from_pole_ra0(
+                    mid_pole, mid_point.icrs.ra, origin_disambiguate=mid_point.icrs
+                )
             return GreatCircleICRSFrame(pole=mid_pole, ra0=mid_point.icrs.ra)
 
+        track_file = _make_track_file_name(stream_name, pawprint_ID)
+        summary_file = _make_summary_file_name(stream_name, pawprint_ID)
+        if cache:
+            cache_file = _galstreams_cache_file(
+                [track_file, summary_file],
+                [stream_name, pawprint_ID, width, phi2_offset, track_footprint],
+            )
+            if os.path.exists(cache_file):
+                touch(cache_file)
+                return cls.from_file(cache_file)
+
         data = {}
         data["stream_name"] = stream_name
         data["pawprint_ID"] = pawprint_ID
-
-        track_file = _make_track_file_name(stream_name, pawprint_ID)
-        summary_file = _make_summary_file_name(stream_name, pawprint_ID)
         data["stream_frame"] = _get_stream_frame_from_file(summary_file)
 
         data["track"] = gst.Track6D(
@@ -258,21 +811,41 @@ class Pawprint(dict):
             )  # one standard deviation on each side (is this wide enough?)
         except:
             data["width"] = width
-        data["stream_vertices"] = data["track"].create_sky_polygon_footprint_from_track(
-            width=data["width"], phi2_offset=0.0 * u.deg
-        )
-        data["background_vertices"] = data[
-            "track"
-        ].create_sky_polygon_footprint_from_track(
-            width=data["width"], phi2_offset=3.0 * u.deg
-        )
+        if track_footprint:
+            data["stream_vertices"] = TrackFootprint.from_track6d(
+                data["track"], width=data["width"], phi2_offset=0.0 * u.deg
+            )
+            data["background_vertices"] = TrackFootprint.from_track6d(
+                data["track"], width=data["width"], phi2_offset=phi2_offset
+            )
+        else:
+            data["stream_vertices"] = data[
+                "track"
+            ].create_sky_polygon_footprint_from_track(
+                width=data["width"], phi2_offset=0.0 * u.deg
+            )
+            data["background_vertices"] = data[
+                "track"
+            ].create_sky_polygon_footprint_from_track(
+                width=data["width"], phi2_offset=phi2_offset
+            )
         data["cmd_filters"] = None
         data["cmd_vertices"] = None
         data["pm_vertices"] = None
         data["pm1_vertices"] = None
         data["pm2_vertices"] = None
 
-        return cls(data)
+        pawprint = cls(data)
+        if cache:
+            # write atomically so concurrent runs never read a partial file
+            fd, tmp = tempfile.mkstemp(
+                dir=os.path.dirname(cache_file), suffix=temp_suffix
+            )
+            os.close(fd)
+            pawprint.save_pawprint(tmp)
+            os.replace(tmp, cache_file)
+            prune(os.path.dirname(cache_file), galstreams_cache_size, keep=[cache_file])
+        return pawprint
 
     def add_cmd_footprint(self, new_footprint, color, mag, name):
         if self.cmd_filters is None:
@@ -282,39 +855,181 @@ class Pawprint(dict):
             self.cmd_filters[name] = [color, mag]
             self.cmdprint[name] = new_footprint
 
+    def simplify_skyprint(self, tolerance):
+        """
+        Simplify the stream and background sky footprints, see
+        `Footprint2D.simplify`.
+        """
+        for footprint in self.skyprint.values():
+            footprint.simplify(tolerance)
+
+    def _footprints(self):
+        """
+        Name, footprint and coordinate columns of each footprint, sky first.
+        """
+        return [
+            ("sky_stream", self.skyprint["stream"], ("phi1", "phi2")),
+            ("sky_background", self.skyprint["background"], ("phi1", "phi2")),
+            ("pm", self.pmprint, ("pm_phi1_cosphi2_unrefl", "pm_phi2_unrefl")),
+            ("pm1", self.pm1print, ("phi1", "pm_phi1_cosphi2_unrefl")),
+            ("pm2", self.pm2print, ("phi1", "pm_phi2_unrefl")),
+            ("cmd", self.cmdprint, ("color", "mag")),
+            ("hb", getattr(self, "hbprint", None), ("color", "mag")),
+        ]
+
+    def evaluate(self, catalog, color=None, mag=None, prune=True):
+        """
+        Evaluate every footprint on a catalog in one pass, and pack the results
+        into a bitfield with one bit per footprint (see ``footprint_bits`` and
+        `selection_mask`).
+
+        The sky footprints are evaluated first (with the HEALPix index if the
+        catalog has one). The other footprints are then evaluated in order of
+        their number of vertices, on only the stars inside a sky footprint if
+        ``prune`` is True, since every selection in `cats.CMD` and
+        `cats.proper_motions` is combined with a sky footprint. Each column is read
+        from the catalog once.
+
+        The bits are kept on the pawprint, and `selection` returns masks from them
+        for as long as the footprints are unchanged (the same objects, with the
+        same `Footprint2D.state`).
+
+        Parameters
+        ----------
+        catalog : `astropy.table.Table` or `cats.columnar.ColumnarCatalog`
+        color, mag : array-like (optional)
+            Color and distance-corrected magnitude of each star, for the CMD
+            footprints (``cmd`` and ``hb``), which are skipped if not given.
+        prune : bool (optional)
+            Only evaluate the non-sky footprints on stars inside a sky footprint.
+            The non-sky bits of all other stars are then 0.
+
+        Returns
+        -------
+        bits : `numpy.ndarray`
+            uint16 bitfield, one per star.
+        """
+        columns = {"color": color, "mag": mag}
+
+        def _points(names, rows=None):
+            for name in names:
+                if columns.get(name) is None:
+                    columns[name] = np.asarray(catalog[name], dtype=float)
+            return np.stack(
+                [columns[n] if rows is None else columns[n][rows] for n in names],
+                axis=1,
+            )
+
+        bits = np.zeros(len(catalog), dtype=np.uint16)
+        evaluated = {}
+        footprints = [f for f in self._footprints() if isinstance(f[1], Footprint2D)]
+        if color is None or mag is None:
+            footprints = [f for f in footprints if f[2][0] != "color"]
+
+        hpx, nside = get_healpix_index(catalog)
+        for name, footprint, names in footprints[:2]:
+            if hpx is not None:
+                phi1, phi2 = (np.asarray(catalog[n]) for n in names)
+                inside = footprint.inside_footprint_healpix(phi1, phi2, hpx, nside)
+            else:
+                inside = footprint.inside_footprint(_points(names))
+            bits[inside] |= np.uint16(1 << footprint_bits[name])
+            evaluated[name] = footprint, footprint.state()
+
+        rows = np.flatnonzero(bits) if prune else None
+        for name, footprint, names in sorted(
+            footprints[2:], key=lambda f: len(f[1].mask_vertices)
+        ):
+            inside = footprint.inside_footprint(_points(names, rows))
+            bits[inside if rows is None else rows[inside]] |= np.uint16(
+                1 << footprint_bits[name]
+            )
+            evaluated[name] = footprint, footprint.state()
+
+        self.selection_bits = bits
+        self._evaluated = evaluated
+        self._evaluated_catalog = catalog
+        return bits
+
+    def selection(self, name, catalog):
+        """
+        Mask of the stars in ``catalog`` inside footprint ``name`` (see
+        ``footprint_bits``) from the last `evaluate`, or None if it was not run on
+        this catalog or the footprint has been replaced, simplified or rasterized
+        since.
+        """
+        if catalog is not self._evaluated_catalog or name not in self._evaluated:
+            return None
+        current = {n: f for n, f, _ in self._footprints()}[name]
+        footprint, state = self._evaluated[name]
+        if current is not footprint or current.state() != state:
+            return None
+        return selection_mask(self.selection_bits, name)
+
+    def rasterize_footprints(self, shape=(512, 512)):
+        """
+        Use raster lookup tables for the CMD and proper-motion footprints that are
+        currently set, see `Footprint2D.rasterize`.
+        """
+        for name in ["cmdprint", "hbprint", "pmprint", "pm1print", "pm2print"]:
+            footprints = getattr(self, name, None)
+            if isinstance(footprints, Footprint2D):
+                footprints = {name: footprints}
+            for footprint in (footprints or {}).values():
+                footprint.rasterize(shape)
+
     def add_pm_footprint(self, new_footprint, name):
         if self.pmprint is None:
             self.pmprint = dict((name, new_footprint))
         else:
             self.pmprint[name] = new_footprint
 
-    def save_pawprint(self):
-        # WARNING this doesn't save the track yet - need schema
-        # WARNING the stream frame doesn't save right either
-        fname = self.stream_name + self.pawprint_ID + ".asdf"
+    def save_pawprint(self, fname=None):
+        """
+        Write the pawprint to an ASDF file, which `from_file` reads back exactly:
+        the stream frame, the track, every footprint (with its simplification and
+        raster settings) and the selection metadata. Arrays are stored as binary
+        blocks.
+
+        Parameters
+        ----------
+        fname : str (optional)
+            Defaults to ``<stream_name><pawprint_ID>.asdf``.
+        """
+        if fname is None:
+            fname = self.stream_name + self.pawprint_ID + ".asdf"
+
+        track = self.track.track.icrs
+        track_width = getattr(self.track, "track_width", None) or {}
         tree = {
             "stream_name": self.stream_name,
             "pawprint_ID": self.pawprint_ID,
-            "stream_frame": self.stream_frame,  # needs a schema to save properly
+            "stream_frame": _export_frame(self.stream_frame),
+            "width": _export_quantity(self.width),
             "cmd_filters": self.cmd_filters,
-            "width": self.width,
-            "on_stream": {"sky": self.skyprint["stream"].export()},
-            "off_stream": self.skyprint["background"].export(),
-            #    'track':self.track   #TODO
+            "footprint_bits": footprint_bits,
+            "track": {
+                "stream_name": self.track.stream_name,
+                "track_name": getattr(self.track, "track_name", self.pawprint_ID),
+                "track_width": {k: _export_quantity(v) for k, v in track_width.items()},
+                "arrays": {
+                    "ra": track.ra.degree,
+                    "dec": track.dec.degree,
+                    "distance": track.distance.to_value(u.kpc),
+                    "pm_ra_cosdec": track.pm_ra_cosdec.to_value(u.mas / u.yr),
+                    "pm_dec": track.pm_dec.to_value(u.mas / u.yr),
+                    "radial_velocity": track.radial_velocity.to_value(u.km / u.s),
+                },
+            },
+            "footprints": {
+                "sky": _export_footprints(self.skyprint),
+                "cmdprint": _export_footprints(self.cmdprint),
+                "hbprint": _export_footprints(getattr(self, "hbprint", None)),
+                "pmprint": _export_footprints(self.pmprint),
+                "pm1print": _export_footprints(self.pm1print),
+                "pm2print": _export_footprints(self.pm2print),
+            },
         }
-        if self.cmdprint is not None:
-            tree["on_stream"]["cmd"] = dict(
-                [(k, self.cmdprint[k].export()) for k in self.cmd_filters.keys()]
-            )
-        else:
-            tree["on_stream"]["cmd"] = None
-
-        if self.pmprint is not None:
-            tree["on_stream"]["pm"] = dict(
-                [(k, self.pmprint[k].export()) for k in self.pmprint.keys()]
-            )
-        else:
-            tree["on_stream"]["pm"] = None
 
-        out = asdf.AsdfFile(tree)
+        out = asdf.AsdfFile({"pawprint": tree})
         out.write_to(fname)
@@ -7,11 +7,15 @@ import numpy as np
 from dustmaps.sfd import SFDQuery
 from pyia import GaiaData
 
+from cats.extinction import get_ebv
+
 __all__ = ["PS1Phot", "GaiaDR3Phot", "DESY6Phot"]
 
 
 class PhotometricSurvey(abc.ABC):
     band_names = {}
+    # column names of the magnitude uncertainties, keyed like band_names
+    error_names = {}
     extinction_coeffs = {}
     custom_extinction = False
     dustmaps_cls = SFDQuery
@@ -58,6 +62,38 @@ class PhotometricSurvey(abc.ABC):
         """
         pass
 
+    def get_ebv(self, dustmaps_cls=None, use_cache=True):
+        """
+        E(B-V) at the position of each star.
+
+        Parameters
+        ----------
+        dustmaps_cls : class (optional)
+            A `dustmaps` query class. Defaults to ``dustmaps_cls`` on the class.
+        use_cache : bool (optional)
+            Look up values in the persistent HEALPix cache shared by all surveys and
+            runs (see `cats.extinction.EBVCache`) instead of querying the dust map
+            for every star.
+        """
+        if dustmaps_cls is None:
+            dustmaps_cls = self.dustmaps_cls
+
+        c = self.get_skycoord()
+        if use_cache:
+            return get_ebv(c, dustmaps_cls)
+        return dustmaps_cls().query(c)
+
+    def get_phot_errors(self, tbl):
+        """
+        Add the uncertainties of the bands in ``error_names`` to a table of
+        extinction-corrected photometry as ``<short_name>0_err`` columns. Bands
+        without an uncertainty column in the data are skipped.
+        """
+        for band, err_name in self.error_names.items():
+            if err_name in self.data.colnames:
+                tbl[f"{self.band_names[band]}0_err"] = self.data[err_name]
+        return tbl
+
     def get_ext_corrected_phot(self, dustmaps_cls=None):
         if self.custom_extinction:
             raise RuntimeError("TODO")
@@ -65,8 +101,7 @@ class PhotometricSurvey(abc.ABC):
         if dustmaps_cls is None:
             dustmaps_cls = self.dustmaps_cls
 
-        c = self.get_skycoord()
-        ebv = dustmaps_cls().query(c)
+        ebv = self.get_ebv(dustmaps_cls)
 
         tbl = at.Table()
         new_band_names = []
@@ -75,6 +110,7 @@ class PhotometricSurvey(abc.ABC):
             tbl[f"A_{short_name}"] = Ax
             tbl[f"{short_name}0"] = self.data[band] - Ax
             new_band_names.append(f"{short_name}0")
+        self.get_phot_errors(tbl)
         tbl.meta["band_names"] = new_band_names
         tbl.meta["dustmap"] = dustmaps_cls.__class__.__name__
 
@@ -89,6 +125,7 @@ class PS1Phot(PhotometricSurvey):
         "zMeanPSFMag": "z",
         "yMeanPSFMag": "y",
     }
+    error_names = {band: f"{band}Err" for band in band_names}
 
     # Schlafly+2011, Rv=3.1
     extinction_coeffs = {
@@ -139,7 +176,7 @@ class GaiaDR3Phot(PhotometricSurvey):
         if dustmaps_cls is None:
             dustmaps_cls = self.dustmaps_cls
         g = GaiaData(self.data)
-        As = g.get_ext(dustmaps_cls=self.dustmaps_cls)
+        As = g.get_ext(ebv=self.get_ebv(dustmaps_cls))
         As = {"G": As[0], "BP": As[1], "RP": As[2]}  # NOTE: assumption!
 
         tbl = at.Table()
@@ -151,6 +188,7 @@ class GaiaDR3Phot(PhotometricSurvey):
             tbl[f"A_{short_name}"] = Ax
             tbl[f"{short_name}0"] = self.data[band] - Ax
             new_band_names.append(f"{short_name}0")
+        self.get_phot_errors(tbl)
         tbl.meta["band_names"] = new_band_names
         tbl.meta["dustmap"] = dustmaps_cls.__class__.__name__
 
@@ -162,6 +200,11 @@ class DESY6Phot(PhotometricSurvey):
         "WAVG_MAG_PSF_G": "g",
         "WAVG_MAG_PSF_R": "r",
     }
+    # uncertainties of the BDF_MAG_*_CORRECTED magnitudes used for g0 and r0
+    error_names = {
+        "WAVG_MAG_PSF_G": "BDF_MAG_ERR_G",
+        "WAVG_MAG_PSF_R": "BDF_MAG_ERR_R",
+    }
     # Schlafly+2011, Rv=3.1
     extinction_coeffs = {
         "g": 3.237,
@@ -182,8 +225,7 @@ class DESY6Phot(PhotometricSurvey):
         if dustmaps_cls is None:
             dustmaps_cls = self.dustmaps_cls
 
-        c = self.get_skycoord()
-        ebv = dustmaps_cls().query(c)
+        ebv = self.get_ebv(dustmaps_cls)
 
         tbl = at.Table()
         new_band_names = []
@@ -192,6 +234,7 @@ class DESY6Phot(PhotometricSurvey):
             tbl[f"A_{short_name}"] = Ax
             tbl[f"{short_name}0"] = self.data[f"BDF_MAG_{short_name.upper()}_CORRECTED"]
             new_band_names.append(f"{short_name}0")
+        self.get_phot_errors(tbl)
         tbl.meta["band_names"] = new_band_names
         tbl.meta["dustmap"] = dustmaps_cls.__class__.__name__
 
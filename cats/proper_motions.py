@@ -19,6 +19,8 @@ from scipy.interpolate import UnivariateSpline as US
 from scipy.spatial import ConvexHull
 
 sys.path.append("../")
+from cats.distance import get_distance_track
+from cats.healpix import get_healpix_index
 from cats.inputs import stream_inputs as inputs
 from cats.pawprint.pawprint import Footprint2D, Pawprint
 
@@ -121,17 +123,11 @@ class ProperMotionSelection:
         ##################################
         ## Different proper motion cuts ##
         ##################################
-        if self.stream == "GD-1":
-            # distance spline will instead be a distance modulus spline
-            self.dist_mod_correct = spline_dist(self.data["phi1"]) - self.dist_mod
-        else:
-            self.dist_mod_correct = (
-                5 * np.log10(spline_dist(self.data["phi1"]) * 1000) - 5
-            ) - self.dist_mod
-
-        ## for GD-1 specifically:
-        # distmod_spl = np.poly1d([2.41e-4, 2.421e-2, 15.001])
-        # self.dist_mod_correct = distmod_spl(self.cat["phi1"]) - self.dist_mod
+        # shared with the other stages through the pawprint and the catalogue
+        distance_track = get_distance_track(self.stream, self.pawprint)
+        self.dist_mod_correct = distance_track.dist_mod_correct(
+            self.data, self.dist_mod
+        )
 
         # SHOULD THE CMD CUT ALSO MAKE AN OFFSTREAM MASK? MAY BE USEFUL TO MAKE CUTS FOR SOME STREAMS
         self.initial_masks()
@@ -281,12 +277,8 @@ class ProperMotionSelection:
         #         spline_pm1 = US(self.galstream_phi1, self.galstream_pm_phi1_cosphi2, k=3, s=len(self.galstream_phi1)/1000)
         #         spline_pm2 = US(self.galstream_phi1, self.galstream_pm_phi2, k=3, s=len(self.galstream_phi1)/1000)
 
-        if self.stream == "GD-1":
-            spline_dist = np.poly1d(
-                [2.41e-4, 2.421e-2, 15.001]
-            )  # from Adrian and Kiyan's separate work
-        else:
-            spline_dist = IUS(self.galstream_phi1, self.galstream_dist)
+        # distance modulus as a function of phi1
+        spline_dist = get_distance_track(self.stream, self.pawprint).distmod
 
         return spline_phi2, spline_pm1, spline_pm2, spline_dist
 
@@ -294,23 +286,26 @@ class ProperMotionSelection:
         """
         Initialising the on-sky polygon mask to return only contained sources.
         """
-        on_poly_patch = mpl.patches.Polygon(
-            self.pawprint.skyprint["stream"].vertices[::100],
-            facecolor="none",
-            edgecolor="k",
-            linewidth=2,
-        )
-        on_points = np.vstack((self.data["phi1"], self.data["phi2"])).T
-        on_mask = on_poly_patch.get_path().contains_points(on_points)
-
-        off_poly_patch = mpl.patches.Polygon(
-            self.pawprint.skyprint["background"].vertices[::100],
-            facecolor="none",
-            edgecolor="k",
-            linewidth=2,
-        )
-        off_points = np.vstack((self.data["phi1"], self.data["phi2"])).T
-        off_mask = off_poly_patch.get_path().contains_points(off_points)
+        on_mask = self.pawprint.selection("sky_stream", self.data)
+        off_mask = self.pawprint.selection("sky_background", self.data)
+        if on_mask is not None and off_mask is not None:
+            # already evaluated with Pawprint.evaluate
+            return on_mask, off_mask
+
+        hpx, nside = get_healpix_index(self.data)
+        if hpx is not None:
+            # only stars in pixels on the footprint boundaries are tested
+            on_mask, off_mask = [
+                self.pawprint.skyprint[k].inside_footprint_healpix(
+                    self.data["phi1"], self.data["phi2"], hpx, nside
+                )
+                for k in ["stream", "background"]
+            ]
+            return on_mask, off_mask
+
+        points = np.vstack((self.data["phi1"], self.data["phi2"])).T
+        on_mask = self.pawprint.skyprint["stream"].inside_footprint(points)
+        off_mask = self.pawprint.skyprint["background"].inside_footprint(points)
 
         return on_mask, off_mask
 
@@ -318,6 +313,9 @@ class ProperMotionSelection:
         """
         Initialising the proper motions polygon mask to return only contained sources.
         """
+        cmd_mask = self.pawprint.selection("cmd", self.data)
+        if cmd_mask is not None:
+            return cmd_mask
 
         mag = inputs[self.stream]["mag"]
         color1 = inputs[self.stream]["color1"]
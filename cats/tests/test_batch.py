@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+
+import cats.batch
+from cats.batch import run_batch, summarize
+
+
+def fake_run_stream(stream, catalog_path, output_dir):
+    if stream == "raises":
+        raise RuntimeError("stream failed")
+    if stream == "dies":
+        os._exit(1)
+
+    stream_dir = os.path.join(output_dir, stream)
+    os.makedirs(stream_dir, exist_ok=True)
+    np.savez_compressed(os.path.join(stream_dir, "masks.npz"), selection=[True])
+    times = dict.fromkeys(cats.batch.stages, 0.0)
+    return dict(stream=stream, status="ok", error="", times=times, total=0.0)
+
+
+def test_run_batch_survives_failed_streams(tmp_path, monkeypatch):
+    monkeypatch.setattr(cats.batch, "run_stream", fake_run_stream)
+    streams = ["a", "raises", "b", "dies", "c"]
+
+    results = run_batch(streams, "{stream}.fits", str(tmp_path), max_workers=2)
+
+    assert [res["stream"] for res in results] == streams
+    status = {res["stream"]: res["status"] for res in results}
+    assert status == dict(a="ok", raises="failed", b="ok", dies="failed", c="ok")
+    for stream in ["a", "b", "c"]:
+        assert os.path.exists(tmp_path / stream / "masks.npz")
+    assert len(summarize(results)) == len(streams)
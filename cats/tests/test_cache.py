@@ -0,0 +1,33 @@
+import os
+import time
+
+from cats.cache import prune, temp_suffix, touch
+
+
+def write(path, size, age=0):
+    with open(path, "wb") as f:
+        f.write(b"0" * size)
+    t = time.time() - age
+    os.utime(path, (t, t))
+
+
+def test_prune_lru(tmp_path):
+    for i, name in enumerate(["a", "b", "c"]):
+        write(tmp_path / name, 100, age=30 - 10 * i)
+    touch(tmp_path / "a")
+
+    removed = prune(tmp_path, 200)
+    assert [os.path.basename(f) for f in removed] == ["b"]
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+
+    prune(tmp_path, 0, keep=[tmp_path / "c"])
+    assert os.listdir(tmp_path) == ["c"]
+
+
+def test_prune_skips_files_being_written(tmp_path):
+    write(tmp_path / "entry", 100, age=10)
+    write(tmp_path / f"new{temp_suffix}", 1000)
+    write(tmp_path / f"stale{temp_suffix}", 1000, age=7200)
+
+    prune(tmp_path, 0)
+    assert os.listdir(tmp_path) == [f"new{temp_suffix}"]
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+from scipy.interpolate import interp1d
+from scipy.signal import correlate2d
+
+from cats.benchmarks.pipeline import SyntheticIsochrone, setup
+from cats.benchmarks.synthetic import isochrone_model, make_joined_catalog, make_track
+from cats.CMD import _fft_correlate2d, _subpixel_peak
+from cats.inputs import stream_inputs as inputs
+
+
+@pytest.fixture(scope="module")
+def synthetic():
+    track = make_track()
+    catalog = make_joined_catalog(50_000, track=track)
+    # the pawprint with the proper-motion cuts of a first pass of the pipeline
+    pawprint = setup(catalog, track)["iso"].pawprint
+    return catalog, pawprint
+
+
+class ShiftedIsochrone(SyntheticIsochrone):
+    # the model is offset from the stream stars by (color, magnitude)
+    offset = (0.1, -0.6)
+
+    def generate_isochrone(self):
+        color, mag, self.masses = isochrone_model(self.dist_mod)
+        self.color, self.mag = color + self.offset[0], mag + self.offset[1]
+
+
+@pytest.mark.parametrize("shape1, shape2", [((20, 30), (20, 30)), ((17, 9), (5, 12))])
+def test_fft_correlate2d(shape1, shape2):
+    rng = np.random.default_rng(42)
+    in1, in2 = rng.uniform(size=shape1), rng.uniform(size=shape2)
+
+    expected = correlate2d(in1, in2)
+    ccor = _fft_correlate2d(in1, in2)
+    assert ccor.shape == expected.shape
+    assert np.allclose(ccor, expected, rtol=0, atol=1e-10)
+
+
+def test_fft_correlate2d_zero_lag():
+    rng = np.random.default_rng(42)
+    data = rng.uniform(size=(40, 50))
+    ny, nx = data.shape
+    # data is the model moved by (dy, dx) bins
+    dy, dx = 3, -5
+    model = np.roll(data, (-dy, -dx), axis=(0, 1))
+    model[-dy:] = model[:, :-dx] = 0
+
+    ccor = _fft_correlate2d(data, model)
+    y, x = np.unravel_index(np.argmax(ccor), ccor.shape)
+    assert (y - (ny - 1), x - (nx - 1)) == (dy, dx)
+
+
+def test_subpixel_peak():
+    y, x = np.mgrid[:30, :40]
+    y0, x0 = 12.3, 25.8
+    a = 10 - (y - y0) ** 2 - 0.5 * (x - x0) ** 2
+    assert np.allclose(_subpixel_peak(a), (y0, x0))
+    # a local maximum other than the global one
+    a[2, 3] = a.max() + 1
+    assert np.allclose(_subpixel_peak(a, peak=(12, 26)), (y0, x0))
+
+
+@pytest.mark.parametrize("method", ["fft", "direct", "multires"])
+def test_correct_isochrone_recovers_shift(synthetic, method):
+    catalog, pawprint = synthetic
+    iso = ShiftedIsochrone("GD-1", catalog, pawprint)
+    iso.correct_isochrone(method=method)
+
+    # within a bin of the stream bin_sizes (0.03, 0.2)
+    assert iso.x_shift == pytest.approx(-ShiftedIsochrone.offset[0], abs=0.03)
+    assert iso.y_shift == pytest.approx(-ShiftedIsochrone.offset[1], abs=0.2)
+    assert iso.shift_confidence > 3
+
+
+def test_search_isochrone_shift_confidence(synthetic):
+    catalog, pawprint = synthetic
+    stream = SyntheticIsochrone("GD-1", catalog, pawprint)
+    stream.search_isochrone_shift()
+    background = SyntheticIsochrone("GD-1", catalog[~catalog["is_stream"]], pawprint)
+    background.search_isochrone_shift()
+
+    assert stream.shift_confidence > 3
+    assert background.shift_confidence < 3
+
+
+@pytest.mark.parametrize("stream", list(inputs))
+def test_cmd_selection_matches_polygon(synthetic, stream):
+    catalog, pawprint = synthetic
+    pars = inputs[stream]
+    # the synthetic photometry under the band names of the stream
+    catalog = catalog.copy(copy_data=False)
+    for name, band in zip([pars["mag"], pars["color1"], pars["color2"]], "ggr"):
+        if name not in catalog.colnames:
+            catalog[name] = catalog[f"{band}0"]
+    iso = SyntheticIsochrone(stream, catalog, pawprint)
+
+    # the bounds of simpleSln, from the shifted isochrone and the tolerance
+    tol = iso.get_tolerance(pars["scale_err"])
+    color = iso.color + iso.x_shift
+    mag = iso.mag + iso.y_shift
+    iso_low = interp1d(mag, color - tol, fill_value="extrapolate")
+    iso_high = interp1d(mag, color + tol, fill_value="extrapolate")
+    cmd_footprint, cmd_mask = iso.make_poly(
+        iso_low, iso_high, pars["maxmag"], minmag=iso.turnoff
+    )
+
+    color, mag = iso._cmd_points()
+    expected = cmd_footprint.inside_footprint(np.stack((color, mag), axis=1))
+    # away from the edges of the polygon
+    mag_vals = np.arange(iso.turnoff, pars["maxmag"], 0.01)
+    edge_distance = np.min(
+        np.abs(
+            [
+                color - np.interp(mag, mag_vals, iso_low(mag_vals)),
+                color - np.interp(mag, mag_vals, iso_high(mag_vals)),
+                mag - mag_vals[0],
+                mag - mag_vals[-1],
+            ]
+        ),
+        axis=0,
+    )
+    far = edge_distance > 1e-6
+
+    assert cmd_mask.sum() > 100
+    assert np.array_equal(cmd_mask[far], expected[far])
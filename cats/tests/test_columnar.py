@@ -0,0 +1,102 @@
+import os
+
+import astropy.table as at
+import astropy.units as u
+import numpy as np
+import pytest
+
+from cats.columnar import ColumnarCatalog, ColumnarWriter, read_joined
+
+
+def make_table(n=100, seed=42):
+    rng = np.random.default_rng(seed)
+    tbl = at.Table()
+    tbl["source_id"] = rng.permutation(10 * n)[:n].astype(np.int64)
+    tbl["phi1"] = rng.uniform(-90, 10, n) * u.deg
+    tbl["g0"] = at.MaskedColumn(rng.uniform(15, 24, n), mask=rng.uniform(size=n) < 0.1)
+    tbl.meta["stream"] = "GD-1"
+    return tbl
+
+
+def test_round_trip(tmp_path):
+    tbl = make_table()
+    path = str(tmp_path / "joined.cols")
+    with ColumnarWriter(path) as writer:
+        writer.append(tbl[:60])
+        writer.append(tbl[60:])
+
+    cat = read_joined(path)
+    assert isinstance(cat, ColumnarCatalog)
+    assert len(cat) == len(tbl)
+    assert cat.colnames == tbl.colnames
+    assert cat.meta == tbl.meta
+
+    rows = cat.to_table()
+    for name in tbl.colnames:
+        assert np.all(rows[name] == tbl[name])
+    assert np.all(rows["g0"].mask == tbl["g0"].mask)
+
+
+def test_getitem_like_table(tmp_path):
+    tbl = make_table()
+    path = str(tmp_path / "joined.cols")
+    with ColumnarWriter(path) as writer:
+        writer.append(tbl)
+    cat = ColumnarCatalog(path)
+
+    # columns keep their units, and are views of the memory-mapped files
+    col = cat["phi1"]
+    assert isinstance(col, at.Column)
+    assert col.unit == u.deg
+    assert not col.flags.writeable
+    assert isinstance(cat["g0"], at.MaskedColumn)
+    assert np.all(cat["g0"].mask == tbl["g0"].mask)
+
+    sub = cat[["source_id", "phi1"]]
+    assert isinstance(sub, at.Table)
+    assert sub.colnames == ["source_id", "phi1"]
+    assert sub["phi1"].unit == u.deg
+
+    mask = np.asarray(tbl["phi1"]) > 0
+    assert np.all(cat[mask]["source_id"] == tbl[mask]["source_id"])
+    assert np.all(cat[10:20]["phi1"] == tbl[10:20]["phi1"])
+    assert cat[3]["source_id"] == tbl[3]["source_id"]
+
+
+def test_writer_later_tables(tmp_path):
+    first = at.Table({"flag": ["a", "b"], "g0": [18.0, 19.0], "n": [1, 2]})
+    second = at.Table(
+        {
+            "flag": ["longer", "c"],
+            "g0": at.MaskedColumn([20.0, 21.0], mask=[False, True]),
+            "n": np.array([3, 4], dtype=np.int32),
+        }
+    )
+    path = str(tmp_path / "joined.cols")
+    with ColumnarWriter(path) as writer:
+        writer.append(first)
+        writer.append(second)
+
+    rows = ColumnarCatalog(path).to_table()
+    assert list(rows["flag"]) == ["a", "b", "longer", "c"]
+    assert list(rows["g0"].mask) == [False, False, False, True]
+    assert list(rows["g0"][:3]) == [18.0, 19.0, 20.0]
+    assert list(rows["n"]) == [1, 2, 3, 4]
+
+    # values that would be truncated are an error
+    with pytest.raises(ValueError):
+        with ColumnarWriter(path, overwrite=True) as writer:
+            writer.append(first)
+            writer.append(at.Table({"flag": ["d"], "g0": [1.0], "n": [0.5]}))
+
+
+def test_writer_discards_on_error(tmp_path):
+    path = str(tmp_path / "joined.cols")
+    with pytest.raises(RuntimeError):
+        with ColumnarWriter(path) as writer:
+            writer.append(make_table())
+            raise RuntimeError("join failed")
+
+    assert not os.path.exists(path)
+    with pytest.raises(OSError):
+        read_joined(path)
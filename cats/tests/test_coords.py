@@ -0,0 +1,117 @@
+import os
+
+import astropy.coordinates as coord
+import astropy.units as u
+import galstreams as gst
+import numpy as np
+import pytest
+from gala.coordinates import GreatCircleICRSFrame, reflex_correct
+
+from cats.coords import (
+    _frame_key,
+    galcen_frame,
+    get_rotation_matrix,
+    icrs_to_stream,
+    reflex_correct_stream,
+    stream_to_icrs,
+)
+from cats.inputs import stream_inputs as inputs
+
+
+def get_track6d(stream):
+    pars = inputs[stream]
+    name = f"track.st.{pars['short_name']}.{pars['pawprint_id']}"
+    tracks = os.path.join(os.path.dirname(gst.__file__), "tracks")
+    return gst.Track6D(
+        stream_name=pars["short_name"],
+        track_name=pars["pawprint_id"],
+        track_file=os.path.join(tracks, name + ".ecsv"),
+        summary_file=os.path.join(tracks, name + ".summary.ecsv"),
+    )
+
+
+def random_icrs(n=10_000, seed=42):
+    rng = np.random.default_rng(seed)
+    ra = rng.uniform(0, 360, n)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    pmra, pmdec = rng.normal(0, 10, (2, n))
+    return ra, dec, pmra, pmdec
+
+
+@pytest.mark.parametrize("stream", list(inputs))
+def test_icrs_to_stream(stream):
+    frame = get_track6d(stream).stream_frame
+    ra, dec, pmra, pmdec = random_icrs()
+
+    phi1, phi2, pm1, pm2 = icrs_to_stream(frame, ra, dec, pmra, pmdec)
+
+    c = coord.SkyCoord(
+        ra=ra * u.deg,
+        dec=dec * u.deg,
+        pm_ra_cosdec=pmra * u.mas / u.yr,
+        pm_dec=pmdec * u.mas / u.yr,
+    ).transform_to(frame)
+    dphi1 = (phi1 - c.phi1.degree + 180) % 360 - 180
+    assert np.abs(dphi1).max() < 1e-9
+    assert np.abs(phi2 - c.phi2.degree).max() < 1e-9
+    assert np.abs(pm1 - c.pm_phi1_cosphi2.to_value(u.mas / u.yr)).max() < 1e-9
+    assert np.abs(pm2 - c.pm_phi2.to_value(u.mas / u.yr)).max() < 1e-9
+
+
+@pytest.mark.parametrize("stream", list(inputs))
+def test_stream_to_icrs(stream):
+    frame = get_track6d(stream).stream_frame
+    ra, dec, pmra, pmdec = random_icrs()
+
+    back = stream_to_icrs(frame, *icrs_to_stream(frame, ra, dec, pmra, pmdec))
+
+    dra = (back[0] - ra + 180) % 360 - 180
+    assert np.abs(dra * np.cos(np.radians(dec))).max() < 1e-9
+    assert np.abs(back[1] - dec).max() < 1e-9
+    assert np.abs(back[2] - pmra).max() < 1e-9
+    assert np.abs(back[3] - pmdec).max() < 1e-9
+
+
+def test_rotation_matrix_cache_precision():
+    pole = coord.SkyCoord(ra=34.5987 * u.deg, dec=29.7331 * u.deg)
+    frame1 = GreatCircleICRSFrame.from_pole_ra0(pole, 200 * u.deg)
+    # differs from frame1 below the precision of the repr of its attributes
+    frame2 = GreatCircleICRSFrame.from_pole_ra0(pole, (200 + 1e-10) * u.deg)
+
+    assert _frame_key(frame1) != _frame_key(frame2)
+    assert _frame_key(frame1) == _frame_key(frame1.replicate_without_data())
+    assert get_rotation_matrix(frame1) is get_rotation_matrix(frame1)
+
+
+@pytest.mark.parametrize("stream", list(inputs))
+def test_reflex_correct_stream(stream):
+    track6d = get_track6d(stream)
+    frame = track6d.stream_frame
+    track = track6d.track.transform_to(frame)
+
+    rng = np.random.default_rng(42)
+    n = 10_000
+    idx = rng.integers(len(track), size=n)
+    phi1 = track.phi1.degree[idx]
+    phi2 = track.phi2.degree[idx] + rng.normal(0, 0.5, n)
+    pm1, pm2 = rng.normal(0, 10, (2, n))
+    distance = np.abs(track.distance.to_value(u.kpc)[idx] * rng.normal(1, 0.1, n))
+
+    pm1_corr, pm2_corr = reflex_correct_stream(frame, phi1, phi2, pm1, pm2, distance)
+
+    c = coord.SkyCoord(
+        phi1=phi1 * u.deg,
+        phi2=phi2 * u.deg,
+        distance=distance * u.kpc,
+        pm_phi1_cosphi2=pm1 * u.mas / u.yr,
+        pm_phi2=pm2 * u.mas / u.yr,
+        radial_velocity=np.zeros(n) * u.km / u.s,
+        frame=frame,
+    )
+    expected = reflex_correct(c, galactocentric_frame=galcen_frame)
+    assert np.allclose(
+        pm1_corr, expected.pm_phi1_cosphi2.to_value(u.mas / u.yr), rtol=0, atol=1e-6
+    )
+    assert np.allclose(
+        pm2_corr, expected.pm_phi2.to_value(u.mas / u.yr), rtol=0, atol=1e-6
+    )
@@ -0,0 +1,153 @@
+from types import SimpleNamespace
+
+import astropy.table as at
+import numpy as np
+import pytest
+from pyia import GaiaData
+
+import cats.data
+from cats.benchmarks.synthetic import make_joined_catalog, make_track, split_astro_photo
+from cats.columnar import ColumnarCatalog, write_columnar
+from cats.data import (
+    join_on_source_id,
+    make_astro_photo_joined_data,
+    make_astro_photo_joined_data_chunked,
+)
+from cats.distance import DistanceTrack
+
+
+@pytest.fixture(scope="module")
+def synthetic():
+    track = make_track()
+    catalog = make_joined_catalog(5_000, track=track)
+    gaia_table, phot_data = split_astro_photo(catalog)
+    return track, gaia_table, phot_data
+
+
+def test_joined_distmod(synthetic, tmp_path):
+    track, gaia_table, phot_data = synthetic
+    distance_track = DistanceTrack.from_track6d(track, k=1)
+
+    joined = make_astro_photo_joined_data(GaiaData(gaia_table), phot_data, track)
+    chunked = make_astro_photo_joined_data_chunked(
+        [(GaiaData(gaia_table), phot_data)], track, str(tmp_path / "joined.cols")
+    )
+    for catalog in [joined, chunked]:
+        assert catalog.meta["distmod_key"] == distance_track.key
+        assert np.allclose(catalog["distmod"], distance_track.distmod(catalog["phi1"]))
+
+        # reused (not computed) by the pipeline stages with the same track
+        reused = DistanceTrack(None, "galstreams", distance_track.key)
+        assert np.array_equal(reused.add_distmod_column(catalog), catalog["distmod"])
+
+
+def test_add_distmod_column(synthetic, tmp_path):
+    track, gaia_table, _ = synthetic
+    distance_track = DistanceTrack.from_polynomial(track.pars["distmod_coeffs"])
+    write_columnar(gaia_table[:100], str(tmp_path / "cat.cols"))
+    catalog = ColumnarCatalog(str(tmp_path / "cat.cols"))
+    catalog["phi1"] = np.linspace(-80, 0, 100)
+
+    distmod = distance_track.add_distmod_column(catalog)
+    assert np.array_equal(catalog["distmod"], distmod)
+    assert catalog.meta["distmod_key"] == distance_track.key
+    assert "distmod" in catalog.to_table().colnames
+
+    with pytest.raises(TypeError):
+        distance_track.add_distmod_column({"phi1": np.zeros(3)})
+
+
+def astropy_join(left, right, keys="source_id"):
+    return at.unique(at.join(left, right, keys=keys), keys=keys)
+
+
+def assert_tables_equal(a, b):
+    assert a.colnames == b.colnames
+    for name in a.colnames:
+        # masked values are not compared
+        no_mask = np.zeros(len(a), dtype=bool)
+        mask = getattr(a[name], "mask", no_mask)
+        assert np.array_equal(mask, getattr(b[name], "mask", no_mask)), name
+        assert np.array_equal(
+            np.asarray(a[name])[~mask], np.asarray(b[name])[~mask]
+        ), name
+
+
+def with_duplicates(table, rng, n=100):
+    """Shuffled ``table`` with ``n`` repeated rows, as from overlapping tiles."""
+    table = at.vstack([table, table[rng.integers(0, len(table), n)]])
+    return table[rng.permutation(len(table))]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_join_on_source_id(seed):
+    rng = np.random.default_rng(seed)
+    n_left, n_right = 500, 400
+    left = at.Table(
+        {
+            "source_id": rng.permutation(1000)[:n_left],
+            "ra": rng.uniform(0, 360, n_left),
+            "parallax": rng.normal(0, 1, n_left),
+        }
+    )
+    right = at.Table(
+        {
+            "source_id": rng.permutation(1000)[:n_right],
+            "ra": rng.uniform(0, 360, n_right),
+            "g0": at.MaskedColumn(
+                rng.uniform(15, 24, n_right), mask=rng.uniform(size=n_right) < 0.2
+            ),
+        }
+    )
+    left, right = with_duplicates(left, rng), with_duplicates(right, rng)
+
+    joined = join_on_source_id(left, right)
+    assert joined.colnames == ["source_id", "ra_1", "parallax", "ra_2", "g0"]
+    assert_tables_equal(joined, astropy_join(left, right))
+
+
+def test_joined_matches_astropy(synthetic, tmp_path, monkeypatch):
+    track, gaia_table, phot_data = synthetic
+    rng = np.random.default_rng(42)
+
+    # duplicated Gaia and photometry rows, and masked photometry
+    gaia_table = with_duplicates(gaia_table, rng)
+    phot = phot_data.data.copy()
+    for name, col in phot_data.get_ext_corrected_phot().items():
+        phot[name] = at.MaskedColumn(col, mask=rng.uniform(size=len(col)) < 0.1)
+    phot["star_mask"] = phot_data.get_star_mask()
+    phot = with_duplicates(phot, rng)
+
+    def survey(rows):
+        data = phot[rows]
+        return SimpleNamespace(
+            data=data[["source_id"]],
+            get_ext_corrected_phot=lambda: data[["g0", "r0", "i0"]],
+            get_star_mask=lambda: np.asarray(data["star_mask"]),
+        )
+
+    with monkeypatch.context() as m:
+        m.setattr(cats.data, "join_on_source_id", astropy_join)
+        expected = make_astro_photo_joined_data(
+            GaiaData(gaia_table), survey(slice(None)), track
+        )
+
+    joined = make_astro_photo_joined_data(
+        GaiaData(gaia_table), survey(slice(None)), track
+    )
+    assert joined.meta == expected.meta
+    assert_tables_equal(joined, expected)
+
+    # chunks that do not share any source_id
+    chunks = [
+        (
+            GaiaData(gaia_table[gaia_table["source_id"] % 3 == k]),
+            survey(phot["source_id"] % 3 == k),
+        )
+        for k in range(3)
+    ]
+    chunked = make_astro_photo_joined_data_chunked(
+        chunks, track, str(tmp_path / "joined.cols")
+    ).to_table()
+    chunked.sort("source_id")
+    assert_tables_equal(chunked, expected)
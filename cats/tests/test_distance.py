@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import astropy.coordinates as coord
+import astropy.units as u
+import gala.coordinates as gc
+import numpy as np
+import pytest
+
+from cats.data import _get_distance_interpolator
+from cats.distance import DistanceTrack
+
+
+def make_track6d(distance_unit):
+    frame = gc.GreatCircleICRSFrame.from_pole_ra0(
+        coord.SkyCoord(ra=30 * u.deg, dec=40 * u.deg), 100 * u.deg
+    )
+    phi1 = np.linspace(-20, 20, 41) * u.deg
+    distance = (10 + 0.1 * phi1.value) * u.kpc
+    track = coord.SkyCoord(
+        phi1=phi1,
+        phi2=np.zeros(41) * u.deg,
+        distance=distance.to(distance_unit),
+        frame=frame,
+    ).icrs
+    return SimpleNamespace(track=track, stream_frame=frame)
+
+
+@pytest.mark.parametrize("distance_unit", [u.kpc, u.pc])
+def test_distance_unit_from_track(distance_unit):
+    track6d = make_track6d(distance_unit)
+    _, dist_interp, dist_unit, _ = _get_distance_interpolator(track6d)
+    assert dist_unit == distance_unit
+
+    phi1 = np.array([-15.0, 0.0, 12.5])
+    expected = (10 + 0.1 * phi1) * u.kpc
+    assert u.allclose(dist_interp(phi1) * dist_unit, expected)
+
+    dt = DistanceTrack.from_track6d(track6d)
+    assert np.allclose(dt.distmod(phi1), coord.Distance(expected).distmod.value)
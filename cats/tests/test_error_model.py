@@ -0,0 +1,74 @@
+import astropy.table as at
+import numpy as np
+import pytest
+
+from cats.error_model import BinnedErrorModel
+from cats.photometry import DESY6Phot, PS1Phot
+
+
+class ConstantDustMap:
+    def query(self, c):
+        return np.full(len(c), 0.01)
+
+
+def test_binned_error_model():
+    rng = np.random.default_rng(42)
+    mag = rng.uniform(16, 22, 10_000)
+    err = 0.01 * 10 ** (0.4 * (mag - 16))
+
+    model = BinnedErrorModel(np.append(mag, -999.0), np.append(err, -999.0))
+    for m in [16.05, 19.05, 21.95]:
+        in_bin = np.floor(mag / 0.1) == np.floor(m / 0.1)
+        assert np.isclose(model(m), np.median(err[in_bin]))
+
+
+@pytest.mark.parametrize(
+    "mag, err", [([], []), ([np.nan, 20.0], [0.1, np.nan]), ([18.0, 20.0], [0.1, 0.2])]
+)
+def test_binned_error_model_too_few_stars(mag, err):
+    with pytest.raises(ValueError):
+        BinnedErrorModel(mag, err)
+
+
+@pytest.mark.parametrize(
+    "phot_cls, mag_fmt, err_fmt",
+    [
+        (PS1Phot, "{b}MeanPSFMag", "{b}MeanPSFMagErr"),
+        (DESY6Phot, "BDF_MAG_{B}_CORRECTED", "BDF_MAG_ERR_{B}"),
+    ],
+)
+def test_phot_errors(phot_cls, mag_fmt, err_fmt):
+    bands = list(phot_cls.band_names.values())
+    data = at.Table()
+    for i, b in enumerate(bands):
+        data[mag_fmt.format(b=b, B=b.upper())] = [18.0 + i, 20.0 + i]
+        data[err_fmt.format(b=b, B=b.upper())] = [0.01 * (i + 1), 0.1 * (i + 1)]
+
+    tbl = phot_cls(data).get_phot_errors(at.Table())
+    assert tbl.colnames == [f"{b}0_err" for b in bands]
+    for i, b in enumerate(bands):
+        assert np.allclose(tbl[f"{b}0_err"], [0.01 * (i + 1), 0.1 * (i + 1)])
+
+
+def test_desy6_errors_match_mags(tmp_path, monkeypatch):
+    monkeypatch.setenv("CATS_CACHE_DIR", str(tmp_path))
+    data = at.Table(
+        {
+            "RA": [150.0, 151.0],
+            "DEC": [10.0, 11.0],
+            "WAVG_MAG_PSF_G": [18.2, 20.3],
+            "WAVG_MAGERR_PSF_G": [0.5, 0.5],
+            "BDF_MAG_G_CORRECTED": [18.0, 20.0],
+            "BDF_MAG_ERR_G": [0.01, 0.1],
+            "WAVG_MAG_PSF_R": [17.7, 19.8],
+            "WAVG_MAGERR_PSF_R": [0.5, 0.5],
+            "BDF_MAG_R_CORRECTED": [17.5, 19.5],
+            "BDF_MAG_ERR_R": [0.02, 0.2],
+        }
+    )
+
+    tbl = DESY6Phot(data).get_ext_corrected_phot(ConstantDustMap)
+    for b in ["g", "r"]:
+        B = b.upper()
+        assert np.array_equal(tbl[f"{b}0"], data[f"BDF_MAG_{B}_CORRECTED"])
+        assert np.array_equal(tbl[f"{b}0_err"], data[f"BDF_MAG_ERR_{B}"])
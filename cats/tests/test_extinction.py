@@ -0,0 +1,62 @@
+import os
+
+import astropy.coordinates as coord
+import astropy.units as u
+import numpy as np
+
+import cats.extinction
+from cats.extinction import EBVCache
+
+
+class CountingDustMap:
+    instances = 0
+
+    def __init__(self):
+        CountingDustMap.instances += 1
+
+    def query(self, c):
+        return 0.01 + 0.001 * np.abs(c.dec.degree)
+
+
+def random_coords(n, seed):
+    rng = np.random.default_rng(seed)
+    ra = rng.uniform(100, 200, n)
+    dec = rng.uniform(-10, 60, n)
+    return coord.SkyCoord(ra * u.deg, dec * u.deg)
+
+
+def test_repeat_query_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(CountingDustMap, "instances", 0)
+    c = random_coords(5_000, seed=42)
+
+    ebv = EBVCache(CountingDustMap, cache_dir=str(tmp_path)).query(c)
+    assert CountingDustMap.instances == 1
+    # to the float32 precision of the cache, at the pixel centers
+    assert np.allclose(ebv, CountingDustMap().query(c), atol=1e-4)
+
+    # a new run (with a cache read from disk) does not create the dust map
+    monkeypatch.setattr(CountingDustMap, "instances", 0)
+    cache = EBVCache(CountingDustMap, cache_dir=str(tmp_path))
+    assert np.array_equal(cache.query(c), ebv)
+    assert np.array_equal(cache.query(c[::7]), ebv[::7])
+    assert CountingDustMap.instances == 0
+
+
+def test_cache_batches_and_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(cats.extinction, "_max_batches", 4)
+    cache = EBVCache(CountingDustMap, cache_dir=str(tmp_path))
+    queries = [random_coords(1_000, seed=i) for i in range(10)]
+    results = [cache.query(c) for c in queries]
+
+    assert len(os.listdir(cache.path)) <= 5
+    reread = EBVCache(CountingDustMap, cache_dir=str(tmp_path))
+    for c, ebv in zip(queries, results):
+        assert np.array_equal(reread.query(c), ebv)
+
+    # least recently used batches are removed beyond the size limit
+    monkeypatch.setattr(cats.extinction, "ebv_cache_size", 20_000)
+    cache.query(random_coords(1_000, seed=100))
+    sizes = [
+        os.path.getsize(os.path.join(cache.path, f)) for f in os.listdir(cache.path)
+    ]
+    assert sum(sizes) <= 20_000
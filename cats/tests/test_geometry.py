@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from matplotlib.path import Path
+
+from cats.pawprint.geometry import (
+    PolygonIndex,
+    PolygonRaster,
+    _segment_distance,
+    simplify_polygon,
+)
+
+
+def random_polygon(rng, kind):
+    """A random star-shaped, self-intersecting or grid-snapped polygon."""
+    n = rng.integers(3, 60)
+    if kind == "self-intersecting":
+        return rng.uniform(-1, 1, (n, 2))
+    angle = np.sort(rng.uniform(0, 2 * np.pi, n))
+    r = rng.uniform(0.3, 1, n)
+    v = np.stack((rng.uniform(1, 5) * r * np.cos(angle), r * np.sin(angle)), axis=1)
+    if kind == "grid":
+        # axis-parallel edges, repeated coordinates and collinear vertices
+        v = np.round(v, 1)
+    return v
+
+
+def boundary_points(rng, v, n=500):
+    """The vertices, points on the edges and grid-snapped points near them."""
+    edge = rng.integers(0, len(v), n)
+    t = rng.uniform(size=(n, 1))
+    on_edges = v[edge] + t * (np.roll(v, -1, axis=0)[edge] - v[edge])
+    return np.concatenate((v, on_edges, np.round(on_edges, 1)))
+
+
+@pytest.mark.parametrize("kind", ["star", "self-intersecting", "grid"])
+def test_polygon_index_matches_matplotlib(kind):
+    rng = np.random.default_rng(42)
+    for _ in range(200):
+        v = random_polygon(rng, kind)
+        points = np.concatenate(
+            (
+                rng.uniform(v.min(axis=0) - 0.2, v.max(axis=0) + 0.2, (2000, 2)),
+                boundary_points(rng, v),
+            )
+        )
+        expected = Path(v).contains_points(points)
+        assert np.array_equal(PolygonIndex(v).contains_points(points), expected)
+        # the bucketing must not change the answer
+        for n_buckets in (1, 7):
+            index = PolygonIndex(v, n_buckets=n_buckets)
+            assert np.array_equal(index.contains_points(points), expected)
+
+
+def test_polygon_index_chunks():
+    rng = np.random.default_rng(42)
+    v = random_polygon(rng, "star")
+    points = np.concatenate((rng.uniform(-5, 5, (5000, 2)), boundary_points(rng, v)))
+    index = PolygonIndex(v)
+    assert np.array_equal(
+        index.contains_points(points, chunk_size=100), index.contains_points(points)
+    )
+
+
+def boundary_distance(points, v):
+    """Distance of each point to the closed polyline through ``v``."""
+    return np.min(
+        [_segment_distance(points, a, b) for a, b in zip(v, np.roll(v, -1, axis=0))],
+        axis=0,
+    )
+
+
+@pytest.mark.parametrize("tolerance", [0.01, 0.1, 0.5])
+def test_simplify_polygon_tolerance(tolerance):
+    rng = np.random.default_rng(42)
+    # a wavy stream-like footprint with noisy edges, and a spiky blob
+    phi1 = np.linspace(-90, 10, 1000)
+    mid = 5 * np.sin(phi1 / 15)
+    noise = rng.normal(0, 0.05, (2, len(phi1)))
+    stream = np.concatenate(
+        (
+            np.stack((phi1, mid + 1 + noise[0]), axis=1),
+            np.stack((phi1[::-1], mid[::-1] - 1 + noise[1]), axis=1),
+        )
+    )
+    angle = np.linspace(0, 2 * np.pi, 500, endpoint=False)
+    r = 3 + rng.uniform(0, 1, len(angle))
+    blob = np.stack((r * np.cos(angle), r * np.sin(angle)), axis=1)
+
+    for v in (stream, blob):
+        simple = simplify_polygon(v, tolerance)
+        assert len(simple) < len(v)
+
+        # points close to the boundary, where the two polygons disagree
+        edge = rng.integers(0, len(v), 20_000)
+        t = rng.uniform(size=(len(edge), 1))
+        points = v[edge] + t * (np.roll(v, -1, axis=0)[edge] - v[edge])
+        points += rng.normal(0, tolerance, points.shape)
+
+        inside = PolygonIndex(v).contains_points(points)
+        changed = inside != PolygonIndex(simple).contains_points(points)
+        assert changed.any()
+        assert np.all(boundary_distance(points[changed], v) <= tolerance)
+
+
+@pytest.mark.parametrize("shape", [(8, 8), (64, 16), (128, 128)])
+@pytest.mark.parametrize("kind", ["star", "self-intersecting", "grid"])
+def test_polygon_raster_matches_index(kind, shape):
+    rng = np.random.default_rng(42)
+    for _ in range(50):
+        v = random_polygon(rng, kind)
+        near = boundary_points(rng, v)
+        points = np.concatenate(
+            (
+                rng.uniform(v.min(axis=0) - 0.2, v.max(axis=0) + 0.2, (2000, 2)),
+                near,
+                near + rng.normal(0, 1e-3, near.shape),
+            )
+        )
+        index = PolygonIndex(v)
+        raster = PolygonRaster(v, shape=shape, index=index)
+        assert np.array_equal(
+            raster.contains_points(points), index.contains_points(points)
+        )
@@ -0,0 +1,29 @@
+import sys
+
+import numpy as np
+
+import cats.isochrone_cache
+from cats.isochrone_cache import sample_isochrone
+
+
+def test_cache_hit_needs_no_models(tmp_path, monkeypatch):
+    monkeypatch.setenv("CATS_CACHE_DIR", str(tmp_path))
+    calls = []
+
+    def compute(*args):
+        calls.append(args)
+        return dict(initial_mass=[0.1, 0.5], mag_1=[20.0, 18.0], mag_2=[19.0, 17.5])
+
+    monkeypatch.setattr(cats.isochrone_cache, "_compute_isochrone", compute)
+    args = ("PS1", 12.0, -1.5, 8.0, "g", "r")
+    miss = sample_isochrone(*args)
+
+    # a hit does not compute the isochrone, and does not import the model packages
+    for name in ["isochrones", "ugali"]:
+        monkeypatch.setitem(sys.modules, name, None)
+    hit = sample_isochrone(*args)
+
+    assert len(calls) == 1
+    assert miss.keys() == hit.keys()
+    for name in miss:
+        assert np.array_equal(miss[name], hit[name])
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from cats.isochrone_grid import IsochroneGrid, _resample
+
+
+def mock_isochrone(age, n=400):
+    """
+    Sampled like `ugali` isochrones: the main sequence, turnoff, subgiant branch and
+    red giant branch, with the last ~4% of the mass range past the turnoff, then
+    the horizontal branch.
+    """
+    m_turnoff = 0.85 - 0.02 * (age - 10)
+    mass = np.linspace(0.1, m_turnoff + 0.03, n)
+    ms = np.clip((mass - 0.1) / (m_turnoff - 0.1), 0, 1)
+    post = np.clip((mass - m_turnoff) / 0.03, 0, 1)
+    sgb, rgb = np.clip(post / 0.4, 0, 1), np.clip((post - 0.4) / 0.6, 0, 1)
+    color = 1.6 - 1.2 * ms + 0.45 * sgb + 0.5 * rgb + 0.02 * (age - 10)
+    mag = 12 - 8 * ms - 0.4 * sgb - 4.0 * rgb + 0.1 * (age - 10)
+
+    mass = np.append(mass, mass[-1] + [0.001, 0.002])
+    color = np.append(color, [0.8, 0.6])
+    mag = np.append(mag, [0.5, 0.6])
+    mass_pdf = mass**-2.35
+    mass_pdf /= 2 * mass_pdf.sum()
+    return dict(
+        initial_mass=mass,
+        actual_mass=mass,
+        mass_pdf=mass_pdf,
+        mag_1=mag,
+        mag_2=mag - color,
+    )
+
+
+def test_resample_aligns_phases():
+    n_points = 200
+    for age in [9.0, 12.0]:
+        iso = mock_isochrone(age)
+        mag, color, mass, mass_pdf = _resample(iso, n_points)
+
+        # the turnoff is at the same point, and half the points are past it
+        assert np.argmin(color) == round(0.5 * (n_points - 1))
+        # up to the point before the tip, as in cats.CMD.Isochrone
+        assert mag[0] == pytest.approx(iso["mag_1"][0])
+        assert mag[-1] == pytest.approx(iso["mag_1"][-4])
+        assert np.all(np.diff(mass) >= 0)
+        assert mass_pdf.sum() == pytest.approx(iso["mass_pdf"][:-3].sum())
+
+
+def test_grid_interpolation():
+    ages, fehs = [9.0, 12.0], [-2.0, -1.0]
+    values = np.array([[_resample(mock_isochrone(a), 50) for _ in fehs] for a in ages])
+    grid = IsochroneGrid(ages, fehs, *np.moveaxis(values, 2, 0))
+
+    color, mag, mass, mass_pdf = grid(ages[0], fehs[0], dist_mod=14.0)
+    assert np.allclose(mag, values[0, 0, 0] + 14.0)
+    assert np.allclose(color, values[0, 0, 1])
+
+    color, mag, _, _ = grid(np.mean(ages), fehs[0])
+    assert np.allclose(mag, values[:, 0, 0].mean(axis=0))
+    assert np.argmin(color) == round(0.5 * 49)
@@ -0,0 +1,179 @@
+import astropy.table as at
+import astropy.units as u
+import numpy as np
+import pytest
+
+from cats.benchmarks.synthetic import make_joined_catalog, make_pawprint, make_track
+from cats.distance import DistanceTrack
+from cats.healpix import add_healpix_index, get_healpix_index
+from cats.inputs import stream_inputs as inputs
+from cats.pawprint.pawprint import Footprint2D, Pawprint, StreamTrack, TrackFootprint
+from cats.tests.test_coords import get_track6d
+
+
+def track_coordinates(pawprint):
+    track = pawprint.track.track.transform_to(pawprint.track.stream_frame)
+    return track.phi1.degree, track.phi2.degree
+
+
+def test_selection_tracks_footprint_state():
+    track = make_track()
+    catalog = make_joined_catalog(20_000, track=track)
+    pawprint = make_pawprint(track, width=2.0)
+
+    pawprint.evaluate(catalog)
+    on = pawprint.selection("sky_stream", catalog)
+    assert on is not None
+    assert on.sum() > 0
+
+    # a new catalog, or a footprint changed in place, makes the bits stale
+    assert pawprint.selection("sky_stream", catalog[:100]) is None
+    pawprint.skyprint["stream"].simplify(0.5)
+    assert pawprint.selection("sky_stream", catalog) is None
+    assert pawprint.selection("sky_background", catalog) is not None
+
+    pawprint.evaluate(catalog)
+    assert pawprint.selection("sky_stream", catalog) is not None
+    pawprint.skyprint["background"].rasterize((64, 64))
+    assert pawprint.selection("sky_background", catalog) is None
+
+    pawprint.skyprint["stream"].vertices[0] += 1.0
+    assert pawprint.selection("sky_stream", catalog) is None
+
+    pawprint.evaluate(catalog)
+    assert np.array_equal(
+        pawprint.selection("sky_stream", catalog),
+        pawprint.skyprint["stream"].inside_footprint(
+            np.stack((catalog["phi1"], catalog["phi2"]), axis=1)
+        ),
+    )
+
+
+def test_save_pawprint_round_trip(tmp_path):
+    track = make_track()
+    pawprint = make_pawprint(track, width=2.0)
+    pawprint.skyprint["stream"].simplify(0.01).rasterize((64, 64))
+
+    fname = str(tmp_path / "pawprint.asdf")
+    pawprint.save_pawprint(fname)
+    loaded = Pawprint.from_file(fname)
+
+    for a, b in zip(track_coordinates(pawprint), track_coordinates(loaded)):
+        assert np.allclose(a, b, rtol=0, atol=1e-8)
+    # a single frame is saved, in which the track runs through the footprints
+    assert loaded.track.stream_frame is loaded.stream_frame
+    phi1 = track_coordinates(loaded)[0]
+    vertices = loaded.skyprint["stream"].vertices
+    assert vertices[:, 0].min() <= phi1.min() and phi1.max() <= vertices[:, 0].max()
+    for name in ["stream", "background"]:
+        a, b = pawprint.skyprint[name], loaded.skyprint[name]
+        assert np.allclose(a.vertices, b.vertices, rtol=0, atol=1e-8)
+        assert (a.tolerance, a.raster_shape) == (b.tolerance, b.raster_shape)
+
+
+@pytest.mark.parametrize("stream", list(inputs))
+def test_galstreams_cache(stream, tmp_path, monkeypatch):
+    monkeypatch.setenv("CATS_CACHE_DIR", str(tmp_path))
+    pars = inputs[stream]
+    args = (pars["short_name"], pars["pawprint_id"], pars["width"] * u.deg)
+
+    miss = Pawprint.pawprint_from_galstreams(*args)
+    hit = Pawprint.pawprint_from_galstreams(*args)
+
+    assert isinstance(hit.track, StreamTrack)
+    for a, b in zip(track_coordinates(miss), track_coordinates(hit)):
+        assert np.allclose(a, b, rtol=0, atol=1e-8)
+    assert DistanceTrack.from_inputs(stream, hit.track).key is not None
+
+
+@pytest.mark.parametrize("stream", list(inputs))
+def test_galstreams_stream_frame(stream):
+    pars = inputs[stream]
+    pawprint = Pawprint.pawprint_from_galstreams(
+        pars["short_name"], pars["pawprint_id"], pars["width"] * u.deg, cache=False
+    )
+
+    # the track mid-point is near phi1 = 0, as in the galstreams frame in which the
+    # joined catalogs are made
+    mid_point = pawprint.track.mid_point.icrs
+    phi1 = mid_point.transform_to(pawprint.stream_frame).phi1.wrap_at(180 * u.deg)
+    expected = mid_point.transform_to(pawprint.track.stream_frame).phi1
+    assert abs(phi1.degree) < 20
+    assert np.isclose(phi1.degree, expected.wrap_at(180 * u.deg).degree, atol=1e-6)
+
+
+@pytest.mark.parametrize("stream", list(inputs))
+def test_track_footprint_matches_polygon(stream):
+    track6d = get_track6d(stream)
+    width = inputs[stream]["width"] * u.deg
+    track = track6d.track.transform_to(track6d.stream_frame)
+
+    rng = np.random.default_rng(42)
+    n = 200_000
+    phi1 = rng.uniform(track.phi1.degree.min() - 1, track.phi1.degree.max() + 1, n)
+    phi2 = rng.uniform(-5, 8, n)
+    pts = np.stack((phi1, phi2), axis=1)
+
+    for offset in [0.0, 3.0] * u.deg:
+        footprint = TrackFootprint.from_track6d(track6d, width, phi2_offset=offset)
+        polygon = Footprint2D(
+            track6d.create_sky_polygon_footprint_from_track(
+                width=width, phi2_offset=offset
+            ),
+            footprint_type="sky",
+            stream_frame=track6d.stream_frame,
+        )
+        mask = footprint.inside_footprint(pts)
+        assert mask.sum() > 1000
+        assert np.array_equal(mask, polygon.inside_footprint(pts))
+
+        # the mask does not use a polygon, which is not simplified or rasterized
+        state = footprint.state()
+        footprint.simplify(0.5).rasterize((16, 16))
+        assert footprint.state() == state
+        assert np.array_equal(footprint.inside_footprint(pts), mask)
+
+
+@pytest.mark.parametrize("nside", [16, 64, 256])
+def test_inside_footprint_healpix(nside):
+    track = make_track()
+    pawprint = make_pawprint(track, width=2.0)
+    rng = np.random.default_rng(42)
+    angle = np.linspace(0, 2 * np.pi, 200, endpoint=False)
+    r = 1 + rng.uniform(0, 0.5, len(angle))
+    polar = Footprint2D(
+        np.stack((20 * r * np.cos(angle), 75 + 10 * r * np.sin(angle)), axis=1),
+        footprint_type="cartesian",
+    )
+
+    for footprint in [
+        pawprint.skyprint["stream"],
+        pawprint.skyprint["background"],
+        polar,
+    ]:
+        v = footprint.vertices
+        edge = rng.integers(0, len(v), 20_000)
+        t = rng.uniform(size=(len(edge), 1))
+        on_edges = v[edge] + t * (np.roll(v, -1, axis=0)[edge] - v[edge])
+        pts = np.concatenate(
+            (
+                rng.uniform(v.min(axis=0) - 2, v.max(axis=0) + 2, (200_000, 2)),
+                v,
+                on_edges,
+                on_edges + rng.normal(0, 0.01, on_edges.shape),
+            )
+        )
+        pts[:, 1] = np.clip(pts[:, 1], -90, 90)
+        catalog = add_healpix_index(
+            at.Table({"phi1": pts[:, 0], "phi2": pts[:, 1]}), nside=nside
+        )
+        hpx, _ = get_healpix_index(catalog)
+        phi1, phi2 = np.asarray(catalog["phi1"]), np.asarray(catalog["phi2"])
+
+        for tolerance, shape in [(None, None), (0.1, (64, 64))]:
+            footprint.simplify(tolerance).rasterize(shape)
+            mask = footprint.inside_footprint_healpix(phi1, phi2, hpx, nside)
+            assert mask.sum() > 1000
+            assert np.array_equal(
+                mask, footprint.inside_footprint(np.stack((phi1, phi2), axis=1))
+            )